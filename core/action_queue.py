@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA出站操作队列
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# queue优先级队列：https://docs.python.org/zh-cn/3/library/queue.html
+
+import queue
+import threading
+import itertools
+from time import monotonic
+
+from core.log_mgt import Log_Mgt, logger
+from core.chat_mgt import *
+from core.report_mgt import send_report
+from core.rate_limit import Coalescer, RATE_LIMITED
+from core.timer_mgt import Timer_Heap
+from core.metrics import metrics
+
+
+class Action_Queue:
+    '出站操作队列：消息处理线程只负责把操作放入有界优先级队列，由工作线程池调用API，惩罚类操作（撤回/禁言/踢出）优先于提醒和报告，重复的提醒和禁言会合并，网络错误时退避重试'
+    # 操作优先级，数字越小越优先
+    PRIORITY = {
+        del_msg: 0,  # 撤回消息
+        group_ban: 0,  # 禁言成员
+        group_kick: 0,  # 踢出成员
+        group_whole_ban: 1,  # 全体禁言（宵禁）
+        send_msg_group: 2,  # 群聊消息
+        send_tips: 2,  # 群聊提醒
+        send_msg_private: 3,  # 私聊消息
+        send_report: 3,  # 异常聊天报告
+    }
+
+    def __init__(self, max_size: int = 10000, max_retry: int = 3, retry_delay: float = 1, coalescer: Coalescer = None):
+        '创建操作队列：队列最大长度，网络错误时最多重试次数，首次重试等待时间（秒，之后每次翻倍），合并器（None为不合并）'
+        self.queue = queue.PriorityQueue(max_size)
+        self.max_retry = max_retry
+        self.retry_delay = retry_delay
+        self.coalescer = coalescer
+        self.counter = itertools.count()  # 同优先级的操作按放入顺序执行
+        self.workers = []
+        self.later = Timer_Heap()  # 等待放入队列（重试或等待合并）的操作，由调度线程按到期时间（monotonic）放入
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.scheduler = None
+
+    def Apply_Settings(self, changed: dict):
+        '设置热加载：更换提醒合并窗口'
+        if 'tips_window' in changed and self.coalescer is not None:
+            self.coalescer.tips_window = changed['tips_window']
+
+    def Start(self, worker_num: int = 4):
+        '启动工作线程池：工作线程数量'
+        for TEMP0 in range(max(1, int(worker_num))):
+            worker = threading.Thread(target=self.Worker, name='Action_Worker_' + str(TEMP0), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        if self.scheduler is None:
+            self.scheduler = threading.Thread(target=self.Scheduler, name='Action_Scheduler', daemon=True)
+            self.scheduler.start()
+
+    def Put(self, func, *args, priority: int = None) -> bool:
+        '放入一个操作（不阻塞），可以合并的操作会合并到队列中尚未执行的同类操作：chat_mgt中的操作函数，函数参数，优先级（默认按操作类型） 返回：bool，是否放入成功'
+        if priority is None:
+            priority = Action_Queue.PRIORITY.get(func, 2)
+        args = list(args)
+        if self.coalescer is not None:
+            if self.coalescer.Merge(func, args):  # 已合并
+                return True
+            delay = self.coalescer.Delay(func)
+            if delay > 0:  # 等合并窗口结束后再放入队列
+                self.Put_Later(delay, func, args, priority, 0)
+                return True
+        return self.Put_Item(func, args, priority, 0)
+
+    def Put_Item(self, func, args: list, priority: int, retry: int) -> bool:
+        '直接放入队列，队列已满时丢弃并记录日志：操作函数，参数列表，优先级，已重试次数 返回：bool，是否放入成功'
+        try:
+            self.queue.put_nowait((priority, next(self.counter), func, args, retry))
+            return True
+        except queue.Full:
+            if self.coalescer is not None:
+                self.coalescer.Done(func, args)
+            metrics.Inc('qgma_actions_dropped_total', (func.__name__,))
+            logger.error('【队列】出站操作队列已满，丢弃操作：' + func.__name__ + str(args))
+            return False
+
+    def Qsize(self) -> int:
+        '当前队列深度（不含等待重试的操作） 返回：int'
+        return self.queue.qsize()
+
+    def Worker(self):
+        '工作线程：不断取出优先级最高的操作并执行，需要限速的操作延后执行，不在线程中等待'
+        api_no_wait()
+        while True:
+            priority, TEMP0, func, args, retry = self.queue.get()
+            try:
+                if self.coalescer is not None:
+                    self.coalescer.Done(func, args)
+                result = func(*args)
+                if isinstance(result, dict) and result.get('retcode') == RATE_LIMITED:  # 令牌不足，等到有令牌时再放入队列
+                    self.Put_Later(result['wait'], func, args, priority, retry)
+                elif isinstance(result, dict) and result.get('next') is not None:  # 分多次执行的操作（如多页简报），剩下的部分延后放入队列
+                    self.Put_Later(result['wait'], func, result['next'], priority, 0)
+                # 只有网络错误（retcode为-1）才重试，GO-CQHTTP返回的业务错误重试也没有用
+                elif isinstance(result, dict) and result.get('retcode') == -1 and retry < self.max_retry:
+                    metrics.Inc('qgma_actions_retried_total', (func.__name__,))
+                    self.Put_Later(self.retry_delay * 2 ** retry, func, args, priority, retry + 1)
+            except:
+                logger.error(Log_Mgt.Get_Error())
+            finally:
+                self.queue.task_done()
+
+    def Put_Later(self, delay: float, func, args: list, priority: int, retry: int):
+        '等待一段时间后放入队列（由调度线程放入，不单独创建线程）：等待时间（秒），操作函数，参数列表，优先级，已重试次数'
+        deadline = monotonic() + delay
+        with self.lock:
+            TEMP0 = self.later.Next_Deadline()
+            self.later.Add(deadline, next(self.counter), (func, args, priority, retry))
+        if TEMP0 is None or deadline < TEMP0:  # 比调度线程正在等待的时间更早，提前唤醒
+            self.wake.set()
+
+    def Scheduler(self):
+        '调度线程：所有等待重试或等待合并的操作共用一个线程，到期后放入队列'
+        while True:
+            self.wake.clear()
+            with self.lock:
+                due = self.later.Pop_Due(monotonic())
+                deadline = self.later.Next_Deadline()
+            for TEMP0, (func, args, priority, retry) in due:
+                self.Put_Item(func, args, priority, retry)
+            if due == []:
+                self.wake.wait(None if deadline is None else max(0, deadline - monotonic()))
+
+action_queue = Action_Queue(coalescer=Coalescer(tips_window))
+settings_mgt.Watch(action_queue.Apply_Settings)
+metrics.Gauge('qgma_action_queue_size', '出站操作队列深度', action_queue.Qsize)
+metrics.Gauge('qgma_action_retrying', '等待重试或等待合并后放入队列的操作数', lambda: len(action_queue.later))
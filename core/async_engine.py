@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA asyncio运行模式
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# asyncio流：https://docs.python.org/zh-cn/3/library/asyncio-stream.html
+#
+# 事件接收、消息分类、出站操作和定时任务都在同一个事件循环中运行，
+# 群管状态只由事件循环访问，不需要加锁；定时任务直接睡到下一个到期时间，空闲时不占用CPU。
+
+import asyncio
+import functools
+import itertools
+from time import time, perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+from core.log_mgt import Log_Mgt, logger
+from core.settings_load import *
+from core.chat_mgt import route_event, api_no_wait
+from core.action_queue import Action_Queue
+from core.rate_limit import Coalescer, RATE_LIMITED
+from core.moderation import Moderation
+from core.settings_mgt import settings_mgt
+from core.metrics import metrics, Metrics_Mgt
+from core.capture import capture
+from core.ingest import ingest_filter
+
+
+class Async_Engine:
+    'asyncio运行模式：使用Run()启动，阻塞运行直到程序退出'
+
+    def __init__(self, server_addr: str = '0.0.0.0', server_event_port: int = server_rec_port, worker_num: int = 4,
+                 max_size: int = 10000, max_retry: int = 3, retry_delay: float = 1, store=None):
+        '创建引擎：监听ip，监听端口，出站操作并发数，出站队列最大长度，网络错误时最多重试次数，首次重试等待时间（秒，之后每次翻倍），状态保存（State_Store，可选）'
+        self.server_addr = server_addr
+        self.server_event_port = int(server_event_port)
+        self.worker_num = max(1, int(worker_num))
+        self.max_size = max_size
+        self.max_retry = max_retry
+        self.retry_delay = retry_delay
+        self.counter = itertools.count()
+        self.coalescer = Coalescer(tips_window)  # 合并重复的提醒和禁言
+        self.moderation = Moderation(self.Put, store)
+        self.action_queue = None  # 在事件循环中创建
+        self.wake = None  # 有新的定时任务时唤醒计时器
+        metrics.Gauge('qgma_action_queue_size', '出站操作队列深度', self.Qsize)
+
+    def Run(self, on_ready=None):
+        '【线程阻塞】启动事件循环：开始监听后调用的函数（可选）'
+        self.moderation.Start_Members()  # 成员列表在后台线程中获取，不阻塞事件循环
+        asyncio.run(self.Main(on_ready))
+
+    async def Main(self, on_ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.action_queue = asyncio.PriorityQueue(self.max_size)
+        self.wake = asyncio.Event()
+        # API调用仍然使用chat_mgt的连接池，放到线程池中执行，避免阻塞事件循环；需要限速时不在线程中等待，由事件循环延后执行
+        self.executor = ThreadPoolExecutor(self.worker_num, thread_name_prefix='Action_Worker', initializer=api_no_wait)
+        server = await asyncio.start_server(self.Handle_Conn, self.server_addr, self.server_event_port)
+        logger.info('【接收】asyncio模式正在监听 ' + self.server_addr + ':' + str(self.server_event_port))
+        self.servers = []
+        for TEMP0 in backends:  # 多账号：每个账号单独的上报端口
+            self.servers.append(await asyncio.start_server(functools.partial(self.Handle_Conn, self_id=TEMP0[0]), self.server_addr, TEMP0[3]))
+            logger.info('【接收】asyncio模式正在监听 ' + self.server_addr + ':' + str(TEMP0[3]) + '（账号 ' + str(TEMP0[0]) + '）')
+        self.tasks = [asyncio.create_task(self.Action_Worker()) for TEMP0 in range(self.worker_num)]
+        self.tasks.append(asyncio.create_task(self.Timer()))  # 保留引用，避免任务被回收
+        settings_mgt.Watch(self.Settings_Reload)
+        if on_ready is not None:
+            on_ready()
+        async with server:
+            await server.serve_forever()
+
+    def Put(self, func, *args, priority: int = None) -> bool:
+        '放入一个出站操作（不阻塞），供Moderation调用，可以合并的操作会合并到队列中尚未执行的同类操作 返回：bool，是否放入成功'
+        if priority is None:
+            priority = Action_Queue.PRIORITY.get(func, 2)
+        args = list(args)
+        if self.coalescer.Merge(func, args):  # 已合并
+            return True
+        delay = self.coalescer.Delay(func)
+        if delay > 0:  # 等合并窗口结束后再放入队列
+            self.loop.call_later(delay, self.Put_Item, func, args, priority, 0)
+            return True
+        return self.Put_Item(func, args, priority, 0)
+
+    def Put_Item(self, func, args: list, priority: int, retry: int) -> bool:
+        '直接放入出站队列：操作函数，参数列表，优先级，已重试次数 返回：bool，是否放入成功'
+        try:
+            self.action_queue.put_nowait((priority, next(self.counter), func, args, retry))
+            return True
+        except asyncio.QueueFull:
+            self.coalescer.Done(func, args)
+            metrics.Inc('qgma_actions_dropped_total', (func.__name__,))
+            logger.error('【队列】出站操作队列已满，丢弃操作：' + func.__name__ + str(args))
+            return False
+
+    def Settings_Reload(self, changed: dict):
+        '设置热加载（在设置检查线程中调用）：在线程中重建关键词自动机等对象，再交给事件循环一次性应用'
+        built = self.moderation.Build_Settings(changed)
+        self.loop.call_soon_threadsafe(self.Apply_Settings, changed, built)
+
+    def Apply_Settings(self, changed: dict, built: dict):
+        '在事件循环中应用改变的设置，与事件处理互斥'
+        self.moderation.Apply_Settings(changed, built)
+        if 'tips_window' in changed:
+            self.coalescer.tips_window = changed['tips_window']
+        self.wake.set()  # 宵禁时间等可能改变，重新计算下次定时任务
+
+    def Qsize(self) -> int:
+        '当前出站队列深度 返回：int'
+        return self.action_queue.qsize() if self.action_queue is not None else 0
+
+    async def Action_Worker(self):
+        '出站操作协程：按优先级取出操作并执行，网络错误时退避重试'
+        while True:
+            priority, TEMP0, func, args, retry = await self.action_queue.get()
+            try:
+                self.coalescer.Done(func, args)
+                result = await self.loop.run_in_executor(self.executor, func, *args)
+                if isinstance(result, dict) and result.get('retcode') == RATE_LIMITED:  # 令牌不足，等到有令牌时再放入队列
+                    self.loop.call_later(result['wait'], self.Put_Item, func, args, priority, retry)
+                elif isinstance(result, dict) and result.get('next') is not None:  # 分多次执行的操作（如多页简报），剩下的部分延后放入队列
+                    self.loop.call_later(result['wait'], self.Put_Item, func, result['next'], priority, 0)
+                elif isinstance(result, dict) and result.get('retcode') == -1 and retry < self.max_retry:
+                    metrics.Inc('qgma_actions_retried_total', (func.__name__,))
+                    self.loop.call_later(self.retry_delay * 2 ** retry,
+                                         self.Put_Item, func, args, priority, retry + 1)
+            except:
+                logger.error(Log_Mgt.Get_Error())
+            finally:
+                self.action_queue.task_done()
+
+    async def Timer(self):
+        '定时任务协程：睡到下一个到期时间，或被新事件唤醒后重新计算'
+        while True:
+            deadline = self.moderation.Next_Deadline()
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(0, deadline - (time() + int(self.moderation.time_difference or 0)))
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                self.moderation.Handle_Task()
+            except:
+                logger.critical(Log_Mgt.Get_Error())
+
+    async def Handle_Conn(self, reader, writer, self_id=None):
+        '处理一个上报连接：按Content-Length读取请求体，支持HTTP/1.1长连接，self_id为该端口所属的机器人QQ号（多账号时使用）'
+        try:
+            while True:
+                try:
+                    header = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = header.decode('latin-1').split('\r\n')
+                headers = {}
+                for TEMP0 in lines[1:]:
+                    if ':' in TEMP0:
+                        TEMP1, TEMP2 = TEMP0.split(':', 1)
+                        headers[TEMP1.strip().lower()] = TEMP2.strip()
+                length = int(headers.get('content-length', 0))
+                if length < 0 or length > 1024 * 1024:  # 数据长度不合法或过长（大于1MB）
+                    writer.write(b'HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length)
+                keep_alive = lines[0].endswith('HTTP/1.1') and headers.get('connection', '').lower() != 'close'
+                writer.write(b'HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n' +
+                             (b'\r\n' if keep_alive else b'Connection: close\r\n\r\n'))
+                await writer.drain()
+                self.Handle_Body(body, self_id)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def Handle_Body(self, body: bytes, self_id=None):
+        '解析上报的事件并交给群管流程'
+        recv_time = perf_counter()
+        capture.Write(body)  # 启用了录制时保存原始事件，用于离线重放
+        try:
+            rev = ingest_filter.Decode(body)  # 多余的心跳和不在管理范围内的群聊事件不解析，直接丢弃
+        except ValueError:
+            logger.warning('【接收】无法解析的上报数据：' + body[:200].decode('utf-8', 'replace'))
+            return
+        if rev is None:
+            return
+        rev['_recv_time'] = recv_time
+        metrics.Inc('qgma_events_received_total', Metrics_Mgt.Event_Labels(rev))
+        if self_id is not None:  # 多账号：补上事件所属的账号
+            rev.setdefault('self_id', self_id)
+        if not route_event(rev):  # 多账号时丢弃其他账号收到的同一群聊的重复事件
+            return
+        try:
+            self.moderation.Handle_Event(rev)
+        except:
+            logger.error(Log_Mgt.Get_Error())
+        self.wake.set()  # 可能新增了定时任务，唤醒计时器重新计算
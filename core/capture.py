@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA上报事件录制模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 把收到的上报事件原样写入文件（每行一个json，文件名以.gz结尾时gzip压缩），
+# 写入在后台线程中批量进行，不阻塞事件接收；录下的文件可以用 replay.py 离线重放。
+
+import os
+import gzip
+import queue
+import atexit
+import threading
+
+from core.log_mgt import Log_Mgt, logger
+
+
+class Event_Capture:
+    '上报事件录制：Write()只把请求体放入队列，由后台线程批量写入文件，请使用已实例化的‘capture’对象'
+
+    def __init__(self, batch_size: int = 1024):
+        '创建录制：每次最多批量写入的事件数'
+        self.batch_size = batch_size
+        self.file = None  # 当前录制文件，None为未录制
+        self.file_path = ''
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def Open(self, file_path: str):
+        '开始录制到指定文件（追加写入），空字符串为停止录制：文件路径'
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.file_path = file_path
+            if file_path == '':
+                return
+            if os.path.dirname(file_path) != '':
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            self.file = gzip.open(file_path, 'ab') if file_path.endswith('.gz') else open(file_path, 'ab')
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.Run, name='Event_Capture', daemon=True)
+            self.thread.start()
+            atexit.register(self.Close)
+        logger.info('【录制】正在把上报事件录制到 ' + file_path)
+
+    def Write(self, body: bytes):
+        '录制一个事件的请求体（未录制时忽略）：json请求体'
+        if self.file is not None:
+            # json中的换行只可能是格式化用的空白（字符串内的换行已转义），去掉后每个事件正好一行
+            self.queue.put(body.replace(b'\r', b'').replace(b'\n', b''))
+
+    def Write_Batch(self, batch: list):
+        '写入一批请求体'
+        with self.lock:
+            if self.file is not None:
+                self.file.write(b'\n'.join(batch) + b'\n')
+                self.file.flush()
+
+    def Run(self):
+        '写入线程：取出队列中的全部事件（最多batch_size个）后一次写入'
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self.Write_Batch(batch)
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+    def Close(self):
+        '写入队列中剩余的事件并关闭文件（程序退出时自动调用）'
+        batch = []
+        try:
+            while True:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if batch != []:
+            self.Write_Batch(batch)
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def Apply_Settings(self, changed: dict):
+        '设置热加载：开始、停止或更换录制文件'
+        if 'capture_file' in changed:
+            self.Open(changed['capture_file'])
+            if changed['capture_file'] == '':
+                logger.info('【录制】已停止录制上报事件')
+
+
+capture = Event_Capture()
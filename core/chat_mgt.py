@@ -1,82 +1,259 @@
-import socket
-from urllib import parse
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA消息发送及群聊管理模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# GO-CQHTTP API文档：https://docs.go-cqhttp.org/api
+# http.client长连接：https://docs.python.org/zh-cn/3/library/http.client.html
 
+import json
+import queue
+import threading
+import http.client
+from time import perf_counter
+
+from core.log_mgt import logger
+from core.metrics import metrics
 from core.settings_load import *
+from core.rate_limit import *
+from core.settings_mgt import settings_mgt
+
+
+class Http_Pool:
+    'GO-CQHTTP API连接池：复用HTTP/1.1长连接调用API并解析返回的json，可多线程同时使用，请使用已实例化的‘api_pool’对象'
+
+    def __init__(self, host: str, port: int, max_idle: int = 8, timeout: float = 10, rate_limit: Rate_Limit = None):
+        '创建连接池：服务器IP，服务器API端口，最多保留的空闲连接数，单次请求超时时间（秒），限速器（None为不限速）'
+        self.host = host
+        self.rate_limit = rate_limit
+        self.port = port
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle_conn = queue.LifoQueue()  # 空闲连接（后进先出，优先复用最近用过的连接）
+
+    def Get_Conn(self):
+        '取出一个空闲连接，没有则新建 返回：(HTTPConnection, 是否为复用的连接)'
+        try:
+            return self.idle_conn.get_nowait(), True
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def Put_Conn(self, conn):
+        '归还连接，空闲连接过多时直接关闭'
+        if self.idle_conn.qsize() < self.max_idle:
+            self.idle_conn.put(conn)
+        else:
+            conn.close()
+
+    def Call_Api(self, action: str, params: dict = {}) -> dict:
+        '调用API并记录调用次数、结果和耗时 返回：dict，同Request()'
+        start = perf_counter()
+        result = self.Request(action, params)
+        if result.get('retcode') == RATE_LIMITED:  # 没有实际调用
+            metrics.Inc('qgma_actions_limited_total', (action,))
+            return result
+        metrics.Observe('qgma_action_seconds', (action,), perf_counter() - start)
+        metrics.Inc('qgma_actions_total', (action, 'ok' if result.get('status') in ('ok', 'async') else 'failed'))
+        return result
+
+    def Request(self, action: str, params: dict = {}) -> dict:
+        '调用API（POST json），先按接口和群聊限速（当前线程调用过api_no_wait()时不等待，返回retcode为RATE_LIMITED的结果），复用的连接已被服务器断开时自动换新连接重试一次 返回：dict，GO-CQHTTP返回的json，网络错误时为 {"status": "failed", "retcode": -1, "wording": 错误信息}'
+        if self.rate_limit is not None:
+            TEMP0 = getattr(api_local, 'no_wait', False)
+            wait = self.rate_limit.Acquire(action, params.get('group_id'), not TEMP0)
+            if TEMP0 and wait > 0:  # 出站操作工作线程不等待令牌，由出站操作队列延后执行
+                return {'status': 'failed', 'retcode': RATE_LIMITED, 'wording': 'rate limited', 'wait': wait}
+        body = json.dumps(params, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        for TEMP0 in range(2):
+            conn, reused = self.Get_Conn()
+            try:
+                conn.request('POST', '/' + action, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if reused:  # 空闲太久的长连接可能已被服务器关闭，换新连接重试
+                    continue
+                return {'status': 'failed', 'retcode': -1, 'wording': repr(e)}
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                return {'status': 'failed', 'retcode': -1, 'wording': repr(e)}
+            if response.will_close:  # 服务器要求关闭连接
+                conn.close()
+            else:
+                self.Put_Conn(conn)
+            try:
+                return json.loads(data)
+            except ValueError:
+                return {'status': 'failed', 'retcode': response.status, 'wording': data[:200].decode('utf-8', 'replace')}
+        return {'status': 'failed', 'retcode': -1, 'wording': 'connection closed'}
+
+    def Apply_Settings(self, changed: dict):
+        '设置热加载：更换接口限速设置'
+        if 'rate_limit_conf' in changed and self.rate_limit is not None:
+            self.rate_limit.Reload(changed['rate_limit_conf'])
+
+    def Close(self):
+        '关闭所有空闲连接'
+        while True:
+            try:
+                self.idle_conn.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+api_pool = Http_Pool(server_ip, server_send_port, rate_limit=Rate_Limit(rate_limit_conf))
+settings_mgt.Watch(api_pool.Apply_Settings)
+api_local = threading.local()  # 出站操作工作线程的设置（见api_no_wait()）
+api_pools = {}  # 多账号 {机器人QQ号: Http_Pool}，每个账号的连接和限速各自独立
+group_owner = {}  # 多账号 {群号: 机器人QQ号}，同一群聊由最先收到其事件的账号负责
+group_failed = {}  # 多账号 {群号: 负责的账号连续调用失败的次数}
+OWNER_MAX_FAILED = 3  # 负责的账号对同一群聊连续调用失败这么多次后不再负责，由下一个收到该群聊事件的账号接手
+owner_lock = threading.Lock()
+
+
+def add_backend(self_id, host, port):  # 注册一个账号的API连接池【机器人QQ号，GO-CQHTTP的IP，API端口】
+    api_pools[int(self_id)] = Http_Pool(host, port, rate_limit=Rate_Limit(rate_limit_conf))
+    settings_mgt.Watch(api_pools[int(self_id)].Apply_Settings)
+
+
+def get_pool(group_id=None, self_id=None):  # 取出负责该账号或该群聊的连接池，未知时使用默认账号【群号，机器人QQ号】
+    if self_id is None and group_id is not None:
+        self_id = group_owner.get(int(group_id))
+    if self_id is None:
+        return api_pool
+    return api_pools.get(int(self_id), api_pool)
+
+
+def route_event(rev: dict) -> bool:  # 记录群聊由哪个账号负责，其他账号收到的同一群聊的重复事件返回False【事件】
+    if api_pools == {} or rev.get('self_id') is None or rev.get('group_id') is None:  # 只有一个账号
+        return True
+    group_id = int(rev['group_id'])
+    self_id = int(rev['self_id'])
+    with owner_lock:
+        if rev.get('notice_type') == 'group_decrease' and rev.get('sub_type') == 'kick_me':  # 账号被踢出群聊，不再负责，其他账号可以接手
+            if group_owner.get(group_id) != self_id:
+                return False
+            del group_owner[group_id]
+            group_failed.pop(group_id, None)
+            logger.info('【多账号】账号：%s 已被踢出群聊：%s，不再负责该群聊', self_id, group_id)
+            return True
+        return group_owner.setdefault(group_id, self_id) == self_id
 
 
-def send_msg_private(user_id, msg):  # 发送消息【对方QQ号），消息内容】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    # 将字符中的特殊字符进行url编码
-    # msg = msg.replace(" ", "%20") #已弃用
-    # msg = msg.replace("\n", "%0a") #已弃用
-    msg = parse.quote(msg, safe='')
-    payload = "GET /send_private_msg?user_id=" + str(user_id) + "&message=" + msg + " HTTP/1.1\r\nHost:" + str(
-        server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【私聊】" + str(user_id), "发送：\n" + parse.unquote(msg))
-    server_client.close()
-    return 0
+def owner_result(group_id, result: dict):  # 多账号：记录负责该群聊的账号调用API的结果，连续失败多次后不再负责（限速延后执行的不记录）【群号，API返回的json】
+    if api_pools == {} or result.get('retcode') == RATE_LIMITED:
+        return
+    group_id = int(group_id)
+    with owner_lock:
+        if group_id not in group_owner:
+            return
+        if api_ok(result):
+            group_failed.pop(group_id, None)
+            return
+        group_failed[group_id] = group_failed.get(group_id, 0) + 1
+        if group_failed[group_id] >= OWNER_MAX_FAILED:
+            logger.warning('【多账号】账号：%s 对群聊：%s 连续调用失败%s次，不再负责该群聊', group_owner.pop(group_id), group_id, group_failed.pop(group_id))
+
+
+if backends != []:  # 多账号：设置中的账号也加入，API调用按群聊或账号选择连接池
+    if bot_user_id != '':
+        api_pools[int(bot_user_id)] = api_pool
+    for TEMP0 in backends:
+        add_backend(TEMP0[0], TEMP0[1], TEMP0[2])
+
+
+def apply_settings(changed):  # 设置热加载：多账号时更换默认账号的QQ号【改变的设置】
+    if 'bot_user_id' in changed and backends != []:
+        for TEMP0 in [TEMP1 for TEMP1, TEMP2 in api_pools.items() if TEMP2 is api_pool]:
+            del api_pools[TEMP0]
+        if changed['bot_user_id'] != '':
+            api_pools.setdefault(int(changed['bot_user_id']), api_pool)
+
+
+settings_mgt.Watch(apply_settings)
+
+
+def api_no_wait():  # 当前线程（出站操作工作线程）调用API需要限速时不等待，直接返回需要等待的时间，由出站操作队列延后执行
+    api_local.no_wait = True
+
+
+def api_ok(result: dict) -> bool:  # 判断API是否调用成功【API返回的json】
+    return result.get('status') in ('ok', 'async')
+
+
+def api_failed(action, result):  # 记录API调用失败（限速延后执行的不记录）【API名称，API返回的json】
+    if result.get('retcode') == RATE_LIMITED:
+        return
+    logger.warning('【接口】' + action + ' 调用失败：' + str(result.get('retcode')) + ' ' + str(result.get('wording', result.get('msg', ''))))
+
+
+def send_msg_private(user_id, msg, self_id=None):  # 发送消息【对方QQ号，消息内容，使用的机器人QQ号（默认账号）】
+    result = get_pool(self_id=self_id).Call_Api('send_private_msg', {'user_id': int(user_id), 'message': str(msg)})
+    if api_ok(result):
+        logger.info('【私聊】%s 发送：\n%s', user_id, msg)
+    else:
+        api_failed('send_private_msg', result)
+    return result
 
 
 def send_msg_group(group_id, msg):  # 发送消息【对方群号，消息内容】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    # 将字符中的特殊字符进行url编码
-    # msg = msg.replace(" ", "%20") #已弃用
-    # msg = msg.replace("\n", "%0a") #已弃用
-    msg = parse.quote(msg, safe='')
-    payload = "GET /send_group_msg?group_id=" + str(group_id) + "&message=" + msg + " HTTP/1.1\r\nHost:" + str(
-        server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【群聊】" + str(group_id), "发送：\n" + parse.unquote(msg))
-    server_client.close()
-    return 0
-
-
-def del_msg(msg_id):  # 撤回消息【消息ID】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    payload = "GET /delete_msg?message_id=" + str(msg_id) + " HTTP/1.1\r\nHost:" + str(
-        server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【撤回】" + str(msg_id))
-    server_client.close()
-    return 0
+    result = get_pool(group_id).Call_Api('send_group_msg', {'group_id': int(group_id), 'message': str(msg)})
+    owner_result(group_id, result)
+    if api_ok(result):
+        logger.info('【群聊】%s 发送：\n%s', group_id, msg)
+    else:
+        api_failed('send_group_msg', result)
+    return result
+
+
+def send_tips(group_id, user_ids, tips):  # 发送提醒，艾特多个成员【群号，QQ号列表，提醒内容列表】
+    return send_msg_group(group_id, ''.join("[CQ:at,qq=" + str(TEMP0) + "]" for TEMP0 in user_ids) + '\n'.join(tips))
+
+
+def del_msg(msg_id, self_id=None):  # 撤回消息【消息ID，收到该消息的机器人QQ号（默认账号）】
+    result = get_pool(self_id=self_id).Call_Api('delete_msg', {'message_id': int(msg_id)})
+    if api_ok(result):
+        logger.info('【撤回】%s', msg_id)
+    else:
+        api_failed('delete_msg', result)
+    return result
 
 
 def group_kick(group_id, user_id, reject_add_request='false'):  # 踢出成员【群号，QQ号，屏蔽加群申请】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    payload = "GET /set_group_kick?group_id=" + str(group_id) + "&user_id=" + str(user_id) + "&reject_add_request=" + str(
-        reject_add_request) + " HTTP/1.1\r\nHost:" + str(server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【提示】群聊：" + str(group_id) + " 中，已踢出",
-          str(user_id) + "，屏蔽加群申请：" + reject_add_request)
-    server_client.close()
-    return 0
+    result = get_pool(group_id).Call_Api('set_group_kick', {'group_id': int(group_id), 'user_id': int(user_id),
+                                                          'reject_add_request': str(reject_add_request) == 'true'})
+    owner_result(group_id, result)
+    if api_ok(result):
+        logger.info('【提示】群聊：%s 中，已踢出 %s，屏蔽加群申请：%s', group_id, user_id, reject_add_request)
+    else:
+        api_failed('set_group_kick', result)
+    return result
 
 
 def group_ban(group_id, user_id, duration=1):  # 禁言成员【群号，QQ号，禁言时长，单位：分】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    payload = "GET /set_group_ban?group_id=" + str(group_id) + "&user_id=" + str(user_id) + "&duration=" + str(
-        int(duration)*60) + " HTTP/1.1\r\nHost:" + str(server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【提示】群聊：" + str(group_id) + " 中，已禁言 " + str(user_id), duration, "分钟")
-    server_client.close()
-    return 0
+    result = get_pool(group_id).Call_Api('set_group_ban', {'group_id': int(group_id), 'user_id': int(user_id),
+                                                         'duration': int(duration)*60})
+    owner_result(group_id, result)
+    if api_ok(result):
+        logger.info('【提示】群聊：%s 中，已禁言 %s %s 分钟', group_id, user_id, duration)
+    else:
+        api_failed('set_group_ban', result)
+    return result
 
 
 def group_whole_ban(group_id, enable='false'):  # 全体禁言【群号，是否启用(true/false】
-    server_client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_client.connect((server_ip, server_send_port))
-    payload = "GET /set_group_whole_ban?group_id=" + str(group_id) + "&enable=" + str(
-        enable) + " HTTP/1.1\r\nHost:" + str(server_ip) + ":" + str(server_send_port) + "\r\nConnection: close\r\n\r\n"
-    server_client.send(payload.encode("utf-8"))
-    print("【提示】群聊：" + str(group_id) + " 中，全体禁言已设为 " + str(enable))
-    server_client.close()
-    return 0
+    result = get_pool(group_id).Call_Api('set_group_whole_ban', {'group_id': int(group_id), 'enable': str(enable) == 'true'})
+    owner_result(group_id, result)
+    if api_ok(result):
+        logger.info('【提示】群聊：%s 中，全体禁言已设为 %s', group_id, enable)
+    else:
+        api_failed('set_group_whole_ban', result)
+    return result
 
 
 '''示例
@@ -89,6 +266,7 @@ https://github.com/kyubotics/coolq-http-api/wiki/%E8%A1%A8%E6%83%85-CQ-%E7%A0%81
 语音[CQ:record,file=http://xxxx.com/1.mp3]艾特[CQ:at,qq=user_id]踢了踢[CQ:poke,qq={}]
 链接分享[CQ:share,url=http://baidu.com,title=百度]
 del_msg(msg_id) # 撤回消息【消息ID】
+所有函数均返回GO-CQHTTP的json，可用api_ok(result)判断是否成功
 group_kick(group_id, user_id, false)  # 踢出成员【群号，QQ号，屏蔽加群申请】
 group_ban(group_id, user_id, 1)  # 禁言成员【群号，QQ号，禁言时长，单位：分】
 '''
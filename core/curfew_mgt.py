@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA宵禁调度模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 每个群聊可以有不同的宵禁时间：预先算出每个群聊下次开始或结束宵禁的时间放入定时任务堆，
+# 平时只需查看堆顶，到时间才计算该群聊应处的状态；同一时刻切换的群聊一次全部交给出站操作队列并发执行。
+
+from datetime import datetime, timedelta
+from time import localtime
+
+from core.timer_mgt import Timer_Heap
+
+
+class Curfew_Mgt:
+    '宵禁调度：Set_Windows()设置各群聊的宵禁时间，Pop_Due()取出到时间需要切换状态的群聊，Next_Deadline()给出下次需要检查的时间'
+
+    def __init__(self):
+        self.windows = {}  # 各群聊的宵禁时间 {群号(str): (开始时间, 结束时间)}
+        self.state = {}  # 已下发的宵禁状态 {群号(str): 1（宵禁中） / 0}
+        self.timers = Timer_Heap()  # 各群聊下次需要检查的时间，key为群号
+
+    def Curfew_Time(curfew_time: list) -> list:
+        '整理宵禁时间设置：统一为4位的HHMM字符串，24xx的时间转化为00xx（如2430转为0030） 返回：list'
+        curfew_time = list(curfew_time)
+        if len(curfew_time) == 2:
+            curfew_time = ['%04d' % (int(TEMP0) % 2400) for TEMP0 in curfew_time]
+        return curfew_time
+
+    def Windows(curfew_time: list, group_curfew: dict, group_manage: list) -> dict:
+        '生成管理的各群聊的宵禁时间：默认宵禁时间（curfew_time），单独设置的宵禁时间（group_curfew，{群号: [开始时间, 结束时间] / []（不宵禁）}），管理的群聊 返回：dict，{群号: (开始时间, 结束时间)}'
+        windows = {}
+        for TEMP0 in group_manage:
+            TEMP1 = Curfew_Mgt.Curfew_Time(group_curfew.get(TEMP0, curfew_time))
+            if len(TEMP1) == 2:
+                windows[TEMP0] = tuple(TEMP1)
+        return windows
+
+    def Should_Be(window: tuple, now: int) -> int:
+        '根据宵禁时间（Curfew_Time()整理后的HHMM）判断某一时刻是否应处于宵禁状态 返回：int（1为宵禁）'
+        now_hm = int('%02d%02d' % localtime(now)[3:5])
+        # 如果设置的开始时间小于结束时间（如16:00-17:00），即禁言1小时
+        if int(window[0]) <= int(window[1]):
+            return int(int(window[0]) <= now_hm <= int(window[1]))
+        # 如果设置的开始时间大于结束时间（如17:00-16:00），即禁言23小时
+        return int(int(window[0]) <= now_hm or now_hm <= int(window[1]))
+
+    def Next_Change(window: tuple, now: int) -> int:
+        '计算宵禁状态下次可能变化的时间（开始时间或结束时间的下一分钟），宵禁时间为Curfew_Time()整理后的HHMM 返回：int'
+        base = datetime.fromtimestamp(now).replace(second=0, microsecond=0)
+        next_time = None
+        for TEMP0 in (0, 1):  # 今天和明天
+            day = base + timedelta(days=TEMP0)
+            for hm, offset in ((window[0], 0), (window[1], 1)):
+                TEMP1 = day.replace(hour=int(hm[:2]), minute=int(hm[2:])) + timedelta(minutes=offset)
+                TEMP1 = int(TEMP1.timestamp())
+                if TEMP1 > now and (next_time is None or TEMP1 < next_time):
+                    next_time = TEMP1
+        return next_time
+
+    def Set_Windows(self, windows: dict, now: int = None):
+        '更换各群聊的宵禁时间：新的宵禁时间，当前服务器时间（时差已校准时提供，所有群聊立即重新检查一次）'
+        self.windows = windows
+        self.timers = Timer_Heap()
+        if now is not None:
+            self.Schedule_All(now)
+
+    def Schedule_All(self, now: int):
+        '所有群聊（包括不再宵禁但仍处于宵禁状态的群聊）立即检查一次：当前服务器时间'
+        for TEMP0 in set(self.windows) | {TEMP1 for TEMP1, TEMP2 in self.state.items() if TEMP2 == 1}:
+            self.timers.Add(now, TEMP0)
+
+    def Pop_Due(self, now: int) -> list:
+        '取出到时间的群聊，计算应处的状态并安排下次检查 返回：list，状态需要改变的 [(群号, 新状态), ...]'
+        changes = []
+        for TEMP0, TEMP1 in self.timers.Pop_Due(now):
+            window = self.windows.get(TEMP0)
+            TEMP2 = Curfew_Mgt.Should_Be(window, now) if window is not None else 0  # 已取消宵禁的群聊解除全体禁言
+            if TEMP2 != self.state.get(TEMP0, 0):
+                self.state[TEMP0] = TEMP2
+                changes.append((TEMP0, TEMP2))
+            if window is not None:
+                self.timers.Add(Curfew_Mgt.Next_Change(window, now), TEMP0)
+        return changes
+
+    def Next_Deadline(self):
+        '下次需要检查的服务器时间，没有宵禁则为None 返回：int / None'
+        return self.timers.Next_Deadline()
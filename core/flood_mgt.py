@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA刷屏检测模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# Count-Min Sketch：http://dimacs.rutgers.edu/~graham/pubs/papers/cm-full.pdf
+#
+# 统计每个成员（群号, QQ号）最近一段时间内的发言数：时间窗口分为若干个时间段，每段是一个Count-Min Sketch（固定大小的计数数组），
+# 过期的时间段直接清零重用，无论有多少成员发言，占用的内存都不变；估计值只会偏大不会偏小，数组足够大时偏差可以忽略。
+
+from array import array
+
+
+class Flood_Window:
+    '单个刷屏规则：seconds秒内发言超过limit条即为刷屏，Hit()记录一条发言并判断是否需要记一次犯错（持续刷屏时每个时间窗口记1次）'
+
+    def __init__(self, limit: int, seconds: int, depth: int = 4, width: int = 4096, slots: int = 8):
+        '创建规则：允许的发言数，时间窗口（秒），Count-Min Sketch的行数，每行的计数器数，时间窗口分成的时间段数'
+        self.limit = max(1, int(limit))
+        self.seconds = max(1, int(seconds))
+        self.depth = depth
+        self.width = width
+        self.slots = min(slots, self.seconds)
+        self.slot_len = -(-self.seconds // self.slots)  # 每个时间段的长度（秒，向上取整）
+        self.counts = [array('I', bytes(4 * depth * width)) for TEMP0 in range(self.slots)]  # 每个时间段一个计数数组（depth行依次排列）
+        self.epochs = [None] * self.slots  # 每个时间段当前对应的时间编号，编号过期的时间段清零后重用
+        self.zero = array('I', bytes(4 * depth * width))
+        self.last_fault = array('q', [-1 << 62]) * (depth * width)  # 上次记犯错的时间编号（同一位置取最近的，各行取最小值即为估计值）
+
+    def Memory(self) -> int:
+        '计数数组占用的字节数（固定） 返回：int'
+        return self.slots * self.depth * self.width * 4 + self.depth * self.width * 8
+
+    def Hit(self, group_id, user_id, now: int) -> int:
+        '记录一条发言：群号，QQ号，消息时间 返回：int，需要记的犯错次数（超过限制且一个时间窗口内没有记过时为1，否则为0）'
+        epoch = int(now) // self.slot_len
+        slot = epoch % self.slots
+        if self.epochs[slot] != epoch:  # 时间段已过期，清零重用
+            self.counts[slot][:] = self.zero
+            self.epochs[slot] = epoch
+        width = self.width
+        index = [TEMP0 * width + hash((TEMP0, group_id, user_id)) % width for TEMP0 in range(self.depth)]  # 每行一个位置（整数的hash不随进程变化）
+        counts = self.counts[slot]
+        for TEMP0 in index:
+            counts[TEMP0] += 1
+        # 每行把窗口内各时间段的计数相加，取各行的最小值作为估计值
+        estimate = None
+        for TEMP0 in index:
+            TEMP1 = 0
+            for TEMP2 in range(self.slots):
+                if self.epochs[TEMP2] is not None and epoch - self.epochs[TEMP2] < self.slots:
+                    TEMP1 += self.counts[TEMP2][TEMP0]
+            if estimate is None or TEMP1 < estimate:
+                estimate = TEMP1
+        if estimate <= self.limit or epoch - min(self.last_fault[TEMP0] for TEMP0 in index) < self.slots:
+            return 0
+        for TEMP0 in index:
+            self.last_fault[TEMP0] = epoch
+        return 1
+
+
+class Flood_Mgt:
+    '刷屏检测：可以同时使用多个规则（如5秒10条、60秒30条），Hit()返回本条发言需要记的犯错次数'
+
+    def __init__(self, flood_limit: list):
+        '创建刷屏检测：规则列表 [(允许的发言数, 时间窗口（秒）), ...]'
+        self.windows = [Flood_Window(TEMP0, TEMP1) for TEMP0, TEMP1 in flood_limit]
+
+    def Memory(self) -> int:
+        '所有规则占用的字节数（固定） 返回：int'
+        return sum(TEMP0.Memory() for TEMP0 in self.windows)
+
+    def Hit(self, group_id, user_id, now: int) -> int:
+        '记录一条发言：群号，QQ号，消息时间 返回：int，需要记的犯错次数（多个规则同时触发也只记1次）'
+        fault = 0
+        for TEMP0 in self.windows:
+            fault |= TEMP0.Hit(group_id, user_id, now)
+        return fault
+
+
+if __name__ == '__main__':  # 代码测试
+    import time
+    flood = Flood_Mgt([(10, 5), (30, 60)])
+    print('占用内存:', flood.Memory() // 1024, 'KB')
+    print('刷屏:', [flood.Hit(1, 2, 1000 + TEMP0 // 4) for TEMP0 in range(80)])
+    print('正常:', sum(flood.Hit(1, 3 + TEMP0, 1000 + TEMP0 // 100) for TEMP0 in range(100000)), '次误判')
+    time_start = time.perf_counter()
+    for TEMP0 in range(100000):
+        flood.Hit(1, TEMP0, 2000)
+    print((time.perf_counter() - time_start) / 100000 * 1e6, 'us')
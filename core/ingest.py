@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA事件预筛选模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# orjson：https://github.com/ijl/orjson
+#
+# 完整解析json之前，先在请求体中直接查找post_type、meta_event_type和group_id：
+# 频繁的心跳只保留用于校准时差的少量几个，不在管理范围内的群聊事件直接丢弃，都不需要解析json。
+# 安装了orjson时使用orjson解析，否则使用标准库json。
+
+import re
+import json
+from time import monotonic
+
+from core.settings_load import *
+from core.settings_mgt import settings_mgt
+from core.metrics import metrics
+
+try:
+    import orjson  # 可选，解析速度更快（解析失败时抛出的异常同样是ValueError）
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# 字符串内的引号都会转义为\"，所以 "键": 的形式只会出现在键名处
+POST_TYPE = re.compile(rb'"post_type"\s*:\s*"([a-z_]+)"')
+META_EVENT_TYPE = re.compile(rb'"meta_event_type"\s*:\s*"([a-z_]+)"')
+GROUP_ID = re.compile(rb'"group_id"\s*:\s*"?(\d+)')
+
+
+class Ingest_Filter:
+    '事件预筛选：Decode()先用正则表达式判断是否需要处理，需要时才完整解析json，请使用已实例化的‘ingest_filter’对象'
+    heartbeat_interval = 60  # 每隔多少秒保留一个心跳（用于校准时差、唤醒各工作进程），其余的直接丢弃
+
+    def __init__(self, group_manage: list):
+        '创建预筛选：管理的群号列表'
+        self.managed = Ingest_Filter.Group_Set(group_manage)
+        self.last_heartbeat = None
+
+    def Group_Set(group_manage: list) -> set:
+        '群号列表转化为集合（bytes，直接与请求体中的群号比较） 返回：set'
+        return {str(TEMP0).strip().encode() for TEMP0 in group_manage}
+
+    def Apply_Settings(self, changed: dict):
+        '设置热加载：更换管理的群聊'
+        if 'group_manage' in changed:
+            self.managed = Ingest_Filter.Group_Set(changed['group_manage'])
+
+    def Drop_Reason(self, body: bytes):
+        '不解析json，判断事件是否可以直接丢弃 返回：str，丢弃的原因 / None，需要处理'
+        TEMP0 = POST_TYPE.search(body)
+        if TEMP0 is None:
+            return None
+        post_type = TEMP0.group(1)
+        if post_type == b'meta_event':
+            TEMP1 = META_EVENT_TYPE.search(body)
+            if TEMP1 is not None and TEMP1.group(1) == b'heartbeat':
+                now = monotonic()
+                if self.last_heartbeat is not None and now - self.last_heartbeat < Ingest_Filter.heartbeat_interval:
+                    return 'heartbeat'
+                self.last_heartbeat = now
+            return None
+        # 群聊消息、通知及请求：请求体中的群号都不在管理范围内才丢弃
+        TEMP1 = GROUP_ID.findall(body)
+        if TEMP1 != [] and self.managed.isdisjoint(TEMP1):
+            return 'unmanaged_group'
+        return None
+
+    def Decode(self, body: bytes):
+        '预筛选后解析事件 返回：dict / None（已丢弃或不是事件） 异常：无法解析时抛出ValueError'
+        TEMP0 = self.Drop_Reason(body)
+        if TEMP0 is not None:
+            metrics.Inc('qgma_events_dropped_total', (TEMP0,))
+            return None
+        rev = json_loads(body)
+        return rev if isinstance(rev, dict) else None
+
+
+ingest_filter = Ingest_Filter(group_manage)
+settings_mgt.Watch(ingest_filter.Apply_Settings)
@@ -9,12 +9,16 @@
 # https://www.cnblogs.com/xyztank/articles/13599165.html
 # Python日期格式化：https://www.cnblogs.com/pyxiaomangshe/p/7918850.html
 # logging模块日志颜色及基本使用：https://blog.csdn.net/qq_36072270/article/details/105345562
+# 非阻塞日志（QueueHandler）：https://docs.python.org/zh-cn/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
 
 import os
+import queue
+import atexit
 import logging
-import colorlog
-import traceback  # 需安装，用于捕获错误
-from logging.handlers import RotatingFileHandler
+import itertools
+import threading
+import traceback  # 用于捕获错误
+from logging.handlers import RotatingFileHandler, QueueHandler
 
 # 检查日志存放目录是否存在，不存在则创建
 cur_path = os.path.dirname(os.path.realpath(__file__))  # 当前项目路径
@@ -24,11 +28,72 @@ if not os.path.exists(log_path):
     os.mkdir(log_path)  # 若不存在logs文件夹，则自动创建
 
 
+class Batch_File_Handler(RotatingFileHandler):
+    '批量写入的日志文件：batching为True时不逐条刷新，由Log_Listener每批刷新一次'
+    batching = False
+
+    def flush(self):
+        if not self.batching:
+            super().flush()
+
+
+class Queue_Handler(QueueHandler):
+    '把日志记录原样放入队列（不在调用线程中格式化），格式化留给Log_Listener的后台线程'
+
+    def prepare(self, record):
+        return record
+
+
+class Log_Listener:
+    '异步日志：后台线程从队列中批量取出日志记录，按各输出的日志等级格式化并写入，每批只刷新一次文件'
+
+    def __init__(self, log_queue, handlers: list, batch_size: int = 256):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.thread = None
+
+    def Start(self):
+        '启动后台写入线程，程序退出时自动写完剩余的日志'
+        self.thread = threading.Thread(target=self.Run, name='Log_Listener', daemon=True)
+        self.thread.start()
+        atexit.register(self.Stop)
+
+    def Run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for handler in self.handlers:
+                handler.batching = True
+                for record in batch:
+                    if record is not None and record.levelno >= handler.level:
+                        handler.handle(record)
+                handler.batching = False
+                handler.flush()
+            if None in batch:  # 收到停止信号
+                return
+
+    def Stop(self):
+        '写完队列中剩余的日志后停止'
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(5)
+            self.thread = None
+
+
 class Log_Mgt:
     '日志管理模块：首次运行时使用‘Log_Conf’函数初始化后，使用已实例化的‘logger’对象记录日志'
     logger = logging.getLogger()
-    def Log_Conf(log_file_name='QGMA.log', file_log_level=10, console_log_level=20, max_bytes=1*1024*1024, backup_count=2):
-        '日志设置：日志文件名，文件日志等级(NOTICE=0,DEBUG=10,INFO=20,WARNING=30,ERROR=40,CRITICAL=50)，控制台日志等级，最大单个日志大小，日志拆分次数（不能为0，1为2份，2为3份，以此类推）'
+    listener = None  # 异步模式的后台写入线程
+    debug_sample = 1  # 高频调试日志（如每条事件）的采样间隔，每n条只记录1条
+    debug_counter = itertools.count()
+
+    def Log_Conf(log_file_name='QGMA.log', file_log_level=10, console_log_level=20, max_bytes=1*1024*1024, backup_count=2, async_log=True):
+        '日志设置：日志文件名，文件日志等级(NOTICE=0,DEBUG=10,INFO=20,WARNING=30,ERROR=40,CRITICAL=50)，控制台日志等级，最大单个日志大小，日志拆分次数（不能为0，1为2份，2为3份，以此类推），是否使用异步日志（日志记录放入队列，由后台线程写入）'
 
         # 检查日志文件名是否合法
         log_file_name = str(log_file_name)
@@ -57,7 +122,7 @@ class Log_Mgt:
         # 输出到文件
         if backup_count == 0:  # 强制分割日志文件，防止日志文件大小无限增加
             backup_count = 1
-        file_handler = RotatingFileHandler(filename=(
+        file_handler = Batch_File_Handler(filename=(
             log_path+'/'+log_file_name), mode='a', maxBytes=max_bytes, backupCount=backup_count, encoding='utf8')
 
         # 日志输出格式
@@ -66,12 +131,21 @@ class Log_Mgt:
             fmt='[%(asctime)s.%(msecs)03d]->[%(levelname)s]:\n%(message)s',
             datefmt='%Y-%m-%d  %H:%M:%S'
         )
-        # 控制台输出格式
-        console_formatter = colorlog.ColoredFormatter(
-            fmt='%(log_color)s[%(asctime)s.%(msecs)03d]->[%(levelname)s]:\n%(message)s',
-            datefmt='%Y-%m-%d  %H:%M:%S',
-            log_colors=log_colors_config
-        )
+        # 控制台输出格式（只有输出到终端时才导入colorlog显示颜色，未安装则不显示颜色）
+        try:
+            if not console_handler.stream.isatty():
+                raise ImportError
+            import colorlog  # 需安装，用于显示日志颜色
+            console_formatter = colorlog.ColoredFormatter(
+                fmt='%(log_color)s[%(asctime)s.%(msecs)03d]->[%(levelname)s]:\n%(message)s',
+                datefmt='%Y-%m-%d  %H:%M:%S',
+                log_colors=log_colors_config
+            )
+        except ImportError:
+            console_formatter = logging.Formatter(
+                fmt='[%(asctime)s.%(msecs)03d]->[%(levelname)s]:\n%(message)s',
+                datefmt='%Y-%m-%d  %H:%M:%S'
+            )
         console_handler.setFormatter(console_formatter)
         file_handler.setFormatter(file_formatter)
 
@@ -80,15 +154,18 @@ class Log_Mgt:
         # 2、loggername 保证每次添加的时候不一样；
         # 3、显示完log之后调用removeHandler
         if not logger.handlers:
-            logger.addHandler(console_handler)
-            logger.addHandler(file_handler)
+            if async_log:  # 异步模式：调用线程只把日志记录放入队列，不再等待格式化和写入文件
+                Log_Mgt.listener = Log_Listener(queue.SimpleQueue(), [console_handler, file_handler])
+                logger.addHandler(Queue_Handler(Log_Mgt.listener.queue))
+                Log_Mgt.listener.Start()
+            else:
+                logger.addHandler(console_handler)
+                logger.addHandler(file_handler)
 
         console_handler.close()
         file_handler.close()
 
         # 日志级别，logger 和 handler以最高级别为准，不同handler之间可以不一样，不相互影响
-        # root日志等级
-        logger.setLevel(logging.NOTSET)
         # 控制台日志等级
         for i in [0, 10, 20, 30, 40, 50]:  # 逐一匹配列表
             if i == console_log_level:  # 如果设置的日志等级符合规范
@@ -105,8 +182,14 @@ class Log_Mgt:
         else:
             file_handler.setLevel(logging.DEBUG)
             logger.error('【日志等级-日志文件】设置不正确，将默认使用DEBUG等级！')
+        # root日志等级取两者中较低的，低于该等级的日志在调用时就直接跳过，不会创建和格式化
+        logger.setLevel(min(console_handler.level, file_handler.level))
         logger.debug('日志模块加载完成...')
 
+    def Sample_Debug() -> bool:
+        '高频调试日志是否需要记录：已启用DEBUG等级，且按采样间隔每debug_sample条记录1条 返回：bool'
+        return logger.isEnabledFor(logging.DEBUG) and next(Log_Mgt.debug_counter) % max(1, Log_Mgt.debug_sample) == 0
+
     def Get_Error():
         '使用traceback获取捕获到的错误'
         return traceback.format_exc()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA群成员目录模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# GO-CQHTTP API文档（获取群成员列表）：https://docs.go-cqhttp.org/api/#获取群成员列表
+# GO-CQHTTP事件文档（群成员增加、减少、管理员变动）：https://docs.go-cqhttp.org/event/
+#
+# 启动时用API连接池批量获取管理的各群聊的成员列表，之后按刷新间隔重新获取；
+# 期间的入群、退群、管理员变动等通知事件直接更新目录，查询成员身份、入群时间都不需要调用API。
+# 未获取成员列表时（未启用或获取失败），目录只包含从通知事件得知的成员，例如新入群的成员。
+# 后台线程只负责调用API，获取到的成员列表放入队列，由处理事件的线程（或事件循环）在Apply_Loaded()中换入，
+# 目录本身只在处理事件的线程中修改，不需要加锁。
+
+import queue
+import threading
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+
+from core.log_mgt import Log_Mgt, logger
+from core.chat_mgt import get_pool, api_ok, api_failed, owner_result
+
+
+class Member_Directory:
+    '群成员目录：{群号: {QQ号: (身份, 入群时间, 头衔)}}，Start()后在后台定时获取成员列表，Apply_Loaded()换入获取到的列表，Handle_Notice()根据通知事件增量更新'
+
+    def __init__(self, worker_num: int = 4, retry_time: int = 60):
+        '创建群成员目录：同时获取成员列表的线程数，获取失败后重试的间隔（秒）'
+        self.worker_num = worker_num
+        self.retry_time = retry_time
+        self.groups = {}  # {群号(int): {QQ号(int): (身份, 入群时间, 头衔)}}，身份为'owner' / 'admin' / 'member'
+        self.admins = {}  # {群号(int): {QQ号(int), ...}}，群主及管理员
+        self.complete = set()  # 已获取过完整成员列表的群聊（只有这些群聊的身份以目录为准）
+        self.loaded = queue.SimpleQueue()  # 后台线程获取到的成员列表 (群号, 成员, 管理员)，等待换入
+        self.next_load = {}  # {群号(int): 下次获取成员列表的时间（monotonic）}，只在后台线程中使用
+        self.group_manage = set()  # 需要获取成员列表的群聊
+        self.refresh_time = None  # 刷新间隔（秒），None为不获取成员列表
+        self.own_group = None
+        self.wake = threading.Event()
+        self.started = False  # 是否已调用Start()（离线重放等场景不调用，目录只根据通知事件更新）
+        self.thread = None
+
+    def __len__(self):
+        return sum(len(TEMP0) for TEMP0 in list(self.groups.values()))
+
+    def Start(self, group_manage: list, refresh_time: int, own_group=None, load: bool = True):
+        '开始在后台获取并定时刷新成员列表：管理的群号列表，刷新间隔（秒），判断群聊是否由本流程处理的函数（多进程分片时使用，None为全部群聊），是否由本流程获取（False时只换入Put_Loaded()放入的列表）'
+        self.own_group = own_group
+        self.started = True
+        self.Set_Groups(group_manage, refresh_time)
+        if load and self.thread is None:
+            self.thread = threading.Thread(target=self.Run, name='Member_Directory', daemon=True)
+            self.thread.start()
+
+    def Set_Groups(self, group_manage: list, refresh_time: int):
+        '更换需要获取成员列表的群聊及刷新间隔，新增的群聊立即获取（在处理事件的线程中调用）'
+        self.group_manage = {int(TEMP0) for TEMP0 in group_manage if self.own_group is None or self.own_group(TEMP0)}
+        self.refresh_time = refresh_time
+        for TEMP0 in set(self.groups) - self.group_manage:  # 不再管理的群聊
+            self.Drop_Group(TEMP0)
+        self.wake.set()
+
+    def Run(self):
+        '后台线程：获取到期（或从未获取）的群聊成员列表，一次最多worker_num个群聊同时获取'
+        with ThreadPoolExecutor(self.worker_num, thread_name_prefix='Member_Load') as executor:
+            while True:
+                self.wake.clear()
+                now = monotonic()
+                group_manage = self.group_manage  # 处理事件的线程可能同时更换
+                for TEMP0 in set(self.next_load) - group_manage:  # 不再管理的群聊
+                    del self.next_load[TEMP0]
+                due = [TEMP0 for TEMP0 in group_manage if self.next_load.get(TEMP0, 0) <= now] if self.refresh_time is not None else []
+                if due != []:
+                    TEMP0 = [TEMP1 for TEMP1 in executor.map(self.Load_Group, due) if TEMP1 is not None]
+                    logger.info('【成员】已获取 ' + str(len(TEMP0)) + '/' + str(len(due)) + ' 个群聊的成员列表，共 ' + str(sum(TEMP0)) + ' 名成员')
+                    continue
+                TEMP0 = [self.next_load[TEMP1] for TEMP1 in group_manage if TEMP1 in self.next_load]
+                self.wake.wait(None if self.refresh_time is None or TEMP0 == [] else max(0, min(TEMP0) - monotonic()))
+
+    def Load_Group(self, group_id: int):
+        '获取一个群聊的成员列表，放入队列等待换入（在后台线程中调用） 返回：int，成员数 / None，获取失败'
+        try:
+            result = get_pool(group_id).Call_Api('get_group_member_list', {'group_id': group_id})
+            owner_result(group_id, result)
+            if not api_ok(result) or not isinstance(result.get('data'), list):
+                api_failed('get_group_member_list', result)
+                self.next_load[group_id] = monotonic() + self.retry_time
+                return None
+            members = {}
+            admins = set()
+            for TEMP0 in result['data']:
+                TEMP1 = int(TEMP0['user_id'])
+                members[TEMP1] = (TEMP0.get('role', 'member'), int(TEMP0.get('join_time') or 0), TEMP0.get('title', ''))
+                if members[TEMP1][0] != 'member':
+                    admins.add(TEMP1)
+        except:
+            logger.error(Log_Mgt.Get_Error())
+            self.next_load[group_id] = monotonic() + self.retry_time
+            return None
+        self.loaded.put((group_id, members, admins))
+        self.next_load[group_id] = monotonic() + (self.refresh_time or 0)
+        return len(members)
+
+    def Put_Loaded(self, group_id: int, members: dict, admins: set):
+        '放入其他流程获取的成员列表（多进程模式由主进程统一获取后转发给各分片），等待Apply_Loaded()换入'
+        self.loaded.put((group_id, members, admins))
+
+    def Apply_Loaded(self):
+        '换入后台线程获取到的成员列表（在处理事件的线程中调用，没有新列表时只检查一次队列）'
+        while not self.loaded.empty():
+            group_id, members, admins = self.loaded.get()
+            if group_id not in self.group_manage:  # 获取期间已不再管理
+                continue
+            # 整个群聊一次替换（获取期间收到的通知事件可能被覆盖，下次刷新时更正）
+            self.groups[group_id] = members
+            self.admins[group_id] = admins
+            self.complete.add(group_id)
+
+    def Drop_Group(self, group_id: int):
+        '删除一个群聊的全部记录'
+        self.groups.pop(group_id, None)
+        self.admins.pop(group_id, None)
+        self.complete.discard(group_id)
+
+    def Set_Member(self, group_id: int, user_id: int, role: str = None, join_time: int = None, title: str = None):
+        '更新一名成员的记录（没有给出的项目保持不变）'
+        members = self.groups.setdefault(group_id, {})
+        TEMP0 = members.get(user_id, ('member', 0, ''))
+        TEMP0 = (TEMP0[0] if role is None else role, TEMP0[1] if join_time is None else join_time, TEMP0[2] if title is None else title)
+        members[user_id] = TEMP0
+        if TEMP0[0] != 'member':
+            self.admins.setdefault(group_id, set()).add(user_id)
+        else:
+            self.admins.get(group_id, set()).discard(user_id)
+
+    def Handle_Notice(self, rev: dict):
+        '根据通知事件更新目录：入群、退群（被踢）、管理员变动、头衔变更'
+        if rev.get('group_id') is None or rev.get('user_id') is None:
+            return
+        group_id = int(rev['group_id'])
+        user_id = int(rev['user_id'])
+        notice_type = rev.get('notice_type')
+        if notice_type == 'group_increase':
+            self.Set_Member(group_id, user_id, 'member', int(rev['time']), '')
+        elif notice_type == 'group_decrease':
+            if rev.get('sub_type') == 'kick_me':  # 机器人被踢出群聊
+                self.Drop_Group(group_id)
+            else:
+                self.groups.get(group_id, {}).pop(user_id, None)
+                self.admins.get(group_id, set()).discard(user_id)
+        elif notice_type == 'group_admin':
+            self.Set_Member(group_id, user_id, 'admin' if rev.get('sub_type') == 'set' else 'member')
+        elif notice_type == 'notify' and rev.get('sub_type') == 'title':
+            self.Set_Member(group_id, user_id, title=rev.get('title', ''))
+
+    def Member(self, group_id, user_id):
+        '查询成员的记录 返回：tuple，(身份, 入群时间, 头衔) / None（未知）'
+        return self.groups.get(int(group_id), {}).get(int(user_id))
+
+    def Is_Admin(self, group_id, user_id, role: str = None) -> bool:
+        '是否为群主或管理员：群号，QQ号，消息中的发送者身份（该群聊还没有获取过成员列表时使用） 返回：bool'
+        if int(group_id) in self.complete:
+            return int(user_id) in self.admins.get(int(group_id), ())
+        return role in ('owner', 'admin')
+
+    def Is_New(self, group_id, user_id, now: int, seconds: int) -> bool:
+        '是否为最近seconds秒内入群的成员（入群时间未知时为False）：群号，QQ号，当前服务器时间，秒数 返回：bool'
+        TEMP0 = self.Member(group_id, user_id)
+        return TEMP0 is not None and TEMP0[1] != 0 and now - TEMP0[1] < seconds
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA运行指标模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# Prometheus文本格式：https://prometheus.io/docs/instrumenting/exposition_formats/
+#
+# 计数器和直方图只在内存中累加（一次加锁的字典更新），队列长度等数值在被读取时才计算，
+# 因此可以一直开启；设置了指标端口时，通过HTTP以Prometheus文本格式提供：http://IP:端口/metrics
+
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from core.log_mgt import Log_Mgt, logger
+
+# 默认的延迟直方图分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics_Mgt:
+    '运行指标：计数器（Inc）、直方图（Observe）和读取时计算的数值（Gauge），请使用已实例化的‘metrics’对象'
+
+    def __init__(self):
+        self.info = {}  # {指标名称: (类型, 说明, 标签名称元组, 直方图分桶)}
+        self.values = {}  # 计数器 {(指标名称, 标签值元组): 数值}
+        self.histograms = {}  # 直方图 {(指标名称, 标签值元组): [各分桶次数..., 超过所有分桶的次数, 总和]}
+        self.gauges = {}  # {指标名称: 返回 {标签值元组: 数值} 的函数}
+        self.remote = {}  # 其他进程（多进程模式的工作进程）发来的快照 {进程序号: Snapshot()}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def Counter(self, name: str, help: str, labels: tuple = ()):
+        '声明一个计数器：指标名称，说明，标签名称'
+        self.info[name] = ('counter', help, tuple(labels), None)
+
+    def Histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        '声明一个直方图：指标名称，说明，标签名称，分桶上限（从小到大）'
+        self.info[name] = ('histogram', help, tuple(labels), tuple(buckets))
+
+    def Gauge(self, name: str, help: str, func, labels: tuple = ()):
+        '声明一个读取时才计算的数值：指标名称，说明，返回数值（没有标签时）或 {标签值元组: 数值} 的函数，标签名称'
+        self.info[name] = ('gauge', help, tuple(labels), None)
+        self.gauges[name] = func
+
+    def Drop_Gauge(self, name: str):
+        '不再计算某个数值型指标（如工作进程中没有出站操作队列）：指标名称'
+        self.gauges.pop(name, None)
+
+    def Inc(self, name: str, labels: tuple = (), value: float = 1):
+        '计数器增加：指标名称，标签值（与声明的标签名称一一对应），增加的数值'
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def Observe(self, name: str, labels: tuple, value: float):
+        '直方图记录一次数值：指标名称，标签值，数值（如延迟秒数）'
+        key = (name, labels)
+        buckets = self.info[name][3]
+        with self.lock:
+            TEMP0 = self.histograms.get(key)
+            if TEMP0 is None:
+                TEMP0 = self.histograms[key] = [0] * (len(buckets) + 2)
+            TEMP0[bisect_left(buckets, value)] += 1  # 落在第一个大于等于该值的分桶，超过所有分桶的落在+Inf
+            TEMP0[-1] += value  # 总次数等于各分桶次数之和，输出时再计算
+
+    def Read_Gauges(self) -> dict:
+        '计算所有数值型指标 返回：dict，{(指标名称, 标签值元组): 数值}'
+        values = {}
+        for name, func in self.gauges.items():
+            try:
+                TEMP0 = func()
+            except:
+                logger.error(Log_Mgt.Get_Error())
+                continue
+            if isinstance(TEMP0, dict):
+                for TEMP1, TEMP2 in TEMP0.items():
+                    values[(name, TEMP1)] = TEMP2
+            else:
+                values[(name, ())] = TEMP0
+        return values
+
+    def Snapshot(self) -> dict:
+        '导出当前所有指标，用于发给其他进程合并 返回：dict'
+        with self.lock:
+            snapshot = {'values': dict(self.values), 'histograms': {TEMP0: list(TEMP1) for TEMP0, TEMP1 in self.histograms.items()}}
+        snapshot['values'].update(self.Read_Gauges())
+        return snapshot
+
+    def Merge_Remote(self, index: int, snapshot: dict):
+        '保存其他进程的指标快照，输出时加上shard标签：进程序号，Snapshot()的结果'
+        with self.lock:
+            self.remote[index] = snapshot
+
+    def Render(self) -> str:
+        '按Prometheus文本格式输出所有指标 返回：str'
+        sources = [((), (), self.Snapshot())]
+        with self.lock:
+            for TEMP0, TEMP1 in sorted(self.remote.items()):
+                sources.append((('shard',), (str(TEMP0),), TEMP1))
+        lines = []
+        for name, (kind, help, label_names, buckets) in self.info.items():
+            lines.append('# HELP ' + name + ' ' + help)
+            lines.append('# TYPE ' + name + ' ' + kind)
+            for extra_names, extra_values, snapshot in sources:
+                names = label_names + extra_names
+                if kind == 'histogram':
+                    for (TEMP0, TEMP1), TEMP2 in snapshot['histograms'].items():
+                        if TEMP0 != name:
+                            continue
+                        values = TEMP1 + extra_values
+                        count = 0
+                        for TEMP3, TEMP4 in zip(buckets + ('+Inf',), TEMP2):
+                            count += TEMP4
+                            lines.append(name + '_bucket' + Metrics_Mgt.Labels(names + ('le',), values + (str(TEMP3),)) + ' ' + str(count))
+                        lines.append(name + '_sum' + Metrics_Mgt.Labels(names, values) + ' ' + repr(float(TEMP2[-1])))
+                        lines.append(name + '_count' + Metrics_Mgt.Labels(names, values) + ' ' + str(count))
+                else:
+                    for (TEMP0, TEMP1), TEMP2 in snapshot['values'].items():
+                        if TEMP0 == name:
+                            lines.append(name + Metrics_Mgt.Labels(names, TEMP1 + extra_values) + ' ' + str(TEMP2))
+        return '\n'.join(lines) + '\n'
+
+    def Event_Labels(rev: dict) -> tuple:
+        '上报事件的类型标签 返回：tuple，(post_type, 消息/通知/元事件/请求的具体类型)'
+        return (str(rev.get('post_type', '')), str(rev.get('message_type') or rev.get('notice_type') or
+                                                   rev.get('meta_event_type') or rev.get('request_type') or ''))
+
+    def Labels(names: tuple, values: tuple) -> str:
+        '生成标签文本，如{action="delete_msg"} 返回：str'
+        if names == ():
+            return ''
+        return '{' + ','.join(TEMP0 + '="' + str(TEMP1).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                              for TEMP0, TEMP1 in zip(names, values)) + '}'
+
+    def Start(self, server_addr: str, port: int):
+        '启动指标HTTP服务（后台线程），已启动则忽略：监听ip，端口'
+        if self.server is not None:
+            return
+        self.server = ThreadingHTTPServer((server_addr, int(port)), Metrics_Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='Metrics', daemon=True).start()
+        logger.info('【指标】正在监听 ' + server_addr + ':' + str(port) + '/metrics')
+
+
+class Metrics_Handler(BaseHTTPRequestHandler):
+    '指标HTTP服务：GET /metrics 返回Prometheus文本格式'
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = metrics.Render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # 不在控制台打印每个请求
+        pass
+
+
+metrics = Metrics_Mgt()
+metrics.Counter('qgma_events_received_total', '接收的上报事件数', ('post_type', 'type'))
+metrics.Counter('qgma_events_dropped_total', '未完整解析就丢弃的上报事件数（多余的心跳、不在管理范围内的群聊）', ('reason',))
+metrics.Counter('qgma_messages_checked_total', '进行了关键词检查的群聊消息数')
+metrics.Counter('qgma_keyword_hits_total', '命中关键词的消息数', ('category',))
+metrics.Counter('qgma_flood_faults_total', '因刷屏记录的犯错次数')
+metrics.Counter('qgma_verdict_cache_total', '消息分类缓存的查找次数（hit为命中，可用于计算命中率）', ('result',))
+metrics.Histogram('qgma_decision_seconds', '从收到事件到处理完成（分类、撤回及禁言等操作已放入队列）的延迟')
+metrics.Counter('qgma_actions_total', '调用的API次数', ('action', 'result'))
+metrics.Histogram('qgma_action_seconds', '调用API的耗时（含限速等待）', ('action',))
+metrics.Counter('qgma_actions_retried_total', '网络错误后重试的操作数', ('action',))
+metrics.Counter('qgma_actions_limited_total', '令牌不足而延后执行的API调用数', ('action',))
+metrics.Counter('qgma_actions_dropped_total', '出站队列已满而丢弃的操作数', ('action',))
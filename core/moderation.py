@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA群管核心流程
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 消息分类、犯错计数、撤回队列、异常报告和宵禁都在这里处理，
+# 与事件接收和API调用无关：需要执行的操作统一交给‘sink’（如出站操作队列的Put函数），
+# 因此多线程模式和asyncio模式可以共用同一套流程。
+
+from random import randint
+from time import time, localtime, perf_counter
+
+from core.log_mgt import Log_Mgt, logger
+import core.settings_load as settings_load
+from core.chat_mgt import send_msg_private, send_msg_group, send_tips, del_msg, group_kick, group_ban, group_whole_ban
+from core.word_match import *
+from core.text_normalize import *
+from core.near_dup import *
+from core.verdict_cache import *
+from core.flood_mgt import *
+from core.member_mgt import *
+from core.timer_mgt import *
+from core.offense_mgt import *
+from core.curfew_mgt import *
+from core.report_mgt import *
+from core.metrics import metrics
+
+
+class Moderation:
+    '群管核心流程：Handle_Event处理单个事件，Handle_Task处理到期的定时任务，Next_Deadline给出下次需要处理定时任务的时间'
+
+    def __init__(self, sink, store=None, own_group=None, report_sink=None, clock=time, similar_sink=None):
+        '创建群管流程：执行操作的函数（调用方式为 sink(chat_mgt中的操作函数, *参数)），状态保存State_Store（可选），判断群聊是否由本流程处理的函数（多进程分片时使用，None为处理全部群聊），接收异常聊天记录的函数（调用方式同Add_Report，None为自己汇总报告），本地时钟（离线重放时使用虚拟时钟），发现新广告时通知其他分片的函数（调用方式同Add_Similar，可选）'
+        self.sink = sink
+        self.similar_sink = similar_sink
+        self.clock = clock
+        self.store = store
+        self.own_group = own_group
+        self.report_sink = report_sink
+        self.word_match = Word_Match({'bad': settings_load.bad_word, 'ads': settings_load.ads_word}, Text_Normalize.Normalize, settings_load.allow_word)  # 将脏话及广告词库编译为关键词自动机
+        self.group_set = set(settings_load.group_manage)  # 管理的群聊（集合，查找为O(1)）
+        self.near_dup = Moderation.Near_Dup(settings_load.ads_similar)  # 最近的广告消息（相似广告识别）
+        self.verdict_cache = Verdict_Cache()  # 消息分类缓存，词库改变时随关键词自动机一起重建
+        self.flood = Moderation.Flood(settings_load.flood_limit)  # 刷屏检测（各成员最近的发言数，占用内存固定）
+        self.admin_set = set(settings_load.admin_user_id)  # 机器人管理员（集合，查找为O(1)）
+        self.members = Member_Directory()  # 群成员目录（身份、入群时间），Start_Members()后定时获取成员列表
+        self.next_report_time = None  # 初始化下次消息报告时间
+        self.time_difference = None  # 初始化时差校准变量
+        self.del_msg_queue = Timer_Heap()  # 初始化消息撤回队列（按撤回时间排序的最小堆）
+        self.report_queue = {}  # 初始化消息报告队列 {(群号, QQ号): 报告记录}
+        self.offense_ledger = Offense_Ledger(int(settings_load.task_cycle) * 60)  # 初始化犯错记录表（统计最近task_cycle分钟）
+        self.curfew = Curfew_Mgt()  # 初始化宵禁调度（各群聊的宵禁时间及状态）
+        self.curfew.Set_Windows(self.Curfew_Windows(settings_load.curfew_time, settings_load.group_curfew, settings_load.group_manage))
+        metrics.Gauge('qgma_del_msg_queue_size', '等待撤回的消息数', lambda: len(self.del_msg_queue))
+        metrics.Gauge('qgma_report_queue_size', '等待报告的异常聊天记录数', lambda: len(self.report_queue))
+        metrics.Gauge('qgma_verdict_cache_size', '消息分类缓存中的消息数', lambda: len(self.verdict_cache))
+        metrics.Gauge('qgma_members_cached', '群成员目录中的成员数', lambda: len(self.members))
+        metrics.Gauge('qgma_offense_records', '统计周期内有犯错记录的成员数', lambda: len(self.offense_ledger))
+
+        if self.store is not None:  # 恢复上次运行保存的状态
+            self.Restore(self.store.Load())
+
+    def Build_Settings(self, changed: dict) -> dict:
+        '根据改变的设置预先生成需要重建的对象，只重建受影响的部分，不修改当前状态（可以在锁外执行） 返回：dict，{属性名: 新对象}'
+        built = {}
+        if 'bad_word' in changed or 'ads_word' in changed or 'allow_word' in changed:  # 只有词库改变时才重新编译关键词自动机
+            built['word_match'] = Word_Match({'bad': changed.get('bad_word', settings_load.bad_word), 'ads': changed.get('ads_word', settings_load.ads_word)}, Text_Normalize.Normalize, changed.get('allow_word', settings_load.allow_word))
+        if 'ads_similar' in changed:
+            built['near_dup'] = Moderation.Near_Dup(changed['ads_similar'])
+        if 'admin_user_id' in changed:
+            built['admin_set'] = set(changed['admin_user_id'])
+        if 'flood_limit' in changed:
+            built['flood'] = Moderation.Flood(changed['flood_limit'])
+        if 'bad_word' in changed or 'ads_word' in changed or 'allow_word' in changed or 'ads_similar' in changed:  # 缓存的分类结果及签名已失效
+            built['verdict_cache'] = Verdict_Cache()
+        if 'group_manage' in changed:
+            built['group_set'] = set(changed['group_manage'])
+        if 'curfew_time' in changed or 'group_curfew' in changed or 'group_manage' in changed:
+            built['curfew_windows'] = self.Curfew_Windows(changed.get('curfew_time', settings_load.curfew_time), changed.get('group_curfew', settings_load.group_curfew),
+                                                          changed.get('group_manage', settings_load.group_manage))
+        return built
+
+    def Apply_Settings(self, changed: dict, built: dict):
+        '应用改变的设置及Build_Settings()生成的对象，需要与Handle_Event/Handle_Task互斥调用'
+        built = dict(built)
+        if 'curfew_windows' in built:  # 宵禁时间改变后，时差已校准时所有群聊立即重新检查一次
+            self.curfew.Set_Windows(built.pop('curfew_windows'), self.Now() if self.time_difference != None else None)
+        if self.members.started and ('group_manage' in changed or 'member_refresh' in changed):  # 新增的群聊立即获取成员列表
+            self.members.Set_Groups(settings_load.group_manage, Moderation.Refresh_Time(settings_load.member_refresh))
+        for TEMP0, TEMP1 in built.items():
+            setattr(self, TEMP0, TEMP1)
+
+    def Near_Dup(ads_similar):
+        '根据相似广告识别设置（相似度阈值, 保留时间）创建索引 返回：Near_Dup_Index / None（不启用）'
+        if ads_similar is None:
+            return None
+        return Near_Dup_Index(ads_similar[0], ads_similar[1])
+
+    def Refresh_Time(member_refresh):
+        '群成员列表刷新间隔（分钟）转化为秒 返回：int / None（不获取）'
+        return int(member_refresh) * 60 if member_refresh != None else None
+
+    def Start_Members(self, load: bool = True):
+        '开始在后台获取并定时刷新本流程负责的群聊的成员列表（离线重放等场景不调用，目录只根据通知事件更新）：是否由本流程获取（多进程模式的工作进程为False，由主进程获取后转发）'
+        self.members.Start(settings_load.group_manage, Moderation.Refresh_Time(settings_load.member_refresh), self.own_group, load)
+
+    def Flood(flood_limit: list):
+        '根据刷屏规则创建刷屏检测 返回：Flood_Mgt / None（不启用）'
+        if flood_limit == []:
+            return None
+        return Flood_Mgt(flood_limit)
+
+    def Add_Similar(self, signature: tuple, now: int):
+        '记下其他分片发现的广告（相似广告识别）：签名，消息时间'
+        if self.near_dup is not None:
+            self.near_dup.Add(signature, now)
+
+    def Curfew_Windows(self, curfew_time: list, group_curfew: dict, group_manage: list) -> dict:
+        '本流程处理的各群聊的宵禁时间 返回：dict，{群号: (开始时间, 结束时间)}'
+        return Curfew_Mgt.Windows(curfew_time, group_curfew, [TEMP0 for TEMP0 in group_manage if self.Own_Group(TEMP0)])
+
+    def Save(self, table: str, row: tuple):
+        '保存一行状态（未启用状态保存时忽略）'
+        if self.store is not None:
+            self.store.Put(table, row)
+
+    def Forget(self, table: str, key: tuple):
+        '删除一行保存的状态（未启用状态保存时忽略）'
+        if self.store is not None:
+            self.store.Delete(table, key)
+
+    def Own_Group(self, group_id) -> bool:
+        '群聊是否由本流程处理 返回：bool'
+        return self.own_group is None or self.own_group(group_id)
+
+    def Restore(self, state: dict):
+        '恢复State_Store.Load()读取的状态：犯错记录、撤回队列、报告队列、宵禁状态及下次报告时间'
+        for TEMP0 in sorted(state.get('offense', []), key=lambda TEMP0: TEMP0[6]):  # 按最后犯错时间恢复顺序
+            if self.Own_Group(TEMP0[0]):  # 分片数改变后，不属于本流程的记录不再恢复
+                self.offense_ledger.Import(TEMP0)
+        for TEMP0, TEMP1, TEMP2, TEMP3 in state.get('del_msg', []):
+            if TEMP3 is None or self.Own_Group(TEMP3):  # 旧版本没有保存群号，只能由本流程撤回
+                self.del_msg_queue.Add(TEMP1, TEMP0, TEMP2)
+        for TEMP0 in state.get('report', []):
+            if self.report_sink is not None and not self.Own_Group(TEMP0[0]):  # 报告由主进程汇总时，主进程恢复全部群聊，工作进程只恢复本分片的
+                continue
+            self.report_queue[(TEMP0[0], TEMP0[1])] = {'group_id': TEMP0[0], 'user_id': TEMP0[1],
+                                                       'num': TEMP0[2], 'time': TEMP0[3], 'message': TEMP0[4]}
+        for TEMP0, TEMP1 in state.get('curfew', []):
+            if self.Own_Group(TEMP0):
+                self.curfew.state[str(TEMP0)] = int(TEMP1)
+        meta = state.get('meta', {})
+        if meta.get('curfew_state') is not None and state.get('curfew', []) == []:  # 旧版本只保存了一个宵禁状态
+            for TEMP0 in self.curfew.windows:
+                self.curfew.state[TEMP0] = int(meta['curfew_state'])
+        if meta.get('next_report_time') is not None:
+            self.next_report_time = int(meta['next_report_time'])
+        if len(self.offense_ledger) or len(self.del_msg_queue) or self.report_queue:
+            logger.info('已恢复状态：' + str(len(self.offense_ledger)) + ' 条犯错记录，' + str(len(self.del_msg_queue)) +
+                        ' 条待撤回消息，' + str(len(self.report_queue)) + ' 条待报告记录')
+
+    def Now(self) -> int:
+        '校准时差后的服务器时间 返回：int'
+        return int(self.clock()) + int(self.time_difference or 0)
+
+    def Next_Deadline(self):
+        '下次需要处理定时任务的服务器时间，没有待处理的任务则为None 返回：int / None'
+        if self.time_difference == None:
+            return None
+        deadline = []
+        if self.curfew.Next_Deadline() is not None:  # 下一个群聊开始或结束宵禁的时间
+            deadline.append(self.curfew.Next_Deadline())
+        if len(self.del_msg_queue) != 0:
+            deadline.append(self.del_msg_queue.Next_Deadline())
+        if self.report_queue != {}:
+            deadline.append(self.next_report_time)
+        return min(deadline) if deadline != [] else None
+
+    def Handle_Task(self):  # 任务处理
+        '处理所有已到期的定时任务：宵禁、消息撤回、异常报告、清理过期的犯错记录'
+        if self.time_difference == None:  # 时差未校准
+            return
+        now = self.Now()
+        # 执行宵禁（定时全员禁言）：到时间的群聊一次全部放入出站操作队列，由工作线程并发执行
+        for TEMP0, TEMP1 in self.curfew.Pop_Due(now):
+            self.sink(group_whole_ban, TEMP0, 'true' if TEMP1 == 1 else 'false')
+            self.Save('curfew', (int(TEMP0), TEMP1))
+
+        # 一次撤回所有已到达撤回时间的消息
+        for TEMP0, TEMP1 in self.del_msg_queue.Pop_Due(now):
+            self.sink(del_msg, TEMP0, TEMP1)  # 撤回消息（由收到该消息的账号撤回）
+            self.Forget('del_msg', (TEMP0,))
+
+        if self.report_queue != {}:  # 如果消息报告队列不为空
+            if self.next_report_time <= now:  # 如果达到了处理报告的时间
+                if settings_load.report_cycle != []:  # 如果有有效的报告周期（启用了消息报告）
+                    if settings_load.admin_user_id != []:  # 如果有机器人管理员
+                        # 汇总成一份分页简报，每个管理员只发送一次
+                        pages = Report_Mgt.Build_Digest(list(self.report_queue.values()))
+                        for TEMP0 in settings_load.admin_user_id:
+                            self.sink(send_report, TEMP0, pages)
+                        self.next_report_time = now + int(settings_load.report_cycle[0])  # 设置下次报告处理时间
+                else:
+                    self.next_report_time = now + 60  # 设置下次报告处理时间
+                self.report_queue = {}  # 清空报告队列
+                self.Save('meta', ('next_report_time', str(self.next_report_time)))
+                if self.store is not None:
+                    self.store.Clear('report')
+
+        for TEMP0 in self.offense_ledger.Expire(now):  # 清理整个统计周期内都没有犯错的记录
+            self.Forget('offense', TEMP0)
+
+    def Handle_Event(self, rev: dict):  # 消息处理
+        '处理GO-CQHTTP上报的单个事件'
+        if Log_Mgt.Sample_Debug():  # 按采样间隔记录事件，日志在后台线程格式化，这里只复制一份避免之后被修改
+            logger.debug('%s', dict(rev))
+
+        self.members.Apply_Loaded()  # 换入后台获取到的群成员列表
+
+        # 校准服务器与本地时差
+        calibrated = self.time_difference != None
+        self.time_difference = int(rev['time']) - int(self.clock())
+        if not calibrated:  # 首次校准后，所有群聊检查一次宵禁状态（重启后直接恢复到正确的状态）
+            self.curfew.Schedule_All(self.Now())
+
+        # 设置首次报告发送时间
+        if self.next_report_time == None:  # 如果下次报告发送时间为空
+            if settings_load.report_cycle != []:  # 如果有有效的报告周期
+                self.next_report_time = rev['time'] + int(settings_load.report_cycle[0])
+            else:
+                self.next_report_time = rev['time'] + 60
+            self.Save('meta', ('next_report_time', str(self.next_report_time)))
+
+        if rev["post_type"] == "notice":
+            # 消息已被撤回（如管理员手动撤回），取消对应的撤回任务
+            if rev.get("notice_type") == "group_recall":
+                if self.del_msg_queue.Cancel(rev['message_id']):
+                    self.Forget('del_msg', (rev['message_id'],))
+            else:  # 入群、退群、管理员变动等，更新群成员目录
+                self.members.Handle_Notice(rev)
+
+        # 消息处理
+        if rev["post_type"] == "message":  # 如果接收到的内容为消息，开始判断消息类型
+            if rev["message_type"] == "group" and rev["sub_type"] == "normal":  # 如果为群聊消息，且为正常消息
+                self.Group_Message(rev)
+
+            elif rev["message_type"] == "private":  # 否则，如果为私聊消息
+                if settings_load.admin_user_id != []:  # 如果有机器人管理员
+                    if str(rev["user_id"]) in self.admin_set:  # 如果是机器人管理员
+                        # 执行相关命令（管理员指令）
+                        logger.info('【提示】当前暂不支持机器人指令[私聊]（管理员）')
+                else:
+                    # 执行相关命令（普通指令）
+                    logger.info('【提示】当前暂不支持机器人指令[私聊]（普通用户）')
+
+        if '_recv_time' in rev:  # 从收到事件到处理完成的延迟（包括在队列中等待的时间）
+            metrics.Observe('qgma_decision_seconds', (), perf_counter() - rev['_recv_time'])
+
+    def Classify(self, rev: dict) -> dict:
+        '检查群聊消息是否含有脏话或广告 返回：dict，Word_Match.Match的结果'
+        text = Text_Normalize.Normalize(rev["message"])  # 归一化一次（全半角、大小写、分隔符、形近字母），变形写法也能被词库命中
+        verdict = self.verdict_cache.Get(text)  # 刷屏的重复消息直接使用缓存的结果
+        if verdict is None:
+            # 单次扫描消息，匹配脏话及广告词库；同时计算相似广告签名
+            verdict = (self.word_match.Match(text), self.near_dup.Signature(text) if self.near_dup is not None else None)
+            self.verdict_cache.Put(text, verdict)
+        word_hits = dict(verdict[0])  # 复制一份（相似广告识别会替换其中的列表），缓存的结果不被修改
+        signature = verdict[1]
+        metrics.Inc('qgma_messages_checked_total')
+        # 日志参数在后台线程中才格式化（命中原文也在格式化时才查找），不阻塞消息处理
+        if word_hits['bad'] != []:  # 如果检测到了脏话
+            metrics.Inc('qgma_keyword_hits_total', ('bad',))
+            logger.info('【注意】群聊: %s 中，用户：%s 发送了脏话：%s（只显示前300字） 命中：%s', rev['group_id'], rev['user_id'], rev['message'][:300], Moderation.Hit_Text(rev["message"], text, word_hits['bad']))
+        if word_hits['ads'] != []:  # 如果检测到了广告
+            metrics.Inc('qgma_keyword_hits_total', ('ads',))
+            logger.info('【注意】群聊: %s 中，用户：%s 发送了广告：%s（只显示前300字） 命中：%s', rev['group_id'], rev['user_id'], rev['message'][:300], Moderation.Hit_Text(rev["message"], text, word_hits['ads']))
+        if self.near_dup is not None:  # 相似广告识别：词库命中的广告记下签名，其他消息与最近的广告比较
+            if word_hits['ads'] != []:
+                # 同一波广告可能发到其他分片的群聊（重复的广告只通知一次）
+                if self.near_dup.Add(signature, int(rev['time'])) and self.similar_sink is not None:
+                    self.similar_sink(signature, int(rev['time']))
+            else:
+                TEMP0 = self.near_dup.Match(signature, int(rev['time']))
+                if TEMP0 != 0:
+                    word_hits['ads'] = ['相似广告（%d%%）' % (TEMP0 * 100)]
+                    metrics.Inc('qgma_keyword_hits_total', ('ads_similar',))
+                    logger.info('【注意】群聊: %s 中，用户：%s 发送了与最近的广告相似的消息：%s（只显示前300字） 相似度：%.2f', rev['group_id'], rev['user_id'], rev['message'][:300], TEMP0)
+        return word_hits
+
+    class Hit_Text:
+        '命中的关键词，原文写法不同时附上原文片段（如 sb（原文：Ｓ.Ｂ））：作为日志参数使用，只在日志线程格式化时才查找原文，未启用INFO等级时不查找'
+
+        def __init__(self, message: str, text: str, words: list):
+            self.message = message
+            self.text = text
+            self.words = words
+
+        def __str__(self):
+            result = []
+            for TEMP0 in self.words:
+                TEMP1 = Text_Normalize.Original(self.message, TEMP0, self.text)
+                result.append(TEMP0 if TEMP1 in ('', TEMP0) else TEMP0 + '（原文：' + TEMP1 + '）')
+            return str(result)
+
+    def Group_Message(self, rev: dict):
+        '处理群聊普通消息：分类、提醒、撤回、报告及禁言踢出'
+        if not self.Own_Group(rev['group_id']):  # 由其他分片处理
+            return
+        bad_record = 0  # 默认消息不含脏话
+        ads_record = 0  # 默认消息不含广告
+        flood_record = 0  # 默认没有刷屏
+        if str(rev['group_id']) in self.group_set:  # 如果属于管理范围
+            # 如果是群聊普通成员则需要进行消息检查（身份以群成员目录为准，该群聊还没有获取成员列表时使用消息中的身份）
+            if not self.members.Is_Admin(rev['group_id'], rev['user_id'], rev['sender']['role']):
+                if self.flood is not None:  # 刷屏检测：统计最近的发言数，与消息内容无关
+                    flood_record = self.flood.Hit(rev['group_id'], rev['user_id'], int(rev['time']))
+                    if flood_record == 1:
+                        metrics.Inc('qgma_flood_faults_total')
+                        logger.info('【注意】群聊: %s 中，用户：%s 发言过于频繁（刷屏），记犯错1次', rev['group_id'], rev['user_id'])
+                word_hits = self.Classify(rev)
+                bad_record = int(word_hits['bad'] != [])  # 脏话消息记录
+                ads_record = int(word_hits['ads'] != [])  # 广告消息记录
+            else:
+                # 对方身份为群聊管理员或群主，请自定义
+                pass
+
+        if ("[CQ:at,qq=" + str(rev.get('self_id', settings_load.bot_user_id)) + "]" in rev["raw_message"]) and ads_record == 0 and bad_record == 0:  # 如果为正常内容且机器人被艾特
+            if settings_load.admin_user_id != []:  # 如果有机器人管理员
+                if str(rev["user_id"]) in self.admin_set:  # 如果是机器人管理员
+                    # 执行相关命令（管理员指令）
+                    logger.info('【提示】当前暂不支持机器人指令[群聊]（管理员）')
+            else:
+                # 执行相关命令（普通指令）
+                logger.info('【提示】当前暂不支持机器人指令[群聊]（普通用户）')
+
+        # 群聊消息结算
+        if ads_record == 1 or bad_record == 1:  # 如果为不良消息
+            if settings_load.del_msg_time != None:  # 如果启用了撤回消息
+                self.del_msg_queue.Add(int(rev['time']) + int(settings_load.del_msg_time), rev['message_id'], rev.get('self_id'))  # 将不良消息添加到撤回队列
+                self.Save('del_msg', (rev['message_id'], int(rev['time']) + int(settings_load.del_msg_time), rev.get('self_id'), rev['group_id']))
+
+            # 脏话提醒与广告提醒
+            if settings_load.ads_word_tips != [] or settings_load.bad_word_tips != []:  # 如果启用了广告提醒或脏话提醒
+                tips_msg = []
+                if ads_record == 1 and settings_load.ads_word_tips != []:
+                    tips_msg.append(settings_load.ads_word_tips[randint(0, len(settings_load.ads_word_tips)-1)])
+                if bad_record == 1 and settings_load.bad_word_tips != []:
+                    tips_msg.append(settings_load.bad_word_tips[randint(0, len(settings_load.bad_word_tips)-1)])
+                if tips_msg != []:  # 同一群聊短时间内的多条提醒会合并为一条艾特多人的消息
+                    self.sink(send_tips, rev['group_id'], [rev['user_id']], tips_msg)
+
+            fault = ads_record + bad_record + flood_record  # 发送了广告和脏话各记录一次犯错，刷屏再记一次
+            if settings_load.new_member_time != None and self.members.Is_New(rev['group_id'], rev['user_id'], int(rev['time']), int(settings_load.new_member_time) * 60):
+                fault *= 2  # 刚入群的成员（常见的广告号）加倍记犯错
+                logger.info('【注意】群聊: %s 中，用户：%s 入群不满 %s 分钟，加倍记犯错', rev['group_id'], rev['user_id'], settings_load.new_member_time)
+
+            # 消息报告队列（分片时交给主进程统一汇总）
+            (self.report_sink or self.Add_Report)(rev['group_id'], rev['user_id'], fault, rev['time'], rev['message'])
+
+            # 犯错记录，根据统计周期内的犯错次数禁言或踢出
+            self.Punish(rev['group_id'], rev['user_id'], int(rev['time']), fault)
+        elif flood_record == 1:  # 内容正常的刷屏：不撤回不提醒，只报告并记犯错
+            (self.report_sink or self.Add_Report)(rev['group_id'], rev['user_id'], 1, rev['time'], rev['message'])
+            self.Punish(rev['group_id'], rev['user_id'], int(rev['time']), 1)
+
+    def Add_Report(self, group_id, user_id, num: int, msg_time: int, message: str):
+        '记录异常聊天，同一群聊的同一成员合并为一条：群号，QQ号，犯错次数，消息时间，消息内容'
+        key = (group_id, user_id)
+        TEMP0 = self.report_queue.get(key)
+        if TEMP0 is not None:  # 如果已有记录
+            TEMP0['num'] += num
+            TEMP0['time'] = msg_time  # 更新最后消息时间
+            TEMP0['message'] = message  # 更新最后消息内容
+        else:  # 如果没有记录，添加记录
+            TEMP0 = self.report_queue[key] = {'group_id': group_id, 'user_id': user_id,
+                                              'num': num, 'time': msg_time, 'message': message}
+        self.Save('report', (TEMP0['group_id'], TEMP0['user_id'], TEMP0['num'], TEMP0['time'], TEMP0['message']))
+
+    def Punish(self, group_id, user_id, now: int, fault: int = 1):
+        '记录成员犯错，统计周期（task_cycle分钟）内犯错次数达到标准时禁言或踢出：群号，QQ号，犯错时间，犯错次数'
+        record = self.offense_ledger.Add(group_id, user_id, now, fault)
+        if settings_load.gag_num != None:  # 如果有有效的初次禁言触发禁言数
+            # 如果犯错次数达到了禁言标准
+            if record.num >= int(settings_load.gag_num):
+                # 根据禁言设置规则禁言，禁言次数超过了预设的最大禁言次数则按最后的时间禁言
+                self.sink(group_ban, group_id, user_id, settings_load.gag_time[min(record.gag_num, len(settings_load.gag_time) - 1)])
+                record.gag_num += 1  # 记录已禁言次数
+        self.Save('offense', self.offense_ledger.Export(group_id, user_id))
+        if settings_load.fault_num != None:  # 如果有有效的最大过失数
+            # 如果犯错次数达到了移出群聊标准
+            if record.num >= int(settings_load.fault_num):
+                self.sink(group_kick, group_id, user_id)  # 将其移出群聊
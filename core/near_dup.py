@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA相似广告检测模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# MinHash：https://en.wikipedia.org/wiki/MinHash
+# 局部敏感哈希（LSH）分段：http://infolab.stanford.edu/~ullman/mmds/ch3.pdf
+# 单次哈希的MinHash（One Permutation Hashing）：https://arxiv.org/abs/1208.1259
+#
+# 被关键词判定为广告的消息会记下MinHash签名，签名按段放入哈希桶；之后的消息只需计算一次签名、查几个桶，
+# 就能知道是否与最近的广告几乎相同（只改了几个字），查询耗时与保存的消息数量无关。
+# 签名使用crc32计算，不同进程（多进程模式的各工作进程）算出的签名相同，可以互相共享。
+
+import zlib
+from collections import OrderedDict
+
+
+class Near_Dup_Index:
+    '相似文本索引：Add()记下一段已判定为广告的文本，Match()判断文本是否与其中某段几乎相同，超过保留时间或数量上限的记录自动清理'
+
+    def __init__(self, threshold: float = 0.6, ttl: int = 3600, max_size: int = 10000, num_hash: int = 24, band_rows: int = 3, shingle: int = 3, min_length: int = 8):
+        '创建索引：相似度阈值（0~1，估计的Jaccard相似度），保留时间（秒），最多保留的记录数，签名长度，每段的长度（签名长度需为其整数倍），分词长度（按字符），参与比较的最短文本长度'
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.num_hash = num_hash
+        self.band_rows = band_rows
+        self.shingle = shingle
+        self.min_length = min_length
+        self.records = OrderedDict()  # {签名: 加入时间}，按加入时间排序
+        self.buckets = {}  # {(段序号, 段内容): {签名, ...}}
+
+    def __len__(self):
+        return len(self.records)
+
+    def Signature(self, text: str):
+        '计算文本的MinHash签名（单次哈希：按哈希值分到各个位置，每个位置取最小值，空位置向后借用） 返回：tuple / None（文本过短）'
+        if len(text) < self.min_length:
+            return None
+        num_hash = self.num_hash
+        signature = [None] * num_hash
+        for TEMP0 in range(len(text) - self.shingle + 1):
+            TEMP1 = zlib.crc32(text[TEMP0:TEMP0 + self.shingle].encode('utf-8'))
+            TEMP2 = TEMP1 % num_hash
+            TEMP1 //= num_hash
+            if signature[TEMP2] is None or TEMP1 < signature[TEMP2]:
+                signature[TEMP2] = TEMP1
+        for TEMP0 in range(num_hash):  # 空位置使用后面第一个非空位置的值（加上距离，避免与原位置相同）
+            if signature[TEMP0] is None:
+                for TEMP1 in range(1, num_hash):
+                    TEMP2 = signature[(TEMP0 + TEMP1) % num_hash]
+                    if TEMP2 is not None and not isinstance(TEMP2, tuple):
+                        signature[TEMP0] = (TEMP1, TEMP2)
+                        break
+        return tuple(signature)
+
+    def Bands(self, signature: tuple) -> list:
+        '签名分段后的桶key 返回：list'
+        return [(TEMP0, signature[TEMP0:TEMP0 + self.band_rows]) for TEMP0 in range(0, self.num_hash, self.band_rows)]
+
+    def Expire(self, now: int):
+        '清理超过保留时间或超过数量上限的记录'
+        while self.records:
+            signature, TEMP0 = next(iter(self.records.items()))
+            if TEMP0 + self.ttl > now and len(self.records) <= self.max_size:
+                break
+            del self.records[signature]
+            for TEMP1 in self.Bands(signature):
+                TEMP2 = self.buckets.get(TEMP1)
+                if TEMP2 is not None:
+                    TEMP2.discard(signature)
+                    if not TEMP2:
+                        del self.buckets[TEMP1]
+
+    def Add(self, signature: tuple, now: int) -> bool:
+        '记下一个已判定为广告的签名（重复加入会更新时间）：Signature()的结果，当前时间 返回：bool，是否为新记录'
+        if signature is None:
+            return False
+        new = signature not in self.records
+        if new:
+            for TEMP0 in self.Bands(signature):
+                self.buckets.setdefault(TEMP0, set()).add(signature)
+        else:
+            self.records.move_to_end(signature)
+        self.records[signature] = now
+        self.Expire(now)
+        return new
+
+    def Match(self, signature: tuple, now: int) -> float:
+        '查找与签名最相似的记录：Signature()的结果，当前时间 返回：float，达到阈值的最高相似度，没有则为0'
+        if signature is None or not self.records:
+            return 0
+        self.Expire(now)
+        best = 0
+        checked = set()
+        for TEMP0 in self.Bands(signature):  # 至少有一段完全相同的才是候选
+            for TEMP1 in self.buckets.get(TEMP0, ()):
+                if TEMP1 in checked:
+                    continue
+                checked.add(TEMP1)
+                TEMP2 = sum(1 for TEMP3, TEMP4 in zip(signature, TEMP1) if TEMP3 == TEMP4) / self.num_hash
+                if TEMP2 > best:
+                    best = TEMP2
+        return best if best >= self.threshold else 0
+
+
+if __name__ == '__main__':  # 代码测试
+    import time
+    index = Near_Dup_Index(max_size=200000)
+    index.Add(index.Signature('出售游戏账号低价代练加微信abc123详聊'), 0)
+    for TEMP0 in range(100000):  # 大量无关记录不影响查询耗时
+        index.Add(index.Signature('随便聊聊天气怎么样第' + str(TEMP0) + '条消息内容'), 1)
+    time_start = time.perf_counter()
+    for TEMP0 in ['出售游戏账号低价代练加微信abc124详聊', '出售游戏账号超低价代练加微信abc123详聊', '今天晚上一起去吃火锅吧大家']:
+        print(TEMP0, index.Match(index.Signature(TEMP0), 2))
+    print((time.perf_counter() - time_start) / 3 * 1000, 'ms')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA犯错记录模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# 滑动窗口计数（分桶计数器）：https://en.wikipedia.org/wiki/Sliding_window_protocol
+
+from array import array
+from collections import OrderedDict
+
+
+class Offense_Record:
+    '单个成员的犯错记录：环形分桶计数器，只保存最近一个统计周期内的犯错次数'
+    __slots__ = ('counts', 'last_bucket', 'num', 'gag_num', 'last_time')
+
+    def __init__(self, bucket_num: int):
+        self.counts = array('I', bytes(4 * bucket_num))  # 每个桶内的犯错次数
+        self.last_bucket = 0  # 最后一次更新时所在的桶序号（绝对序号）
+        self.num = 0  # 统计周期内的犯错总次数
+        self.gag_num = 0  # 已禁言次数
+        self.last_time = 0  # 最后一次犯错的时间
+
+
+class Offense_Ledger:
+    '犯错记录表：按(群号, QQ号)索引，统计最近task_cycle分钟内的犯错次数（滑动窗口），更新和查询都是O(1)'
+
+    def __init__(self, window: int, bucket_num: int = 16):
+        '创建犯错记录表：统计周期（秒），周期分成的桶数（越多越精确，内存也越多）'
+        self.window = max(1, int(window))
+        self.bucket_num = max(1, int(bucket_num))
+        self.bucket_size = max(1, self.window // self.bucket_num)  # 每个桶覆盖的秒数
+        self.records = OrderedDict()  # 按最后犯错时间排序，方便清理过期记录
+
+    def __len__(self):
+        return len(self.records)
+
+    def Advance(self, record: Offense_Record, bucket: int):
+        '把记录推进到指定桶，清空已经滑出统计周期的桶'
+        TEMP0 = bucket - record.last_bucket
+        if TEMP0 <= 0:
+            return
+        if TEMP0 >= self.bucket_num:  # 整个周期都已过期
+            for TEMP1 in range(self.bucket_num):
+                record.counts[TEMP1] = 0
+            record.num = 0
+            record.gag_num = 0  # 一整个周期没有犯错，禁言次数也重新计算
+        else:
+            for TEMP1 in range(record.last_bucket + 1, bucket + 1):
+                TEMP1 %= self.bucket_num
+                record.num -= record.counts[TEMP1]
+                record.counts[TEMP1] = 0
+        record.last_bucket = bucket
+
+    def Add(self, group_id, user_id, now: int, num: int = 1) -> Offense_Record:
+        '记录犯错：群号，QQ号，犯错时间，犯错次数 返回：Offense_Record，其中num为统计周期内的犯错次数'
+        key = (int(group_id), int(user_id))
+        bucket = int(now) // self.bucket_size
+        record = self.records.get(key)
+        if record is None:
+            record = Offense_Record(self.bucket_num)
+            record.last_bucket = bucket
+            self.records[key] = record
+        else:
+            self.Advance(record, bucket)
+            self.records.move_to_end(key)
+        record.counts[bucket % self.bucket_num] += num
+        record.num += num
+        record.last_time = int(now)
+        return record
+
+    def Expire(self, now: int) -> list:
+        '清理整个统计周期内都没有犯错的记录 返回：list，清理的(群号, QQ号)'
+        removed = []
+        while self.records:
+            key, record = next(iter(self.records.items()))
+            if record.last_time + self.window + self.bucket_size > now:
+                break
+            del self.records[key]
+            removed.append(key)
+        return removed
+
+    def Export(self, group_id, user_id) -> tuple:
+        '导出一条记录，用于保存 返回：tuple，(群号, QQ号, 分桶计数, 桶序号, 犯错次数, 禁言次数, 最后犯错时间)'
+        key = (int(group_id), int(user_id))
+        record = self.records[key]
+        return key + (record.counts.tobytes(), record.last_bucket, record.num, record.gag_num, record.last_time)
+
+    def Import(self, row: tuple):
+        '导入Export()导出的记录（分桶数不同时只保留犯错次数）'
+        record = Offense_Record(self.bucket_num)
+        counts = array('I')
+        counts.frombytes(row[2])
+        if len(counts) == self.bucket_num:
+            record.counts = counts
+            record.last_bucket = row[3]
+        else:  # 分桶设置已改变，全部计入最后一个桶
+            record.last_bucket = int(row[6]) // self.bucket_size
+            record.counts[record.last_bucket % self.bucket_num] = row[4]
+        record.num, record.gag_num, record.last_time = row[4], row[5], row[6]
+        self.records[(int(row[0]), int(row[1]))] = record
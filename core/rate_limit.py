@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA限速及合并模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# 令牌桶算法：https://en.wikipedia.org/wiki/Token_bucket
+
+import threading
+from time import monotonic, sleep
+
+RATE_LIMITED = -3  # 限速时不等待的API调用返回的retcode，结果中的wait为需要等待的秒数
+
+
+class Token_Bucket:
+    '令牌桶：平均每秒rate个令牌，最多积攒burst个，可多线程同时使用'
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.last_time = monotonic()
+        self.lock = threading.Lock()
+
+    def Reserve(self) -> float:
+        '预定一个令牌（令牌不足时预支） 返回：float，需要等待的秒数'
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= 1
+            if self.tokens >= 0 or self.rate <= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def Wait_Time(self) -> float:
+        '不取令牌，查询还需要等待多久才有令牌 返回：float，需要等待的秒数，0为现在就有'
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            if self.tokens >= 1 or self.rate <= 0:
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class Rate_Limit:
+    '接口限速：每个API一个令牌桶，每个群聊再一个令牌桶，调用API前使用Acquire()等待令牌'
+    # 默认限速 {API名称: (每秒次数, 最多连续次数)}，"group"为每个群聊的总限速
+    DEFAULT = {
+        'send_group_msg': (1, 5),
+        'send_private_msg': (1, 3),
+        'delete_msg': (5, 10),
+        'set_group_ban': (3, 10),
+        'set_group_kick': (2, 5),
+        'set_group_whole_ban': (2, 5),
+        'group': (3, 10),
+    }
+
+    def __init__(self, conf: dict = {}):
+        '创建限速器：{API名称: (每秒次数, 最多连续次数)}，未设置的API使用默认值，每秒次数为0代表不限速'
+        self.conf = dict(Rate_Limit.DEFAULT)
+        self.conf.update(conf)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def Reload(self, conf: dict):
+        '更换限速设置，已有的令牌桶全部重建'
+        TEMP0 = dict(Rate_Limit.DEFAULT)
+        TEMP0.update(conf)
+        with self.lock:
+            self.conf = TEMP0
+            self.buckets = {}
+
+    def Get_Bucket(self, name: str, key):
+        '取出（或新建）令牌桶 返回：Token_Bucket / None（不限速）'
+        TEMP0 = self.conf.get(name)
+        if TEMP0 is None or float(TEMP0[0]) <= 0:
+            return None
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = Token_Bucket(*TEMP0)
+            return bucket
+
+    def Acquire(self, action: str, group_id=None, block: bool = True) -> float:
+        '等待API及群聊的令牌：API名称，群号（没有则只限制API），是否等待（False时令牌不足不取令牌，直接返回需要等待的时间） 返回：float，等待（或需要等待）的秒数'
+        buckets = [self.Get_Bucket(action, action)]
+        if group_id is not None:
+            buckets.append(self.Get_Bucket('group', ('group', int(group_id))))
+        buckets = [TEMP0 for TEMP0 in buckets if TEMP0 is not None]
+        if not block:
+            wait = max([TEMP0.Wait_Time() for TEMP0 in buckets] or [0])
+            if wait > 0:  # 交给调用者延后执行，不占用线程
+                return wait
+        wait = max([TEMP0.Reserve() for TEMP0 in buckets] or [0])
+        if wait > 0 and block:
+            sleep(wait)
+        return wait
+
+class Coalescer:
+    '合并重复操作：同一群聊在合并窗口内的多条提醒合并为一条艾特多人的消息，队列中尚未执行的同一成员的禁言或踢出只保留一个'
+
+    def __init__(self, tips_window: float = 2, max_tips: int = 2):
+        '创建合并器：提醒的合并窗口（秒），合并后最多保留的提醒内容条数'
+        self.tips_window = tips_window
+        self.max_tips = max_tips
+        self.pending = {}  # {合并key: 队列中操作的参数列表}
+        self.lock = threading.Lock()
+
+    def Key(self, func, args):
+        '操作的合并key，不能合并的操作为None'
+        name = func.__name__
+        if name == 'send_tips':
+            return ('tips', int(args[0]))
+        if name in ('group_ban', 'group_kick'):
+            return (name, int(args[0]), int(args[1]))
+        return None
+
+    def Merge(self, func, args: list) -> bool:
+        '尝试把操作合并到队列中尚未执行的同类操作 返回：bool，True为已合并（不需要再放入队列）'
+        key = self.Key(func, args)
+        if key is None:
+            return False
+        with self.lock:
+            TEMP0 = self.pending.get(key)
+            if TEMP0 is None:
+                self.pending[key] = args
+                return False
+            if key[0] == 'tips':  # 合并被艾特的成员和提醒内容
+                for TEMP1 in args[1]:
+                    if TEMP1 not in TEMP0[1]:
+                        TEMP0[1].append(TEMP1)
+                for TEMP1 in args[2]:
+                    if TEMP1 not in TEMP0[2] and len(TEMP0[2]) < self.max_tips:
+                        TEMP0[2].append(TEMP1)
+            elif key[0] == 'group_ban' and len(args) > 2:  # 重复禁言取最长的时间
+                if len(TEMP0) < 3 or int(args[2]) > int(TEMP0[2]):
+                    TEMP0[2:3] = [args[2]]
+            return True
+
+    def Done(self, func, args: list):
+        '操作即将执行，之后的同类操作不再合并到它'
+        key = self.Key(func, args)
+        if key is not None:
+            with self.lock:
+                if self.pending.get(key) is args:
+                    del self.pending[key]
+
+    def Delay(self, func) -> float:
+        '新操作放入队列前需要等待的时间（提醒需要等合并窗口结束） 返回：float'
+        return self.tips_window if func.__name__ == 'send_tips' else 0
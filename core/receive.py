@@ -1,76 +1,120 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-# Socket接收数据
+# HTTP接收GO-CQHTTP上报的事件
 # 作者：稽术宅（funnygeeker）
 # QGMA项目交流QQ群：332568832
 # 作者Bilibili：https://b23.tv/b39RG2r
 # Github：https://github.com/funnygeeker/qgma
 #
 # 参考资料：
-# 通过socket进行数据接收：https://blog.csdn.net/qq_44809707/article/details/119959864
-# 超长socket数据接收：https://developer.aliyun.com/article/456224
+# GO-CQHTTP HTTP POST上报：https://docs.go-cqhttp.org/guide/config.html
+# http.server模块：https://docs.python.org/zh-cn/3/library/http.server.html
 
-import socket
-import json
+import queue
+import threading
+from time import perf_counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from core.log_mgt import logger
+from core.settings_load import *
+from core.chat_mgt import route_event
+from core.metrics import metrics, Metrics_Mgt
+from core.capture import capture
+from core.ingest import ingest_filter
+
+
+class Event_Handler(BaseHTTPRequestHandler):
+    '处理GO-CQHTTP的HTTP POST上报：按Content-Length读取请求体，支持HTTP/1.1长连接'
+    protocol_version = 'HTTP/1.1'  # 默认保持连接，同一连接可连续上报多个事件
+    max_body = 1024 * 1024  # 单个事件最大1MB
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > Event_Handler.max_body:  # 数据长度不合法或过长
+            self.send_error(413)
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)  # 一次读取完整请求体，不会被TCP分片截断
+        recv_time = perf_counter()
+        self.send_response(204)  # 返回接收成功状态码（无快速操作）
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        capture.Write(body)  # 启用了录制时保存原始事件，用于离线重放
+        try:
+            rev_json = ingest_filter.Decode(body)  # 多余的心跳和不在管理范围内的群聊事件不解析，直接丢弃
+        except ValueError:
+            logger.warning('【接收】无法解析的上报数据：' + body[:200].decode('utf-8', 'replace'))
+            return
+        if rev_json is not None:
+            rev_json['_recv_time'] = recv_time  # 用于统计从收到事件到处理完成的延迟
+            metrics.Inc('qgma_events_received_total', Metrics_Mgt.Event_Labels(rev_json))
+            if getattr(self.server, 'self_id', None) is not None:  # 多账号：补上事件所属的账号
+                rev_json.setdefault('self_id', self.server.self_id)
+            if route_event(rev_json):  # 多账号时丢弃其他账号收到的同一群聊的重复事件
+                Receive.event_queue.put(rev_json)  # 交给消息处理线程
+
+    def log_message(self, format, *args):  # 不在控制台打印每个请求
+        pass
 
 
 class Receive:
-    'Socket接收数据，接收消息请使用Rev_Msg()函数'
+    'HTTP接收数据（多线程处理连接），接收消息请使用Rev_Msg()函数'
     server_addr = '0.0.0.0'  # 默认监听ip
-    server_event_port = 5701  # 默认监听端口
-    ListenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    ListenSocket.bind((server_addr, server_event_port))
-    ListenSocket.listen(100)
-    HttpResponseHeader = "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n"
+    server_event_port = server_rec_port  # 监听端口（settings/server/server_rec_port.txt）
+    event_queue = queue.Queue(10000)  # 已解析的事件，队列满时上报连接会等待（背压）
+    server = None
+
+    def Start(server_addr: str = None, server_event_port: int = None):
+        '启动事件接收服务（后台线程），已启动则忽略：监听ip，监听端口'
+        if Receive.server is not None:
+            return
+        if server_addr is not None:
+            Receive.server_addr = server_addr
+        if server_event_port is not None:
+            Receive.server_event_port = int(server_event_port)
+        Receive.server = Receive.Listen(Receive.server_addr, Receive.server_event_port)
+
+    def Listen(server_addr, server_event_port, self_id=None):
+        '启动一个事件接收服务（后台线程），所有服务接收的事件都放入同一个队列：监听ip，监听端口，该端口所属的机器人QQ号（多账号时使用） 返回：ThreadingHTTPServer'
+        server = ThreadingHTTPServer((server_addr, int(server_event_port)), Event_Handler)
+        server.daemon_threads = True
+        server.self_id = self_id
+        threading.Thread(target=server.serve_forever, name='Receive_' + str(server_event_port), daemon=True).start()
+        logger.info('【接收】正在监听 ' + server_addr + ':' + str(server_event_port) + ('' if self_id is None else '（账号 ' + str(self_id) + '）'))
+        return server
+
+    def Stop():
+        '停止事件接收服务'
+        if Receive.server is not None:
+            Receive.server.shutdown()
+            Receive.server.server_close()
+            Receive.server = None
 
     def Reset_Listen_Port(server_addr, server_event_port):
         '重新设置监听端口'
-        Receive.ListenSocket = socket.socket(
-            socket.AF_INET, socket.SOCK_STREAM)
-        Receive.ListenSocket.bind((server_addr, server_event_port))
-
-    def Request_To_Json(msg):
-        '将接收到的数据转化为json 返回：json'
-        for i in range(len(msg)):
-            if msg[i] == "{" and msg[-1] == "\n":
-                return json.loads(msg[i:])
-        else:
+        Receive.Stop()
+        Receive.Start(server_addr, server_event_port)
+
+    def Rev_Msg(timeout: float = None):
+        '【线程阻塞】接收的消息（没有进行过滤），首次调用时自动启动接收服务 返回：json / None（超时）'
+        if Receive.server is None:
+            Receive.Start()
+        try:
+            return Receive.event_queue.get(timeout=timeout)
+        except queue.Empty:
             return None
 
-    def Rev_Msg():
-        '【线程阻塞】接收的消息（没有进行过滤） 返回：json / None'
-        Client, Address = Receive.ListenSocket.accept()
-        # 长数据接收
-        total_data = bytes()
-        cycle_num = 0  # 循环计数，以防接收数据过长
-
-        while True:
-            # 将收到的数据拼接起来
-            rev_data = Client.recv(1024)
-            total_data += rev_data  # 与当前接收到的数据合并
-            cycle_num += 1  # 循环次数计数
-            if len(rev_data) < 1024:  # 如果数据接收完成
-                Request = total_data.decode(encoding='utf-8')  # 解码接收到的数据
-                rev_Json = Receive.Request_To_Json(Request)  # 将接收到的数据转化为json
-                Client.sendall((Receive.HttpResponseHeader).encode(
-                    encoding='utf-8'))  # 返回接收成功状态码
-                Client.close()  # 断开连接
-                #print(rev_json)#
-                return rev_Json
-            elif cycle_num >= 1024:
-                Client.close()  # 断开连接
-                return None  # 数据过长（大于1024kb）的返回内容
 
+metrics.Gauge('qgma_event_queue_size', '已接收、等待处理的事件数', Receive.event_queue.qsize)
 
 if __name__ == '__main__':
     while True:
         # 对消息进行过滤
-        try:
-            rev = Receive.Rev_Msg()
-            print(rev)
-            if rev == None:
-                continue
-        except:
+        rev = Receive.Rev_Msg()
+        if rev == None:
             continue
         print(str(rev)+'\n--------------------------')
         #Receive.Reset_Listen_Port('0.0.0.0', 5700)
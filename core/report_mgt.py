@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA异常聊天报告模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+
+from datetime import datetime
+
+from core.chat_mgt import send_msg_private, api_ok
+
+
+class Report_Mgt:
+    '异常聊天报告：把本周期的所有记录按群聊和用户汇总为一份简报，按长度分页，每个管理员只需发送几条消息'
+
+    def Build_Digest(report_list: list, page_size: int = 1500, message_size: int = 50) -> list:
+        '生成简报：报告记录列表（group_id/user_id/num/time/message），每页最多字数，每条异常消息最多显示的字数 返回：list，每页的文本'
+        groups = {}
+        for TEMP0 in report_list:
+            groups.setdefault(TEMP0['group_id'], []).append(TEMP0)
+        # 犯错次数多的群聊和用户排在前面
+        group_list = sorted(groups.items(), key=lambda TEMP0: -sum(TEMP1['num'] for TEMP1 in TEMP0[1]))
+
+        lines = ['以下为本周期的异常聊天报告：',
+                 '共 ' + str(len(group_list)) + ' 个群聊，' + str(len(report_list)) + ' 位用户，' +
+                 str(sum(TEMP0['num'] for TEMP0 in report_list)) + ' 次异常']
+        for group_id, users in group_list:
+            users.sort(key=lambda TEMP0: -TEMP0['num'])
+            lines.append('')
+            lines.append('群聊：' + str(group_id) + '（' + str(len(users)) + ' 人，共 ' + str(sum(TEMP0['num'] for TEMP0 in users)) + ' 次）')
+            for TEMP0 in users:
+                message = str(TEMP0['message']).replace('\n', ' ')
+                if len(message) > message_size:
+                    message = message[:message_size] + '…'
+                lines.append('· ' + str(TEMP0['user_id']) + '：' + str(TEMP0['num']) + ' 次，最后 ' +
+                             datetime.fromtimestamp(int(TEMP0['time'])).strftime('%m-%d %H:%M') + '：' + message)
+
+        # 按长度分页，单行不会被拆开
+        pages = []
+        page = ''
+        for TEMP0 in lines:
+            if page != '' and len(page) + len(TEMP0) + 1 > page_size:
+                pages.append(page)
+                page = ''
+            page += ('\n' if page != '' else '') + TEMP0
+        if page != '':
+            pages.append(page)
+        if len(pages) > 1:
+            pages = [TEMP0 + '\n（' + str(TEMP1 + 1) + '/' + str(len(pages)) + '）' for TEMP1, TEMP0 in enumerate(pages)]
+        return pages
+
+
+def send_report(user_id, pages, interval=1):  # 发送简报的第一页，剩下的页由出站操作队列在interval秒后继续发送，不占用工作线程【对方QQ号，每页的文本，每页之间的间隔，单位：秒】
+    if pages == []:
+        return {'status': 'ok', 'retcode': 0, 'data': None}
+    result = send_msg_private(user_id, pages[0])
+    if api_ok(result) and len(pages) > 1:  # next为剩下的页（作为下次调用的参数），失败重试时只重发未发出的页
+        result = dict(result, wait=interval, next=[user_id, pages[1:], interval])
+    return result
@@ -1,40 +1,101 @@
+import os
+import pickle
+import tempfile
+
 from core.operation_txt import *
 from core.text_mgt import *
 
-try: bot_user_id = str(Text_Mgt.List_Read_Text('settings/basic/bot_user_id.txt','#')[0])
-except: bot_user_id = ''
-try: group_manage = Text_Mgt.List_Read_Text('settings/basic/group_manage.txt','#')[0:6]
-except: group_manage = []
-try: admin_user_id = Text_Mgt.List_Read_Text('settings/basic/admin_user_id.txt','#')[0:3]
-except: admin_user_id = []
-try: curfew_time = Text_Mgt.List_Read_Text('settings/basic/curfew_time.txt','#')[0:2]
-except: curfew_time = []
-try: task_cycle = int(Text_Mgt.List_Read_Text('settings/basic/task_cycle.txt','#')[0])
-except: task_cycle = 4320
-try: report_cycle = Text_Mgt.List_Read_Text('settings/basic/report_cycle.txt','#')[0:2]
-except: report_cycle = []
-
-try: server_send_port = int(Text_Mgt.List_Read_Text('settings/server/server_send_port.txt','#')[0])
-except: server_send_port = 5700
-try: server_rec_port = int(Text_Mgt.List_Read_Text('settings/server/server_rec_port.txt','#')[0])
-except: server_rec_port = 5701
-try: server_ip = str(Text_Mgt.List_Read_Text('settings/server/server_ip.txt','#')[0])
-except: server_ip = '0.0.0.0'
-
-try: del_msg_time = int(Text_Mgt.List_Read_Text('settings/member/del_msg_time.txt','#')[0])
-except: del_msg_time = None
-try: gag_num = int(Text_Mgt.List_Read_Text('settings/member/gag_num.txt','#')[0])
-except: gag_num = None
-try: fault_num = int(Text_Mgt.List_Read_Text('settings/member/fault_num.txt','#')[0])
-except: fault_num = None
-try: gag_time = Text_Mgt.List_Read_Text('settings/member/gag_time.txt','#')[0:64]
-except: gag_time = [10]
-
-try: ads_word = Text_Mgt.List_Read_Text('settings/word/ads_word.txt','#')[0:256]
-except: ads_word = []
-try: bad_word = Text_Mgt.List_Read_Text('settings/word/bad_word.txt','#')[0:256]
-except: bad_word = []
-try: ads_word_tips = Text_Mgt.List_Read_Text('settings/chat/ads_word_tips.txt','#')[0:64]
-except: ads_word_tips = []
-try: bad_word_tips = Text_Mgt.List_Read_Text('settings/chat/bad_word_tips.txt','#')[0:64]
-except: bad_word_tips = []
\ No newline at end of file
+SETTINGS_CACHE = 'data/settings_cache.pickle'  # 设置快照 {文件路径: (修改时间, 文件大小, 文件编码, 去掉注释后的行列表)}
+
+# 所有设置 {设置名称: (文件路径, 解析函数, 默认值)}，解析函数的参数为去掉注释后的行列表，解析失败时使用默认值
+SETTINGS = {
+    'bot_user_id': ('settings/basic/bot_user_id.txt', lambda TEMP0: str(TEMP0[0]), ''),
+    'group_manage': ('settings/basic/group_manage.txt', lambda TEMP0: TEMP0, []),
+    'admin_user_id': ('settings/basic/admin_user_id.txt', lambda TEMP0: TEMP0, []),
+    'curfew_time': ('settings/basic/curfew_time.txt', lambda TEMP0: TEMP0[0:2], []),
+    'group_curfew': ('settings/basic/group_curfew.txt', lambda TEMP0: {TEMP1.split()[0]: TEMP1.split()[1:3] for TEMP1 in TEMP0}, {}),
+    'task_cycle': ('settings/basic/task_cycle.txt', lambda TEMP0: int(TEMP0[0]), 4320),
+    'report_cycle': ('settings/basic/report_cycle.txt', lambda TEMP0: TEMP0[0:2], []),
+    'engine_mode': ('settings/basic/engine_mode.txt', lambda TEMP0: str(TEMP0[0]).strip().lower(), 'thread'),
+    'banner_sleep': ('settings/basic/banner_sleep.txt', lambda TEMP0: int(TEMP0[0]) == 1, False),
+    'debug_sample': ('settings/basic/debug_sample.txt', lambda TEMP0: max(1, int(TEMP0[0])), 1),
+    'member_refresh': ('settings/basic/member_refresh.txt', lambda TEMP0: max(1, int(TEMP0[0])), None),
+
+    'server_send_port': ('settings/server/server_send_port.txt', lambda TEMP0: int(TEMP0[0]), 5700),
+    'server_rec_port': ('settings/server/server_rec_port.txt', lambda TEMP0: int(TEMP0[0]), 5701),
+    'server_ip': ('settings/server/server_ip.txt', lambda TEMP0: str(TEMP0[0]), '0.0.0.0'),
+    'rate_limit_conf': ('settings/server/rate_limit.txt', lambda TEMP0: {TEMP1.split()[0]: (float(TEMP1.split()[1]), float(TEMP1.split()[2])) for TEMP1 in TEMP0}, {}),
+    'action_worker_num': ('settings/server/action_worker_num.txt', lambda TEMP0: int(TEMP0[0]), 4),
+    'state_file': ('settings/server/state_file.txt', lambda TEMP0: str(TEMP0[0]).strip(), ''),
+    'backends': ('settings/server/backends.txt', lambda TEMP0: [(int(TEMP1.split()[0]), TEMP1.split()[1], int(TEMP1.split()[2]), int(TEMP1.split()[3])) for TEMP1 in TEMP0], []),
+    'shard_num': ('settings/server/shard_num.txt', lambda TEMP0: max(1, int(TEMP0[0])), os.cpu_count() or 1),
+    'capture_file': ('settings/server/capture_file.txt', lambda TEMP0: str(TEMP0[0]).strip(), ''),
+    'metrics_addr': ('settings/server/metrics_port.txt', lambda TEMP0: (TEMP0[0].split()[0] if len(TEMP0[0].split()) == 2 else '127.0.0.1', int(TEMP0[0].split()[-1])), None),
+
+    'del_msg_time': ('settings/member/del_msg_time.txt', lambda TEMP0: int(TEMP0[0]), None),
+    'gag_num': ('settings/member/gag_num.txt', lambda TEMP0: int(TEMP0[0]), None),
+    'fault_num': ('settings/member/fault_num.txt', lambda TEMP0: int(TEMP0[0]), None),
+    'gag_time': ('settings/member/gag_time.txt', lambda TEMP0: TEMP0[0:64], [10]),
+    'new_member_time': ('settings/member/new_member_time.txt', lambda TEMP0: int(TEMP0[0]), None),
+    'flood_limit': ('settings/member/flood_limit.txt', lambda TEMP0: [(int(TEMP1.split()[0]), int(TEMP1.split()[1])) for TEMP1 in TEMP0], []),
+
+    'ads_word': ('settings/word/ads_word.txt', lambda TEMP0: TEMP0, []),
+    'bad_word': ('settings/word/bad_word.txt', lambda TEMP0: TEMP0, []),
+    'allow_word': ('settings/word/allow_word.txt', lambda TEMP0: TEMP0, []),
+    'ads_similar': ('settings/word/ads_similar.txt', lambda TEMP0: (float(TEMP0[0].split()[0]), int(TEMP0[0].split()[1])), None),
+    'ads_word_tips': ('settings/chat/ads_word_tips.txt', lambda TEMP0: TEMP0[0:64], []),
+    'bad_word_tips': ('settings/chat/bad_word_tips.txt', lambda TEMP0: TEMP0[0:64], []),
+    'tips_window': ('settings/chat/tips_window.txt', lambda TEMP0: float(TEMP0[0]), 2),
+}
+# 修改后需要重启程序才能生效的设置（监听端口、连接池、线程数等在启动时就已创建）
+RESTART_SETTINGS = {'task_cycle', 'engine_mode', 'server_send_port', 'server_rec_port', 'server_ip', 'action_worker_num', 'state_file', 'shard_num', 'backends', 'metrics_addr'}
+
+
+try:
+    with open(SETTINGS_CACHE, 'rb') as TEMP0: settings_cache = pickle.load(TEMP0)
+except: settings_cache = {}
+settings_cache_changed = False
+
+
+def Read_Setting_File(file_path: str) -> list:
+    '读取设置文件（去掉注释行），文件的修改时间和大小都没变时直接使用快照，不再检测编码 返回：list'
+    global settings_cache_changed
+    stat = os.stat(file_path)  # 文件不存在时抛出异常
+    TEMP0 = settings_cache.get(file_path)
+    if TEMP0 is not None and TEMP0[0] == stat.st_mtime_ns and TEMP0[1] == stat.st_size:
+        return list(TEMP0[3])
+    encoding = Text_Mgt.Encodeing_Detect(file_path)
+    lines = Text_Mgt.List_Read_Text(file_path, '#', encoding=encoding)
+    settings_cache[file_path] = (stat.st_mtime_ns, stat.st_size, encoding, lines)
+    settings_cache_changed = True
+    return list(lines)
+
+
+def Save_Settings_Cache():
+    '设置快照有更新时写入文件（先写临时文件再替换，避免写到一半；每次使用不同的临时文件，多个进程同时写入也不会互相覆盖）'
+    global settings_cache_changed
+    if not settings_cache_changed:
+        return
+    settings_cache_changed = False
+    TEMP1 = None
+    try:
+        os.makedirs(os.path.dirname(SETTINGS_CACHE), exist_ok=True)
+        TEMP0, TEMP1 = tempfile.mkstemp(prefix=os.path.basename(SETTINGS_CACHE) + '.', suffix='.tmp', dir=os.path.dirname(SETTINGS_CACHE))
+        with os.fdopen(TEMP0, 'wb') as TEMP0:
+            pickle.dump(settings_cache, TEMP0, pickle.HIGHEST_PROTOCOL)
+        os.replace(TEMP1, SETTINGS_CACHE)
+    except OSError:  # 快照只用于加快启动，写入失败不影响运行
+        if TEMP1 is not None:
+            try: os.remove(TEMP1)
+            except OSError: pass
+
+
+def Load_Setting(name: str):
+    '读取并解析一项设置，文件不存在或格式错误时返回默认值 返回：设置的值'
+    file_path, parse, default = SETTINGS[name]
+    try: return parse(Read_Setting_File(file_path))
+    except: return default
+
+
+globals().update({TEMP0: Load_Setting(TEMP0) for TEMP0 in SETTINGS})
+Save_Settings_Cache()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA设置热加载模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+
+import os
+import threading
+from time import sleep
+
+import core.settings_load as settings_load
+from core.settings_load import SETTINGS, RESTART_SETTINGS, Load_Setting, Save_Settings_Cache
+from core.log_mgt import Log_Mgt, logger
+
+
+class Settings_Mgt:
+    '设置热加载：后台线程定时检查设置文件的修改时间和inode，只重新读取有变化的文件，值改变的设置一次性交给Watch()注册的函数应用'
+
+    def __init__(self, interval: float = 2):
+        '创建设置管理：检查间隔（秒）'
+        self.interval = interval
+        self.paths = {}  # {文件路径: [设置名称, ...]}
+        for TEMP0, TEMP1 in SETTINGS.items():
+            self.paths.setdefault(TEMP1[0], []).append(TEMP0)
+        self.stats = {TEMP0: Settings_Mgt.Stat(TEMP0) for TEMP0 in self.paths}
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def Stat(file_path: str):
+        '文件的修改时间、inode和大小，文件不存在则为None 返回：tuple / None'
+        try:
+            TEMP0 = os.stat(file_path)
+        except OSError:
+            return None
+        return (TEMP0.st_mtime_ns, TEMP0.st_ino, TEMP0.st_size)
+
+    def Watch(self, callback):
+        '注册设置改变时调用的函数，调用方式为 callback({设置名称: 新的值})，在检查线程中调用'
+        self.callbacks.append(callback)
+
+    def Check(self) -> dict:
+        '检查一次设置文件，只重新读取有变化的文件 返回：dict，值发生改变且可以热加载的设置 {设置名称: 新的值}'
+        changed = {}
+        with self.lock:
+            for file_path, names in self.paths.items():
+                TEMP0 = Settings_Mgt.Stat(file_path)
+                if TEMP0 == self.stats[file_path]:
+                    continue
+                self.stats[file_path] = TEMP0
+                for name in names:
+                    value = Load_Setting(name)
+                    if value == getattr(settings_load, name):
+                        continue
+                    if name in RESTART_SETTINGS:
+                        logger.warning('【设置】' + file_path + ' 已修改，需要重启程序才能生效')
+                        continue
+                    changed[name] = value
+            vars(settings_load).update(changed)  # 之后导入的模块读取到的也是新设置
+            Save_Settings_Cache()
+        return changed
+
+    def Reload(self) -> dict:
+        '检查设置文件，并把改变的设置交给所有注册的函数 返回：dict，改变的设置'
+        changed = self.Check()
+        if changed != {}:
+            logger.info('【设置】已重新加载：' + '，'.join(changed))
+            self.Notify(changed)
+        return changed
+
+    def Apply(self, changed: dict):
+        '应用其他进程检查到的设置改变（多进程模式的工作进程不检查设置文件，由主进程转发）：{设置名称: 新的值}'
+        with self.lock:
+            vars(settings_load).update(changed)
+        self.Notify(changed)
+
+    def Notify(self, changed: dict):
+        '把改变的设置交给所有注册的函数'
+        for TEMP0 in self.callbacks:
+            try:
+                TEMP0(changed)
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+    def Run(self):
+        '检查线程：每隔interval秒检查一次'
+        while True:
+            sleep(self.interval)
+            try:
+                self.Reload()
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+    def Start(self):
+        '启动后台检查线程（重复调用无效）'
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.Run, name='Settings_Mgt', daemon=True)
+            self.thread.start()
+
+
+settings_mgt = Settings_Mgt()
@@ -1,5 +1,12 @@
 import time
 from core.settings_load import *
+
+
+def Banner_Sleep(seconds):  # 启用了启动停顿时才停顿，方便阅读设置信息
+    if banner_sleep:
+        time.sleep(seconds)
+
+
 print('''
 --------------------正在初始化--------------------
 -【欢迎使用：极客街-Q群管理助手-V1.1.3_220501】-
@@ -15,31 +22,48 @@ print('''
 作者技术社区官网：https://geekjie.com
 Python小白早期作品，不喜勿喷！
 ''')
-time.sleep(2)
+Banner_Sleep(2)
 print('---------------------基本设置---------------------')
 print('机器人QQ号:', bot_user_id)
 print('需要管理的QQ群:', group_manage)
 print('机器人管理员QQ号:', admin_user_id)
 print('群聊宵禁时间范围:', curfew_time)
+print('单独设置宵禁时间的群聊:', str(len(group_curfew)) + ' 个' if group_curfew != {} else '无')
 print('撤回禁言等任务执行周期:', task_cycle, '分')
+print('群成员列表刷新间隔:', str(member_refresh) + ' 分' if member_refresh != None else '不获取（只根据入群退群等通知更新）')
 print('异常场聊天报告发送周期:', report_cycle, '秒')
-time.sleep(2)
+print('运行模式:', engine_mode)
+print('启动停顿:', '开启' if banner_sleep else '关闭')
+print('事件调试日志采样:', '每条都记录' if debug_sample == 1 else '每' + str(debug_sample) + '条记录1条')
+Banner_Sleep(2)
 print('---------------------服务设置---------------------')
 print('GO-CQHTTP发送端口:', server_send_port)
 print('GO-CQHTTP接收端口:', server_rec_port)
 print('GO-CQHTTP服务所在IP:', server_ip)
-time.sleep(2)
+print('其他账号:', '，'.join(str(TEMP0[0]) + '（' + TEMP0[1] + ':' + str(TEMP0[2]) + '，接收端口' + str(TEMP0[3]) + '）' for TEMP0 in backends) if backends != [] else '无')
+print('出站操作工作线程数:', action_worker_num)
+print('多进程模式工作进程数:', shard_num)
+print('接口限速设置:', rate_limit_conf if rate_limit_conf != {} else '默认')
+print('运行指标:', 'http://' + metrics_addr[0] + ':' + str(metrics_addr[1]) + '/metrics' if metrics_addr != None else '关闭')
+print('上报事件录制文件:', capture_file if capture_file != '' else '不录制')
+print('状态保存文件:', state_file if state_file != '' else '不保存')
+Banner_Sleep(2)
 print('---------------------成员设置---------------------')
 print('成员消息撤回间隔:', del_msg_time, '秒')
 print('成员首次禁言次数:', gag_num, '次')
 print('成员最大犯错次数:', fault_num, '次')
 print('成员禁言规则列表:', gag_time)
-time.sleep(2)
+print('新成员加倍记犯错:', '入群 ' + str(new_member_time) + ' 分钟内' if new_member_time != None else '未启用')
+print('成员刷屏规则:', '，'.join(str(TEMP1) + '秒内超过' + str(TEMP0) + '条' for TEMP0, TEMP1 in flood_limit) if flood_limit != [] else '未启用')
+Banner_Sleep(2)
 print('---------------------群管词库---------------------')
 print('广告词库:', len(ads_word), '条')
 print('脏话词库:', len(bad_word), '条')
+print('关键词白名单:', len(allow_word), '条')
+print('相似广告识别:', '相似度 ' + str(ads_similar[0]) + '，保留 ' + str(ads_similar[1]) + ' 秒' if ads_similar != None else '未启用')
 print('广告消息提示:', len(ads_word_tips), '条')
 print('脏话消息提示:', len(bad_word_tips), '条')
+print('提醒合并窗口:', tips_window, '秒')
 print('-----------------配置文件加载完毕-----------------')
-time.sleep(1)
+Banner_Sleep(1)
 print('【信息】群聊协管机器人启动完成......')
\ No newline at end of file
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA多进程分片模式
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 主进程只负责接收事件和调用API：群聊事件按群号分给工作进程，
+# 每个工作进程各自保存所管群聊的犯错记录、撤回队列和宵禁，消息分类等计算在工作进程中完成，
+# 需要执行的操作和异常聊天记录交回主进程，由出站操作队列统一合并、限速后执行，异常聊天报告也由主进程统一汇总发送。
+# 设置文件的检查和群成员列表的获取（调用API）也只在主进程进行，结果通过事件队列转发给工作进程。
+
+import os
+import queue
+import threading
+import multiprocessing
+from time import time, sleep, monotonic
+
+from core.log_mgt import Log_Mgt, logger
+import core.settings_load as settings_load
+from core.settings_load import *
+from core.action_queue import Action_Queue, action_queue
+from core.receive import Receive
+from core.moderation import Moderation
+from core.member_mgt import Member_Directory
+from core.state_store import State_Store
+from core.settings_mgt import settings_mgt
+from core.metrics import metrics
+
+
+def Shard_Of(group_id, shard_num: int) -> int:
+    '群聊所属的分片序号 返回：int'
+    return int(group_id) % shard_num
+
+
+def Shard_State_File(state_file: str, index: int) -> str:
+    '分片工作进程的状态保存文件（每个分片一个文件），不保存则为空 返回：str'
+    if state_file == '':
+        return ''
+    TEMP0, TEMP1 = os.path.splitext(state_file)
+    return TEMP0 + '_shard' + str(index) + TEMP1
+
+
+def Shard_Worker(index: int, shard_num: int, event_queue, action_out, state_file: str):
+    '分片工作进程：处理分到本分片的事件和定时任务，操作和异常聊天记录交回主进程'
+    Log_Mgt.Log_Conf('QGMA_shard' + str(index) + '.log')  # 每个进程单独的日志文件，避免同时切分日志
+    Log_Mgt.debug_sample = debug_sample
+    store = State_Store(state_file) if state_file != '' else None
+    moderation = Moderation(lambda func, *args: action_out.put((func.__name__, args)), store,
+                            own_group=lambda group_id: Shard_Of(group_id, shard_num) == index,
+                            report_sink=lambda *args: action_out.put(('Add_Report', args)),
+                            similar_sink=lambda *args: action_out.put(('Add_Similar', (index,) + args)))
+    lock = threading.Lock()
+    metrics.Drop_Gauge('qgma_action_queue_size')  # 出站操作在主进程执行
+    metrics.Drop_Gauge('qgma_action_retrying')
+    try:
+        event_queue.qsize()  # 部分系统（如macOS）不支持读取多进程队列的长度
+        metrics.Gauge('qgma_event_queue_size', '已接收、等待处理的事件数', event_queue.qsize)
+    except NotImplementedError:
+        metrics.Drop_Gauge('qgma_event_queue_size')
+
+    def Settings_Reload(changed):  # 设置热加载：在锁外重建关键词自动机等对象，再一次性应用
+        if 'debug_sample' in changed:
+            Log_Mgt.debug_sample = changed['debug_sample']
+        built = moderation.Build_Settings(changed)
+        with lock:
+            moderation.Apply_Settings(changed, built)
+    settings_mgt.Watch(Settings_Reload)  # 设置由主进程检查后转发，工作进程不检查设置文件
+    moderation.Start_Members(load=False)  # 成员列表由主进程获取（经过接口限速）后转发给所属的分片
+    action_out.put(('Ready', (index,)))  # 初始化完成，主进程收齐后才开始接收事件
+
+    parent = multiprocessing.parent_process()
+    last_metrics = 0
+    while parent is None or parent.is_alive():  # 主进程退出后自动退出
+        with lock:  # 与多线程模式相同：等到下一个定时任务到期（换算为本地时间），有新事件时提前醒来
+            deadline = moderation.Next_Deadline()
+            if deadline is not None:
+                deadline -= time() + int(moderation.time_difference or 0)
+        try:
+            # 没有定时任务时最多等待1秒，以便检查主进程是否还在运行、发送运行指标
+            rev = event_queue.get(timeout=1 if deadline is None else min(1, max(0, deadline)))
+        except queue.Empty:
+            rev = None
+        if isinstance(rev, tuple) and rev[0] == 'Settings':  # 主进程转发的设置改变（在锁外重建关键词自动机等对象）
+            try:
+                settings_mgt.Apply(rev[1])
+            except:
+                logger.error(Log_Mgt.Get_Error())
+            rev = None
+        with lock:
+            try:
+                if isinstance(rev, tuple):  # 主进程转发的消息：其他分片发现的广告，获取到的成员列表
+                    name, args = rev
+                    if name == 'Add_Similar':
+                        moderation.Add_Similar(*args)
+                    elif name == 'Members':
+                        moderation.members.Put_Loaded(*args)
+                        moderation.members.Apply_Loaded()
+                elif rev is not None:
+                    moderation.Handle_Event(rev)
+                moderation.Handle_Task()  # 每个事件之后都处理到期的定时任务，刚加入的撤回任务到期即执行
+                if metrics_addr != None and monotonic() - last_metrics >= 2:  # 启用了运行指标时，定时把本进程的指标发给主进程
+                    action_out.put(('Metrics', (index, metrics.Snapshot())))
+                    last_metrics = monotonic()
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+
+class Shard_Engine:
+    '多进程分片模式：主进程接收事件，按群号分给多个工作进程处理，所有操作和报告交回主进程合并执行，使用Run()启动'
+    FUNCS = {TEMP0.__name__: TEMP0 for TEMP0 in Action_Queue.PRIORITY}  # 工作进程只能传回函数名
+
+    def __init__(self, shard_num: int, worker_num: int = 4, store: State_Store = None, state_file: str = '', max_size: int = 10000):
+        '创建分片引擎：工作进程数，出站操作工作线程数，主进程的状态保存（异常聊天报告等），状态保存文件路径（用于生成各分片的文件名），每个分片的事件队列最大长度'
+        self.shard_num = max(1, int(shard_num))
+        self.worker_num = worker_num
+        self.store = store
+        self.state_file = state_file
+        self.max_size = max_size
+        self.event_queues = []
+        self.workers = []
+        self.lock = threading.Lock()
+        self.task_wake = threading.Event()  # 有新的定时任务（或设置改变）时唤醒定时任务线程
+        self.members = Member_Directory()  # 只用于获取所有分片的成员列表，获取到的列表转发给所属的分片
+        # 主进程不处理群聊消息，只处理私聊、时差校准，以及汇总所有分片的异常聊天报告
+        self.moderation = Moderation(action_queue.Put, store, own_group=lambda group_id: False)
+
+    def Start_Workers(self):
+        '启动所有分片工作进程'
+        context = multiprocessing.get_context('spawn')  # Windows只支持spawn，各平台保持一致
+        self.action_in = context.Queue()
+        for TEMP0 in range(self.shard_num):
+            event_queue = context.Queue(self.max_size)
+            worker = context.Process(target=Shard_Worker, name='Shard_' + str(TEMP0), daemon=True,
+                                     args=(TEMP0, self.shard_num, event_queue, self.action_in, Shard_State_File(self.state_file, TEMP0)))
+            worker.start()
+            self.event_queues.append(event_queue)
+            self.workers.append(worker)
+        # 等待所有工作进程初始化完成（spawn需要重新导入模块、读取设置），避免先收到的事件在队列中积压
+        ready = set()
+        while len(ready) < self.shard_num:
+            try:
+                name, args = self.action_in.get(timeout=1)
+            except queue.Empty:
+                if not all(TEMP0.is_alive() for TEMP0 in self.workers):
+                    raise RuntimeError('分片工作进程启动失败')
+                continue
+            if name == 'Ready':  # 此时只会收到运行指标，定时重发，不需要处理
+                ready.add(args[0])
+        logger.info('【分片】已启动 ' + str(self.shard_num) + ' 个工作进程')
+
+    def Collect(self):
+        '合并线程：把工作进程传回的操作放入出站操作队列，异常聊天记录汇总到主进程的报告队列，新发现的广告转发给其他分片，运行指标交给metrics合并输出'
+        while True:
+            try:
+                name, args = self.action_in.get()
+                if name == 'Add_Report':
+                    self.Run_Locked(self.moderation.Add_Report, *args)
+                elif name == 'Add_Similar':  # 转发给其他分片，同一波广告发到不同分片的群聊也能识别
+                    for TEMP0, TEMP1 in enumerate(self.event_queues):
+                        if TEMP0 != args[0]:
+                            TEMP1.put(('Add_Similar', args[1:]))
+                elif name == 'Metrics':
+                    metrics.Merge_Remote(*args)
+                else:
+                    action_queue.Put(Shard_Engine.FUNCS[name], *args)
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+    def Forward_Members(self):
+        '转发线程：主进程获取到的成员列表交给群聊所属的分片'
+        while True:
+            group_id, members, admins = self.members.loaded.get()
+            self.event_queues[Shard_Of(group_id, self.shard_num)].put(('Members', (group_id, members, admins)))
+
+    def Task_Processing(self):
+        '主进程的定时任务（异常聊天报告）：睡到下一个定时任务到期，或被唤醒后重新计算'
+        while True:
+            with self.lock:
+                deadline = self.moderation.Next_Deadline()
+                if deadline is not None:
+                    deadline -= time() + int(self.moderation.time_difference or 0)
+            self.task_wake.wait(None if deadline is None else max(0, deadline))
+            self.task_wake.clear()
+            with self.lock:
+                try:
+                    self.moderation.Handle_Task()
+                except:
+                    logger.error(Log_Mgt.Get_Error())
+
+    def Run_Locked(self, func, *args):
+        '在锁内调用主进程群管流程的方法，下次定时任务的时间提前时才唤醒定时任务线程'
+        with self.lock:
+            TEMP0 = self.moderation.Next_Deadline()
+            func(*args)
+            TEMP1 = self.moderation.Next_Deadline()
+        if TEMP1 is not None and (TEMP0 is None or TEMP1 < TEMP0):
+            self.task_wake.set()
+
+    def Dispatch(self, rev: dict):
+        '分发一个事件：群聊事件交给所属分片，元事件（心跳等）发给所有分片用于校准时差，其他事件由主进程处理'
+        if rev.get('post_type') == 'meta_event':
+            for TEMP0 in self.event_queues:
+                TEMP0.put(rev)
+        elif rev.get('group_id') is not None:
+            self.event_queues[Shard_Of(rev['group_id'], self.shard_num)].put(rev)
+            return
+        self.Run_Locked(self.moderation.Handle_Event, rev)
+
+    def Settings_Reload(self, changed: dict):
+        '设置热加载：转发给各工作进程，主进程更换需要获取成员列表的群聊，再应用到主进程的群管流程'
+        for TEMP0 in self.event_queues:  # 转发给所有工作进程
+            TEMP0.put(('Settings', changed))
+        if 'group_manage' in changed or 'member_refresh' in changed:
+            self.members.Set_Groups(settings_load.group_manage, Moderation.Refresh_Time(settings_load.member_refresh))
+        built = self.moderation.Build_Settings(changed)
+        with self.lock:
+            self.moderation.Apply_Settings(changed, built)
+        self.task_wake.set()
+
+    def Run(self, on_ready=None):
+        '【线程阻塞】启动工作进程、出站操作队列和事件接收：开始接收事件后调用的函数（可选）'
+        self.Start_Workers()
+        action_queue.Start(self.worker_num)
+        settings_mgt.Watch(self.Settings_Reload)
+        threading.Thread(target=self.Collect, name='Shard_Collect', daemon=True).start()
+        threading.Thread(target=self.Task_Processing, name='Shard_Task', daemon=True).start()
+        self.members.Start(group_manage, Moderation.Refresh_Time(member_refresh))  # 获取所有分片的成员列表
+        threading.Thread(target=self.Forward_Members, name='Shard_Members', daemon=True).start()
+        Receive.Start()
+        for TEMP0 in backends:  # 多账号：每个账号单独的上报端口
+            Receive.Listen(Receive.server_addr, TEMP0[3], TEMP0[0])
+        if on_ready is not None:
+            on_ready()
+        while True:
+            rev = Receive.Rev_Msg()
+            if rev is None:
+                continue
+            try:
+                self.Dispatch(rev)
+            except:
+                logger.error(Log_Mgt.Get_Error())
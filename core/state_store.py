@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA状态保存模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# SQLite WAL模式：https://www.sqlite.org/wal.html
+
+import os
+import atexit
+import sqlite3
+import threading
+
+from core.log_mgt import Log_Mgt, logger
+
+
+class State_Store:
+    '群管状态保存（SQLite WAL模式）：消息处理线程只记录改动，后台线程定时批量写入，重启后用Load()恢复'
+    # {表名: (建表语句, 主键字段)}
+    TABLES = {
+        'offense': ('CREATE TABLE IF NOT EXISTS offense (group_id INTEGER, user_id INTEGER, counts BLOB, last_bucket INTEGER, '
+                    'num INTEGER, gag_num INTEGER, last_time INTEGER, PRIMARY KEY (group_id, user_id))', ('group_id', 'user_id')),
+        'del_msg': ('CREATE TABLE IF NOT EXISTS del_msg (message_id INTEGER PRIMARY KEY, deadline INTEGER, self_id INTEGER, group_id INTEGER)', ('message_id',)),
+        'report': ('CREATE TABLE IF NOT EXISTS report (group_id INTEGER, user_id INTEGER, num INTEGER, time INTEGER, '
+                   'message TEXT, PRIMARY KEY (group_id, user_id))', ('group_id', 'user_id')),
+        'curfew': ('CREATE TABLE IF NOT EXISTS curfew (group_id INTEGER PRIMARY KEY, state INTEGER)', ('group_id',)),
+        'meta': ('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)', ('key',)),
+    }
+    # 旧版本文件中缺少的字段 [(表名, 字段名, 字段类型)]
+    NEW_COLUMNS = [('del_msg', 'self_id', 'INTEGER'), ('del_msg', 'group_id', 'INTEGER')]
+
+    def __init__(self, file_path: str, flush_interval: float = 1):
+        '打开（或新建）状态文件：文件路径，批量写入的间隔（秒）'
+        TEMP0 = os.path.dirname(file_path)
+        if TEMP0 != '' and not os.path.exists(TEMP0):
+            os.makedirs(TEMP0)
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(file_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')  # WAL模式下只在检查点时同步，断电最多丢失最后一批
+        for TEMP1, TEMP2 in State_Store.TABLES.values():
+            self.conn.execute(TEMP1)
+        for TEMP1, TEMP2, TEMP3 in State_Store.NEW_COLUMNS:
+            if TEMP2 not in [TEMP4[1] for TEMP4 in self.conn.execute('PRAGMA table_info(' + TEMP1 + ')')]:
+                self.conn.execute('ALTER TABLE ' + TEMP1 + ' ADD COLUMN ' + TEMP2 + ' ' + TEMP3)
+        self.conn.commit()
+        self.pending = {}  # 待写入的改动 {(表名, 主键): 行数据 / None（删除）}
+        self.clear_table = set()  # 待清空的表
+        self.lock = threading.Lock()
+        self.conn_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        threading.Thread(target=self.Writer, name='State_Store', daemon=True).start()
+        atexit.register(self.Close)
+
+    def Put(self, table: str, row: tuple):
+        '记录一行改动（覆盖同主键的旧数据）：表名，行数据（按建表字段顺序）'
+        with self.lock:
+            self.pending[(table, row[:len(State_Store.TABLES[table][1])])] = row
+
+    def Delete(self, table: str, key: tuple):
+        '记录删除一行：表名，主键'
+        with self.lock:
+            self.pending[(table, tuple(key))] = None
+
+    def Clear(self, table: str):
+        '记录清空整个表（之前记录的该表改动一并丢弃）：表名'
+        with self.lock:
+            for TEMP0 in [TEMP0 for TEMP0 in self.pending if TEMP0[0] == table]:
+                del self.pending[TEMP0]
+            self.clear_table.add(table)
+
+    def Load(self) -> dict:
+        '读取保存的全部状态 返回：dict，{表名: [行数据, ...]}，meta为 {key: value}'
+        self.Flush()
+        result = {}
+        with self.conn_lock:
+            for TEMP0 in State_Store.TABLES:
+                result[TEMP0] = self.conn.execute('SELECT * FROM ' + TEMP0).fetchall()
+        result['meta'] = dict(result['meta'])
+        return result
+
+    def Flush(self):
+        '立即把所有改动写入文件（一个事务）'
+        with self.lock:
+            pending = self.pending
+            clear_table = self.clear_table
+            self.pending = {}
+            self.clear_table = set()
+        if pending == {} and clear_table == set():
+            return
+        with self.conn_lock:
+            if self.conn is None:  # 已关闭
+                return
+            with self.conn:  # 自动提交或回滚
+                for TEMP0 in clear_table:
+                    self.conn.execute('DELETE FROM ' + TEMP0)
+                upsert = {}
+                delete = {}
+                for (table, key), row in pending.items():
+                    if row is None:
+                        delete.setdefault(table, []).append(key)
+                    else:
+                        upsert.setdefault(table, []).append(row)
+                for table, rows in delete.items():
+                    fields = State_Store.TABLES[table][1]
+                    self.conn.executemany('DELETE FROM ' + table + ' WHERE ' + ' AND '.join(TEMP1 + '=?' for TEMP1 in fields), rows)
+                for table, rows in upsert.items():
+                    self.conn.executemany('INSERT OR REPLACE INTO ' + table + ' VALUES (' + ','.join('?' * len(rows[0])) + ')', rows)
+
+    def Writer(self):
+        '后台写入线程：每隔flush_interval秒批量写入一次'
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            try:
+                self.Flush()
+            except:
+                logger.error(Log_Mgt.Get_Error())
+
+    def Close(self):
+        '写入剩余的改动并关闭文件'
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        try:
+            self.Flush()
+            with self.conn_lock:
+                self.conn.close()
+                self.conn = None
+        except:
+            logger.error(Log_Mgt.Get_Error())
@@ -10,7 +10,6 @@
 # chardet文本编码检测：https://blog.csdn.net/tianzhu123/article/details/8187470
 
 import os
-import chardet  # 文件编码检测，需安装
 
 
 class Text_Mgt():
@@ -18,12 +17,22 @@ class Text_Mgt():
     def Encodeing_Detect(file_path: str) -> str:
         '文本编码检测，无法识别则默认为"utf-8"编码 返回：str'
         with open(file_path, 'rb') as file:
-            result = chardet.detect(file.read(1048576))  # 最多读取1MB文件进行检测
-            #print(result['confidence'])#
-            if float(result['confidence']) >= 0.5:  # 如果置信度大于50%
-                return result['encoding'].lower()
-            else:
-                return 'utf-8'  # 无法识别则默认为"utf-8"编码
+            data = file.read(1048576)  # 最多读取1MB文件进行检测
+        if data[:3] == b'\xef\xbb\xbf':  # 带BOM的UTF-8
+            return 'utf-8-sig'
+        try:  # 能按UTF-8解码就不需要再检测（文件被截断时，最后一个字符可能不完整）
+            data.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError as e:
+            if len(data) == 1048576 and e.start >= len(data) - 3:
+                return 'utf-8'
+        import chardet  # 文件编码检测，需安装，只有不是UTF-8编码时才导入
+        result = chardet.detect(data)
+        #print(result['confidence'])#
+        if float(result['confidence']) >= 0.5:  # 如果置信度大于50%
+            return result['encoding'].lower()
+        else:
+            return 'utf-8'  # 无法识别则默认为"utf-8"编码
 
     def List_Read_Text(file_path: str, choose: str = '', choose_mode: int = 0, read_mode: int = 0, encoding: str = ''):
         '读取文本文件并以列表的形式输出，可选排除(0)或选择(1)某字符串开头的行，可选从行头选择(0)还是从行尾选择(1)，不支持匹配换行符 返回：list'
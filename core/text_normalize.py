@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA文本归一化模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# Unicode兼容分解（NFKC）：https://unicode.org/reports/tr15/
+# Unicode易混淆字符：https://www.unicode.org/reports/tr39/
+#
+# 关键词匹配前把消息归一化一次：全角转半角、大写转小写、去掉零宽字符、把形近的外文字母换成英文字母，
+# 空白和标点统一换成空格后再决定是否去掉：挨着中文等非英文字符的、以及单个字母数字之间的（如“s b”“s.b”）去掉，
+# 英文单词之间的保留一个空格，这样“Ｓ Ｂ”“s.b”“ѕb”都能被词库中的“sb”命中，而“this book”“yes, but”不会。
+# 每个字符最多对应一个字符，所以可以随时算出归一化后的位置对应原文的哪个位置。
+
+import re
+import unicodedata
+
+SEPARATOR = re.compile(' +')  # 归一化第一步后，连续的空白标点为一段空格
+
+
+class Normalize_Table(dict):
+    '归一化转换表 {字符编码: 转换后的字符 / None（删除）}，常用字符预先生成，其他字符第一次遇到时再计算并缓存'
+
+    # 形近字符 {外文字母: 英文字母}（西里尔字母、希腊字母等），其余的兼容字符（全角、带圈、数学字母等）由NFKC处理
+    CONFUSABLE = {
+        'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c', 'т': 't',
+        'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ј': 'j', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'ь': 'b',
+        'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u',
+        'χ': 'x', 'ω': 'w',
+    }
+    # 预先生成的字符范围：ASCII、拉丁字母补充、希腊字母、西里尔字母、常用标点、CJK标点、全角字符
+    PRELOAD = ((0x0000, 0x0250), (0x0370, 0x0530), (0x2000, 0x2070), (0x3000, 0x3040), (0xFE30, 0xFE70), (0xFF00, 0xFFF0))
+
+    def __init__(self):
+        super().__init__()
+        for TEMP0, TEMP1 in Normalize_Table.PRELOAD:
+            for TEMP2 in range(TEMP0, TEMP1):
+                self[TEMP2]  # 触发__missing__生成并缓存
+
+    def __missing__(self, code: int):
+        char = chr(code)
+        TEMP0 = unicodedata.normalize('NFKC', char)  # 全角、带圈、上标等兼容字符转为普通字符
+        if len(TEMP0) != 1:  # 分解为多个字符的（如㈠）保持原样，保证一个字符只对应一个字符
+            TEMP0 = char
+        if len(TEMP0.lower()) == 1:
+            TEMP0 = TEMP0.lower()
+        TEMP0 = Normalize_Table.CONFUSABLE.get(TEMP0, TEMP0)
+        # 空白（Z）和标点（P）换成空格，之后再决定是否去掉；控制和格式字符（C，包括零宽空格、零宽连接符等）直接删除
+        if TEMP0.isspace() or unicodedata.category(TEMP0)[0] in 'ZP':
+            TEMP0 = ' '
+        elif unicodedata.category(TEMP0)[0] == 'C':
+            TEMP0 = None
+        self[code] = TEMP0
+        return TEMP0
+
+
+class Text_Normalize:
+    '文本归一化：Normalize()用于关键词匹配，Original()把归一化后的位置对应回原文'
+    table = Normalize_Table()
+
+    def Is_Word(char: str) -> bool:
+        '是否为英文字母或数字 返回：bool'
+        return char.isascii() and char.isalnum()
+
+    def Keep_Separator(text: str, start: int, end: int) -> bool:
+        '一段空格（text[start:end]）是否保留：两边都是英文字母数字，且不都是单个字符时保留 返回：bool'
+        if start == 0 or end == len(text) or not Text_Normalize.Is_Word(text[start - 1]) or not Text_Normalize.Is_Word(text[end]):
+            return False
+        left_single = start < 2 or not Text_Normalize.Is_Word(text[start - 2])
+        right_single = end + 1 >= len(text) or not Text_Normalize.Is_Word(text[end + 1])
+        return not (left_single and right_single)
+
+    def Normalize(text: str) -> str:
+        '归一化文本（一次str.translate，有空白标点时再处理一次空格） 返回：str'
+        text = text.translate(Text_Normalize.table)
+        if ' ' not in text:
+            return text
+        return SEPARATOR.sub(lambda TEMP0: ' ' if Text_Normalize.Keep_Separator(text, TEMP0.start(), TEMP0.end()) else '', text)
+
+    def Offsets(text: str) -> list:
+        '归一化后每个字符在原文中的位置（只在需要时计算，如命中关键词后显示原文） 返回：list，[原文位置, ...]'
+        table = Text_Normalize.table
+        offsets = [TEMP0 for TEMP0, TEMP1 in enumerate(text) if table[ord(TEMP1)] is not None]
+        text = text.translate(table)
+        dropped = set()  # 归一化第一步结果中被去掉的位置（保留的一段空格只保留第一个）
+        for TEMP0 in SEPARATOR.finditer(text):
+            TEMP1 = TEMP0.start() + 1 if Text_Normalize.Keep_Separator(text, TEMP0.start(), TEMP0.end()) else TEMP0.start()
+            dropped.update(range(TEMP1, TEMP0.end()))
+        return [TEMP1 for TEMP0, TEMP1 in enumerate(offsets) if TEMP0 not in dropped]
+
+    def Original(text: str, word: str, normalized: str = None) -> str:
+        '找出原文中归一化后等于关键词的片段：原文，关键词（已归一化），原文归一化的结果（可选，避免重复计算） 返回：str，原文片段（找不到则为空字符串）'
+        if normalized is None:
+            normalized = Text_Normalize.Normalize(text)
+        start = normalized.find(word)
+        if start < 0 or word == '':
+            return ''
+        offsets = Text_Normalize.Offsets(text)
+        return text[offsets[start]:offsets[start + len(word) - 1] + 1]
+
+
+if __name__ == '__main__':  # 代码测试
+    for TEMP0 in ['Ｓ Ｂ', 's.b', 'ѕb', 's​b', '加 Ｑ 群', 'ⓢⓑ', '扩列+', 'this book is nice', 'yes, but']:
+        TEMP1 = Text_Normalize.Normalize(TEMP0)
+        print(repr(TEMP0), '->', repr(TEMP1), Text_Normalize.Offsets(TEMP0), repr(Text_Normalize.Original('你好' + TEMP0 + '啊', TEMP1)))
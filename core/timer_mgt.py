@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA定时任务模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# heapq堆队列：https://docs.python.org/zh-cn/3/library/heapq.html
+
+import heapq
+import itertools
+
+
+class Timer_Heap:
+    '定时任务堆（最小堆）：任务可以乱序加入，按到期时间取出，支持按key取消，同一个key重复加入会覆盖旧任务'
+
+    def __init__(self):
+        self.heap = []  # [到期时间, 序号, key]，key为None代表已取消
+        self.entries = {}  # {key: [到期时间, 序号, key, 附带数据]}
+        self.counter = itertools.count()  # 到期时间相同时按加入顺序取出
+
+    def __len__(self):
+        return len(self.entries)
+
+    def Add(self, deadline, key, data=None):
+        '加入一个定时任务：到期时间，任务key（如消息ID），附带数据'
+        if key in self.entries:
+            self.Cancel(key)
+        entry = [deadline, next(self.counter), key, data]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+    def Cancel(self, key) -> bool:
+        '取消一个定时任务（惰性删除，到堆顶时再丢弃） 返回：bool，是否有该任务'
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        return True
+
+    def Next_Deadline(self):
+        '最早的到期时间，没有任务则为None 返回：到期时间 / None'
+        while self.heap and self.heap[0][2] is None:  # 丢弃已取消的任务
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def Pop_Due(self, now) -> list:
+        '取出所有已到期的任务 返回：list，[(key, 附带数据), ...]，按到期时间排序'
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, TEMP0, key, data = heapq.heappop(self.heap)
+            if key is None:  # 已取消
+                continue
+            del self.entries[key]
+            due.append((key, data))
+        return due
+
+    def Items(self) -> list:
+        '所有未到期且未取消的任务 返回：list，[(到期时间, key, 附带数据), ...]'
+        return [(TEMP0[0], TEMP0[2], TEMP0[3]) for TEMP0 in sorted(self.entries.values())]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA消息分类缓存模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 刷屏时大量消息归一化后完全相同，分类结果（命中的关键词及相似广告签名）按归一化后的文本缓存，
+# 重复的消息只需查一次字典。缓存只与词库有关，词库改变时随关键词自动机一起重建。
+
+from collections import OrderedDict
+
+from core.metrics import metrics
+
+
+class Verdict_Cache:
+    '消息分类缓存（最近最少使用淘汰）：Get()查找归一化后的文本，Put()保存分类结果'
+
+    def __init__(self, max_size: int = 4096, max_length: int = 512):
+        '创建缓存：最多缓存的消息数，参与缓存的最长文本长度（更长的消息很少重复，不缓存）'
+        self.max_size = max_size
+        self.max_length = max_length
+        self.cache = OrderedDict()  # {归一化后的文本: 分类结果}
+
+    def __len__(self):
+        return len(self.cache)
+
+    def Get(self, text: str):
+        '查找缓存的分类结果 返回：缓存的结果 / None（未缓存）'
+        TEMP0 = self.cache.get(text)
+        if TEMP0 is None:
+            metrics.Inc('qgma_verdict_cache_total', ('miss',))
+            return None
+        self.cache.move_to_end(text)
+        metrics.Inc('qgma_verdict_cache_total', ('hit',))
+        return TEMP0
+
+    def Put(self, text: str, verdict):
+        '保存分类结果，超过数量上限时淘汰最久未使用的'
+        if len(text) > self.max_length:
+            return
+        self.cache[text] = verdict
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA关键词匹配模块
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+# 参考资料：
+# Aho-Corasick多模式匹配算法：https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+
+from collections import deque
+
+
+class Word_Match:
+    '关键词匹配模块（Aho-Corasick自动机）：用词库构建一次后，只需扫描一遍消息即可找出所有分类的全部关键词'
+
+    def __init__(self, word_dict: dict, normalize=None, allow_word: list = ()):
+        '构建自动机，word_dict格式为 {分类: 关键词列表}，例如 {"bad": bad_word, "ads": ads_word}，normalize为关键词的归一化函数（应与消息使用同一个，None为只转小写），allow_word为白名单（完全处在白名单词语中的关键词不算命中，如“usb”中的“sb”）'
+        self.category = list(word_dict)  # 分类列表（保持传入顺序）
+        self.word_num = 0  # 已加载的关键词数量
+        self.allow_num = 0  # 已加载的白名单词语数量
+        self.goto = [{}]  # 状态转移表，每个状态为 {字符: 下一状态}
+        self.fail = [0]  # 失配指针
+        self.output = [None]  # 在该状态结束的关键词 (分类, 关键词)
+        self.output_link = [0]  # 沿失配指针能到达的最近一个有输出的状态（0为没有）
+
+        # 第一步：将所有关键词插入字典树（白名单词语的分类为None）
+        for TEMP0 in self.category + [None]:
+            for word in word_dict[TEMP0] if TEMP0 is not None else allow_word:
+                word = normalize(str(word)) if normalize is not None else str(word).lower()  # 关键词与消息使用同样的归一化
+                if word == '':
+                    continue
+                state = 0
+                for char in word:
+                    next_state = self.goto[state].get(char)
+                    if next_state is None:  # 如果没有对应的子节点则新建
+                        next_state = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.output.append(None)
+                        self.output_link.append(0)
+                        self.goto[state][char] = next_state
+                    state = next_state
+                if self.output[state] is None:
+                    self.output[state] = []
+                if (TEMP0, word) not in self.output[state]:  # 同一分类中重复的关键词只记录一次
+                    self.output[state].append((TEMP0, word))
+                    if TEMP0 is None:
+                        self.allow_num += 1
+                    else:
+                        self.word_num += 1
+
+        # 第二步：广度优先遍历，计算失配指针和输出链接
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                TEMP1 = self.fail[state]
+                while TEMP1 and char not in self.goto[TEMP1]:
+                    TEMP1 = self.fail[TEMP1]
+                TEMP1 = self.goto[TEMP1].get(char, 0)
+                self.fail[next_state] = TEMP1
+                if self.output[TEMP1] is not None:
+                    self.output_link[next_state] = TEMP1
+                else:
+                    self.output_link[next_state] = self.output_link[TEMP1]
+
+    def Match(self, text: str) -> dict:
+        '扫描一遍文本，找出每个分类中命中的关键词（按首次出现顺序，不重复） 返回：dict，例如 {"bad": ["sb"], "ads": []}'
+        result = {TEMP0: [] for TEMP0 in self.category}
+        if self.word_num == 0:
+            return result
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        output_link = self.output_link
+        found = set()
+        pending = []  # 有白名单时先记下命中的位置 [(开始位置, 结束位置, (分类, 关键词)), ...]，扫描完再排除白名单词语中的
+        allowed = []  # 白名单词语出现的位置 [(开始位置, 结束位置), ...]
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            TEMP0 = state if output[state] is not None else output_link[state]
+            while TEMP0:  # 沿输出链接收集所有在此处结束的关键词
+                for TEMP1 in output[TEMP0]:
+                    if TEMP1[0] is None:
+                        allowed.append((index - len(TEMP1[1]) + 1, index))
+                    elif TEMP1 not in found:
+                        if self.allow_num:
+                            pending.append((index - len(TEMP1[1]) + 1, index, TEMP1))
+                        else:
+                            found.add(TEMP1)
+                            result[TEMP1[0]].append(TEMP1[1])
+                TEMP0 = output_link[TEMP0]
+        for TEMP0, TEMP1, TEMP2 in pending:
+            if TEMP2 not in found and not any(TEMP3 <= TEMP0 and TEMP1 <= TEMP4 for TEMP3, TEMP4 in allowed):
+                found.add(TEMP2)
+                result[TEMP2[0]].append(TEMP2[1])
+        return result
+
+
+if __name__ == '__main__':  # 代码测试
+    import time
+    word_match = Word_Match({'bad': ['sb', '傻b', '傻逼'], 'ads': ['q群', '加qq群', '群']}, allow_word=['usb'])
+    time_start = time.time()
+    print(word_match.Match('快来加qq群，sb才不来，傻逼，usb'))
+    print(time.time()-time_start)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA离线重放
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 把录制的上报事件（settings/server/capture_file.txt）以最快速度交给与正式运行相同的群管流程：
+# 消息分类、犯错计数、禁言踢出、撤回队列、异常报告和宵禁都照常计算，但时间使用事件自带的时间（虚拟时钟），
+# 操作不会真正执行，只统计（或写入文件），最后输出各阶段的耗时。
+# 修改词库或禁言设置后重放一天的事件，几秒内就能看到撤回、禁言和踢出的数量有什么变化；
+# 可以把settings文件夹复制一份修改后用--settings指定，不影响正在运行的程序。
+#
+# 用法：python replay.py 录制文件 [--settings 设置文件夹] [--actions 操作输出文件]
+
+import os
+import sys
+import gzip
+import json
+import argparse
+from time import perf_counter
+os.chdir(sys.path[0])  # 改变程序当前工作路径
+
+from core.log_mgt import *
+from core.moderation import *
+from core.metrics import Metrics_Mgt
+import core.settings_load as settings_load
+from core.settings_load import SETTINGS, Load_Setting
+
+
+class Virtual_Clock:
+    '虚拟时钟：时间只在重放事件时前进，调用实例得到当前时间'
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> int:
+        return self.now
+
+    def Advance(self, now: int):
+        '前进到指定时间（不会后退）'
+        if now > self.now:
+            self.now = now
+
+
+class Stage_Timer:
+    '阶段耗时统计：记录每次的耗时，输出总耗时、平均值和p99'
+
+    def __init__(self):
+        self.times = {}  # {阶段名称: [耗时（秒）, ...]}
+
+    def Add(self, stage: str, seconds: float):
+        self.times.setdefault(stage, []).append(seconds)
+
+    def Wrap(self, stage: str, func):
+        '包装一个函数，每次调用时记录耗时 返回：function'
+        def Timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.Add(stage, perf_counter() - start)
+        return Timed
+
+    def Summary(self) -> list:
+        '各阶段的统计 返回：list，[(阶段名称, 次数, 总耗时（秒）, 平均耗时（微秒）, p99耗时（微秒）), ...]'
+        summary = []
+        for stage, times in self.times.items():
+            TEMP0 = sorted(times)
+            summary.append((stage, len(TEMP0), sum(TEMP0), sum(TEMP0) / len(TEMP0) * 1e6,
+                            TEMP0[min(len(TEMP0) - 1, int(len(TEMP0) * 0.99))] * 1e6))
+        return summary
+
+
+class Dry_Run_Sink:
+    '模拟执行操作：只统计各类操作的次数，可选把操作（含虚拟时间）写入文件'
+
+    def __init__(self, clock: Virtual_Clock, out_file=None):
+        self.clock = clock
+        self.out_file = out_file
+        self.counts = {}  # {操作名称: 次数}
+
+    def __call__(self, func, *args):
+        self.counts[func.__name__] = self.counts.get(func.__name__, 0) + 1
+        if self.out_file is not None:
+            self.out_file.write(json.dumps({'time': self.clock.now, 'action': func.__name__, 'args': args}, ensure_ascii=False, default=str) + '\n')
+
+
+def Read_Events(file_path: str):
+    '逐行读取录制文件（.gz为压缩文件，程序被强制结束时压缩文件可能不完整，读取到能解压的部分为止） 返回：generator，每行的bytes'
+    with (gzip.open(file_path, 'rb') if file_path.endswith('.gz') else open(file_path, 'rb')) as file:
+        try:
+            for line in file:
+                if line.strip() != b'':
+                    yield line
+        except EOFError:
+            logger.warning('【重放】录制文件不完整（录制时程序未正常退出），只重放已完整写入的部分')
+
+
+def Load_Settings_Dir(settings_dir: str) -> dict:
+    '读取另一个设置文件夹中的全部设置（结构与settings文件夹相同） 返回：dict，{设置名称: 值}'
+    settings = {}
+    for name, (file_path, parse, default) in list(SETTINGS.items()):
+        SETTINGS[name] = (os.path.join(settings_dir, os.path.relpath(file_path, 'settings')), parse, default)
+        settings[name] = Load_Setting(name)
+    return settings
+
+
+def Replay(file_path: str, out_file=None, settings_dir: str = None) -> dict:
+    '把录制文件中的事件依次交给群管流程：录制文件路径，操作输出文件（可选），使用的设置文件夹（可选，默认为settings） 返回：dict，统计结果'
+    clock = Virtual_Clock()
+    sink = Dry_Run_Sink(clock, out_file)
+    timer = Stage_Timer()
+    moderation = Moderation(sink, clock=clock)  # 不保存状态，不影响正在运行的程序
+    if settings_dir is not None:  # 与热加载相同的方式换用另一套设置
+        settings = Load_Settings_Dir(settings_dir)
+        vars(settings_load).update(settings)  # 群管流程从settings_load读取设置
+        built = moderation.Build_Settings(settings)
+        built['offense_ledger'] = Offense_Ledger(int(settings['task_cycle']) * 60)
+        moderation.Apply_Settings(settings, built)
+    moderation.Classify = timer.Wrap('classify', moderation.Classify)  # 单独统计关键词检查的耗时
+    events = {}  # {事件类型: 次数}
+    errors = 0
+    start = perf_counter()
+    for line in Read_Events(file_path):
+        TEMP0 = perf_counter()
+        try:
+            rev = json.loads(line)
+        except ValueError:
+            errors += 1
+            continue
+        TEMP1 = perf_counter()
+        timer.Add('decode', TEMP1 - TEMP0)
+        if not isinstance(rev, dict) or 'time' not in rev:
+            errors += 1
+            continue
+        # 时间前进到该事件的时间，先处理在此之前到期的定时任务（撤回、报告、宵禁）
+        clock.Advance(int(rev['time']))
+        deadline = moderation.Next_Deadline()
+        if deadline is not None and deadline <= moderation.Now():
+            moderation.Handle_Task()
+            TEMP0 = perf_counter()
+            timer.Add('task', TEMP0 - TEMP1)
+            TEMP1 = TEMP0
+        TEMP0 = '.'.join(Metrics_Mgt.Event_Labels(rev))
+        events[TEMP0] = events.get(TEMP0, 0) + 1
+        try:
+            moderation.Handle_Event(rev)
+        except:
+            errors += 1
+            logger.error(Log_Mgt.Get_Error())
+        timer.Add('event', perf_counter() - TEMP1)
+    # 录制结束后，处理剩余的撤回和报告（宵禁会一直有下次切换时间，不再等待）
+    while len(moderation.del_msg_queue) != 0 or moderation.report_queue != {}:
+        TEMP0 = [moderation.next_report_time] if moderation.report_queue != {} else []
+        if len(moderation.del_msg_queue) != 0:
+            TEMP0.append(moderation.del_msg_queue.Next_Deadline())
+        clock.Advance(min(TEMP0))  # 虚拟时钟与事件时间一致，没有时差
+        TEMP1 = perf_counter()
+        moderation.Handle_Task()
+        timer.Add('task', perf_counter() - TEMP1)
+    return {'events': events, 'errors': errors, 'seconds': perf_counter() - start,
+            'actions': sink.counts, 'stages': timer.Summary(), 'offense_records': len(moderation.offense_ledger)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='QGMA离线重放：把录制的上报事件交给群管流程，操作只统计不执行')
+    parser.add_argument('file', help='录制文件（settings/server/capture_file.txt中设置的文件）')
+    parser.add_argument('--settings', help='使用另一个设置文件夹（结构与settings文件夹相同），默认使用settings文件夹')
+    parser.add_argument('--actions', help='把模拟执行的操作写入此文件（每行一个json）')
+    args = parser.parse_args()
+    Log_Mgt.Log_Conf('QGMA_replay.log', file_log_level=30, console_log_level=30)  # 只记录警告和错误，逐条的命中日志会拖慢重放
+    out_file = open(args.actions, 'w', encoding='utf-8') if args.actions else None
+    try:
+        result = Replay(args.file, out_file, args.settings)
+    finally:
+        if out_file is not None:
+            out_file.close()
+    total = sum(result['events'].values())
+    print('--------------------重放结果--------------------')
+    print('事件数:', total, '（无法解析：' + str(result['errors']) + '）')
+    for TEMP0, TEMP1 in sorted(result['events'].items(), key=lambda TEMP0: -TEMP0[1]):
+        print('  ' + TEMP0 + ':', TEMP1)
+    print('用时: %.3f 秒（每秒 %.0f 个事件）' % (result['seconds'], total / max(result['seconds'], 1e-9)))
+    print('模拟执行的操作:')
+    for TEMP0, TEMP1 in sorted(result['actions'].items()):
+        print('  ' + TEMP0 + ':', TEMP1)
+    print('结束时的犯错记录:', result['offense_records'], '条')
+    print('各阶段耗时:                次数      总计(秒)   平均(微秒)   p99(微秒)')
+    for TEMP0 in result['stages']:
+        print('  %-20s %10d %12.3f %12.1f %12.1f' % TEMP0)
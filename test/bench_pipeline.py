@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA端到端压力测试
+# 作者：稽术宅（funnygeeker）
+# QGMA项目交流QQ群：332568832
+# 作者Bilibili：https://b23.tv/b39RG2r
+# Github：https://github.com/funnygeeker/qgma
+#
+# 在临时目录中复制一份程序并写入测试用的设置，启动main.py，然后：
+# 1.模拟GO-CQHTTP按设定的速率和比例上报群聊/私聊/心跳事件
+# 2.模拟GO-CQHTTP的API服务，记录每次调用（撤回、禁言、发送消息等）及时间
+# 最后输出实际处理速率、从上报到撤回消息的延迟（p50/p99）以及进程的CPU和内存占用。
+#
+# 用法（在项目根目录运行）：
+# python test/bench_pipeline.py --rate 500 --duration 20 --engine thread
+# python test/bench_pipeline.py --rate 2000 --engine process --shards 4 --groups 200
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 项目根目录
+BAD_MESSAGES = ['你是sb', '傻逼吧', '招聘兼职 加Q群', '出脚本 走闲鱼']  # 会命中默认词库的消息
+OK_MESSAGES = ['今天天气不错', '晚上一起打游戏吗', 'hello world', '哈哈哈哈']
+
+
+class Fake_Api(BaseHTTPRequestHandler):
+    '模拟GO-CQHTTP的API服务：记录 (收到的时间, 接口名称, 参数)'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 响应头和响应体分两次发送，避免Nagle算法与延迟确认叠加产生约40ms的延迟
+    calls = []
+    lock = threading.Lock()
+    members = b'[]'  # get_group_member_list返回的成员列表（启动时按--users生成）
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        now = time.perf_counter()
+        try:
+            params = json.loads(body or b'{}')
+        except ValueError:
+            params = {}
+        with Fake_Api.lock:
+            Fake_Api.calls.append((now, self.path.strip('/'), params))
+        if self.path.strip('/') == 'get_group_member_list':
+            out = b'{"status":"ok","retcode":0,"data":' + Fake_Api.members + b'}'
+        else:
+            out = b'{"status":"ok","retcode":0,"data":{"message_id":0}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def Prepare_Tree(work_dir: str, args) -> str:
+    '复制程序到临时目录并写入测试设置 返回：str，main.py的路径'
+    shutil.copytree(ROOT, work_dir, ignore=shutil.ignore_patterns('.git', 'data', 'logs', '__pycache__', 'test'))
+    settings = {
+        'basic/group_manage.txt': '\n'.join(str(TEMP0) for TEMP0 in Group_List(args.groups)),
+        'basic/admin_user_id.txt': '',
+        'basic/curfew_time.txt': '',
+        'basic/report_cycle.txt': '',
+        'basic/engine_mode.txt': args.engine,
+        'basic/debug_sample.txt': str(args.debug_sample),
+        'server/server_ip.txt': '127.0.0.1',
+        'server/server_send_port.txt': str(args.api_port),
+        'server/server_rec_port.txt': str(args.event_port),
+        'server/rate_limit.txt': '\n'.join(TEMP0 + ' 0 1' for TEMP0 in ('send_group_msg', 'send_private_msg', 'delete_msg', 'set_group_ban', 'set_group_kick', 'set_group_whole_ban', 'group')),
+        'server/action_worker_num.txt': str(args.action_workers),
+        'server/shard_num.txt': str(args.shards),
+        'server/state_file.txt': '',
+        'server/capture_file.txt': os.path.abspath(args.capture) if args.capture else '',
+        'server/metrics_port.txt': str(args.metrics_port) if args.metrics_port else '',
+        'server/backends.txt': '',
+        'member/del_msg_time.txt': '0',  # 立即撤回，用撤回的延迟衡量整条流程
+        'chat/tips_window.txt': '0',
+    }
+    for TEMP0, TEMP1 in settings.items():
+        with open(os.path.join(work_dir, 'settings', TEMP0), 'w', encoding='utf-8') as file:
+            file.write('# 压力测试\n' + TEMP1)
+    return os.path.join(work_dir, 'main.py')
+
+
+def Group_List(group_num: int) -> list:
+    return [100000000 + TEMP0 for TEMP0 in range(group_num)]
+
+
+def Wait_Port(port: int, timeout: float = 30) -> bool:
+    '等待程序开始监听 返回：bool'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            http.client.HTTPConnection('127.0.0.1', port, timeout=1).connect()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def Sender(args, index: int, stop_time: float, sent: dict, lock):
+    '上报线程：一个长连接，按速率均匀地上报事件'
+    rng = random.Random(index)
+    groups = Group_List(args.groups)
+    mix = Parse_Mix(args.mix)
+    kinds = list(mix)
+    weights = [mix[TEMP0] for TEMP0 in kinds]
+    interval = args.connections / args.rate
+    conn = http.client.HTTPConnection('127.0.0.1', args.event_port, timeout=10)
+    next_time = time.perf_counter()
+    message_id = index * 100000000
+    while True:
+        now = time.perf_counter()
+        if now >= stop_time:
+            break
+        if now < next_time:
+            time.sleep(next_time - now)
+        next_time += interval
+        kind = rng.choices(kinds, weights)[0]
+        message_id += 1
+        if kind == 'meta':
+            event = {'time': int(time.time()), 'post_type': 'meta_event', 'meta_event_type': 'heartbeat'}
+        elif kind == 'private':
+            event = {'time': int(time.time()), 'post_type': 'message', 'message_type': 'private', 'sub_type': 'friend',
+                     'user_id': rng.randint(10000, 99999), 'message_id': message_id, 'message': rng.choice(OK_MESSAGES),
+                     'raw_message': '', 'sender': {}}
+        else:
+            message = rng.choice(BAD_MESSAGES if kind in ('bad', 'other') else OK_MESSAGES)
+            event = {'time': int(time.time()), 'post_type': 'message', 'message_type': 'group', 'sub_type': 'normal',
+                     'group_id': rng.choice(groups) if kind != 'other' else 200000000 + rng.randint(0, 999), 'user_id': rng.randint(10000, 10000 + args.users), 'message_id': message_id,
+                     'message': message, 'raw_message': message, 'sender': {'role': 'member'}}
+        body = json.dumps(event, ensure_ascii=False).encode('utf-8')
+        try:
+            send_time = time.perf_counter()
+            conn.request('POST', '/', body=body, headers={'Content-Type': 'application/json'})
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', args.event_port, timeout=10)
+            with lock:
+                sent['error'] += 1
+            continue
+        with lock:
+            sent[kind] += 1
+            if kind == 'bad':
+                sent['bad_time'][message_id] = send_time
+
+
+def Parse_Mix(text: str) -> dict:
+    '解析事件比例，如"bad=0.2,ok=0.6,private=0.1,meta=0.1" 返回：dict'
+    mix = {}
+    for TEMP0 in text.split(','):
+        TEMP1, TEMP2 = TEMP0.split('=')
+        mix[TEMP1.strip()] = float(TEMP2)
+    return mix
+
+
+def Percentile(values: list, p: float):
+    if values == []:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def Proc_Usage(pid: int):
+    '读取进程（Linux）的CPU时间（秒）和内存占用（MB），其他系统返回None 返回：(float, float) / None'
+    try:
+        with open('/proc/' + str(pid) + '/stat') as file:
+            TEMP0 = file.read().rsplit(')', 1)[1].split()
+        with open('/proc/' + str(pid) + '/status') as file:
+            rss = [TEMP1 for TEMP1 in file if TEMP1.startswith('VmRSS')][0].split()[1]
+        return (int(TEMP0[11]) + int(TEMP0[12])) / os.sysconf('SC_CLK_TCK'), int(rss) / 1024
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+def Children_Usage(pid: int):
+    '统计进程及其子进程（多进程模式的工作进程）的CPU时间和内存占用 返回：(float, float) / None'
+    pids = [pid]
+    try:
+        for TEMP0 in os.listdir('/proc'):
+            if TEMP0.isdigit():
+                with open('/proc/' + TEMP0 + '/stat') as file:
+                    if int(file.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(TEMP0))
+    except OSError:
+        pass
+    usage = [Proc_Usage(TEMP0) for TEMP0 in pids]
+    usage = [TEMP0 for TEMP0 in usage if TEMP0 is not None]
+    if usage == []:
+        return None
+    return sum(TEMP0[0] for TEMP0 in usage), sum(TEMP0[1] for TEMP0 in usage)
+
+
+def Scrape_Metrics(port: int):
+    '读取程序的运行指标（不含直方图分桶） 返回：list / None'
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        conn.request('GET', '/metrics')
+        text = conn.getresponse().read().decode('utf-8')
+    except (OSError, http.client.HTTPException):
+        return None
+    return [TEMP0 for TEMP0 in text.splitlines() if not TEMP0.startswith('#') and '_bucket' not in TEMP0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='QGMA端到端压力测试')
+    parser.add_argument('--rate', type=float, default=500, help='每秒上报的事件数')
+    parser.add_argument('--duration', type=float, default=20, help='上报持续的秒数')
+    parser.add_argument('--mix', default='bad=0.2,ok=0.6,private=0.1,meta=0.1', help='事件比例：bad(违规群消息)/ok(正常群消息)/other(不在管理范围内的群聊消息)/private(私聊)/meta(心跳)')
+    parser.add_argument('--engine', default='thread', choices=['thread', 'asyncio', 'process'], help='运行模式')
+    parser.add_argument('--shards', type=int, default=2, help='多进程模式的工作进程数')
+    parser.add_argument('--groups', type=int, default=5, help='管理的群聊数量')
+    parser.add_argument('--users', type=int, default=5000, help='发言成员数量')
+    parser.add_argument('--connections', type=int, default=4, help='上报使用的并发连接数')
+    parser.add_argument('--action-workers', type=int, default=8, help='出站操作工作线程数')
+    parser.add_argument('--debug-sample', type=int, default=100, help='事件调试日志采样间隔')
+    parser.add_argument('--api-port', type=int, default=15700, help='模拟API服务的端口')
+    parser.add_argument('--event-port', type=int, default=15701, help='程序接收上报的端口')
+    parser.add_argument('--metrics-port', type=int, default=0, help='启用运行指标的端口（0为不启用），结束前读取一次指标')
+    parser.add_argument('--capture', help='把上报的事件录制到此文件，可用replay.py重放')
+    parser.add_argument('--drain', type=float, default=5, help='停止上报后等待操作执行完的最长秒数')
+    parser.add_argument('--json', help='把结果另存为json文件')
+    args = parser.parse_args()
+
+    Fake_Api.members = json.dumps([{'user_id': TEMP0, 'role': 'member', 'join_time': 1600000000, 'title': ''}
+                                   for TEMP0 in range(10000, 10000 + args.users + 1)]).encode()
+    api_server = ThreadingHTTPServer(('127.0.0.1', args.api_port), Fake_Api)
+    api_server.daemon_threads = True
+    threading.Thread(target=api_server.serve_forever, daemon=True).start()
+
+    work_dir = tempfile.mkdtemp(prefix='qgma_bench_')
+    try:
+        main_py = Prepare_Tree(os.path.join(work_dir, 'qgma'), args)
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, main_py], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not Wait_Port(args.event_port):
+            print('程序启动失败')
+            process.kill()
+            return 1
+        startup = time.perf_counter() - start
+        usage_before = Children_Usage(process.pid)
+
+        sent = {'bad': 0, 'ok': 0, 'other': 0, 'private': 0, 'meta': 0, 'error': 0, 'bad_time': {}}
+        lock = threading.Lock()
+        begin = time.perf_counter()
+        stop_time = begin + args.duration
+        senders = [threading.Thread(target=Sender, args=(args, TEMP0, stop_time, sent, lock)) for TEMP0 in range(args.connections)]
+        for TEMP0 in senders:
+            TEMP0.start()
+        for TEMP0 in senders:
+            TEMP0.join()
+        send_end = time.perf_counter()
+
+        # 等待撤回全部完成（或超时）
+        deadline = send_end + args.drain
+        while time.perf_counter() < deadline:
+            with Fake_Api.lock:
+                done = sum(1 for TEMP0 in Fake_Api.calls if TEMP0[1] == 'delete_msg')
+            if done >= len(sent['bad_time']):
+                break
+            time.sleep(0.1)
+        end = time.perf_counter()
+        usage_after = Children_Usage(process.pid)
+        scraped = Scrape_Metrics(args.metrics_port) if args.metrics_port else None
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    finally:
+        api_server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with Fake_Api.lock:
+        calls = list(Fake_Api.calls)
+    counts = {}
+    for TEMP0 in calls:
+        counts[TEMP0[1]] = counts.get(TEMP0[1], 0) + 1
+    latency = []
+    for TEMP0 in calls:
+        if TEMP0[1] == 'delete_msg':
+            TEMP1 = sent['bad_time'].get(TEMP0[2].get('message_id'))
+            if TEMP1 is not None:
+                latency.append((TEMP0[0] - TEMP1) * 1000)
+    events = sum(sent[TEMP0] for TEMP0 in ('bad', 'ok', 'other', 'private', 'meta'))
+    last_delete = max([TEMP0[0] for TEMP0 in calls if TEMP0[1] == 'delete_msg'] or [send_end])
+    result = {
+        'engine': args.engine,
+        'startup_s': round(startup, 3),
+        'target_rate': args.rate,
+        'events_sent': events,
+        'send_errors': sent['error'],
+        'accept_rate': round(events / (send_end - begin), 1),  # 程序接收事件的速率
+        'bad_events': len(sent['bad_time']),
+        'deleted': len(latency),
+        'process_rate': round(events / (max(last_delete, send_end) - begin), 1),  # 全部处理完（撤回完成）的速率
+        'latency_p50_ms': None if latency == [] else round(Percentile(latency, 50), 1),
+        'latency_p99_ms': None if latency == [] else round(Percentile(latency, 99), 1),
+        'latency_max_ms': None if latency == [] else round(max(latency), 1),
+        'api_calls': counts,
+    }
+    if usage_before is not None and usage_after is not None:
+        result['cpu_s'] = round(usage_after[0] - usage_before[0], 2)
+        result['cpu_percent'] = round((usage_after[0] - usage_before[0]) / (end - begin) * 100, 1)
+        result['rss_mb'] = round(usage_after[1], 1)
+
+    if args.metrics_port:
+        result['metrics'] = scraped
+
+    print('----------------QGMA压力测试结果----------------')
+    for TEMP0, TEMP1 in result.items():
+        if TEMP0 == 'metrics':
+            print('metrics:\n  ' + '\n  '.join(TEMP1 or ['（读取失败）']))
+        else:
+            print(TEMP0 + ':', TEMP1)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    return 0 if len(latency) == len(sent['bad_time']) else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
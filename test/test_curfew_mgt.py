@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA宵禁调度测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.curfew_mgt import Curfew_Mgt
+
+
+def Local(hour: int, minute: int, day: int = 1) -> int:
+    '本地时间2024年1月day日hour:minute的时间戳 返回：int'
+    return int(datetime(2024, 1, day, hour, minute).timestamp())
+
+
+class Test_Curfew_Time(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(Curfew_Mgt.Curfew_Time(['2430', '0600']), ['0030', '0600'])
+        self.assertEqual(Curfew_Mgt.Curfew_Time(['2300', '700']), ['2300', '0700'])
+        self.assertEqual(Curfew_Mgt.Curfew_Time(['2400', '2400']), ['0000', '0000'])
+        self.assertEqual(Curfew_Mgt.Curfew_Time([]), [])
+
+    def test_windows(self):
+        TEMP0 = Curfew_Mgt.Windows(['2300', '0700'], {'2': ['2430', '0600'], '3': []}, ['1', '2', '3'])
+        self.assertEqual(TEMP0, {'1': ('2300', '0700'), '2': ('0030', '0600')})
+
+
+class Test_Schedule(unittest.TestCase):
+
+    def test_should_be(self):
+        window = tuple(Curfew_Mgt.Curfew_Time(['2430', '0600']))
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(0, 45)), 1)
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(0, 29)), 0)
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(6, 1)), 0)
+        window = ('2300', '0700')  # 跨过午夜
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(23, 30)), 1)
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(3, 0)), 1)
+        self.assertEqual(Curfew_Mgt.Should_Be(window, Local(12, 0)), 0)
+
+    def test_next_change(self):
+        window = tuple(Curfew_Mgt.Curfew_Time(['2430', '0600']))
+        self.assertEqual(Curfew_Mgt.Next_Change(window, Local(23, 0)), Local(0, 30, 2))
+        self.assertEqual(Curfew_Mgt.Next_Change(window, Local(0, 45)), Local(6, 1))
+        self.assertEqual(Curfew_Mgt.Next_Change(window, Local(6, 1)), Local(0, 30, 2))
+
+    def test_pop_due(self):
+        curfew = Curfew_Mgt()
+        curfew.Set_Windows(Curfew_Mgt.Windows(['2430', '0600'], {}, ['1']), Local(23, 0))
+        self.assertEqual(curfew.Pop_Due(Local(23, 0)), [])
+        changes = []
+        while curfew.Next_Deadline() < Local(12, 0, 2):  # 按调度的时间前进，记录所有状态变化
+            now = curfew.Next_Deadline()
+            changes += [(now, TEMP0, TEMP1) for TEMP0, TEMP1 in curfew.Pop_Due(now)]
+        self.assertEqual(changes, [(Local(0, 30, 2), '1', 1), (Local(6, 1, 2), '1', 0)])
+
+    def test_removed_window(self):
+        curfew = Curfew_Mgt()
+        curfew.Set_Windows({'1': ('2300', '0700')}, Local(23, 30))
+        self.assertEqual(curfew.Pop_Due(Local(23, 30)), [('1', 1)])
+        curfew.Set_Windows({}, Local(23, 40))  # 取消宵禁后解除全体禁言
+        self.assertEqual(curfew.Pop_Due(Local(23, 40)), [('1', 0)])
+        self.assertIsNone(curfew.Next_Deadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
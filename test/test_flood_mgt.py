@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA刷屏检测测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.flood_mgt import Flood_Mgt, Flood_Window
+
+
+class Test_Flood_Window(unittest.TestCase):
+
+    def test_limit(self):
+        window = Flood_Window(10, 5)
+        self.assertEqual([window.Hit(1, 2, 1000) for TEMP0 in range(12)], [0] * 10 + [1, 0])  # 一个时间窗口内只记1次
+
+    def test_sliding(self):
+        window = Flood_Window(10, 5)
+        self.assertEqual(sum(window.Hit(1, 2, 1000 + TEMP0 // 2) for TEMP0 in range(100)), 0)  # 每秒2条，不超过限制
+        self.assertEqual(sum(window.Hit(1, 3, 2000 + TEMP0 // 4) for TEMP0 in range(100)), 5)  # 持续刷屏25秒，每个窗口记1次
+
+    def test_members_apart(self):
+        window = Flood_Window(10, 5)
+        self.assertEqual(sum(window.Hit(1, 2 + TEMP0 % 50, 1000) for TEMP0 in range(500)), 0)
+        self.assertEqual(sum(window.Hit(2 + TEMP0 % 50, 2, 1000) for TEMP0 in range(500)), 0)
+
+
+class Test_Flood_Mgt(unittest.TestCase):
+
+    def test_rules(self):
+        flood = Flood_Mgt([(10, 5), (30, 60)])
+        self.assertEqual([flood.Hit(1, 2, 1000) for TEMP0 in range(11)][-1], 1)  # 多个规则同时触发也只记1次
+        flood = Flood_Mgt([(10, 5), (30, 60)])
+        self.assertEqual(sum(flood.Hit(1, 2, 1000 + TEMP0 // 2) for TEMP0 in range(31)), 1)  # 只触发60秒30条
+        self.assertEqual(Flood_Mgt([]).Hit(1, 2, 1000), 0)
+
+    def test_memory(self):
+        flood = Flood_Mgt([(10, 5)])
+        TEMP0 = flood.Memory()
+        for TEMP1 in range(10000):
+            flood.Hit(1, TEMP1, 1000 + TEMP1 // 100)
+        self.assertEqual(flood.Memory(), TEMP0)
+
+
+if __name__ == '__main__':
+    unittest.main()
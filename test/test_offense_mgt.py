@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA犯错记录测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.offense_mgt import Offense_Ledger
+
+
+class Test_Offense_Ledger(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = Offense_Ledger(160, 16)  # 统计最近160秒，每个桶10秒
+
+    def test_count_in_window(self):
+        self.assertEqual([self.ledger.Add(1, 2, 1000).num for TEMP0 in range(3)], [1, 2, 3])
+        self.assertEqual(self.ledger.Add(1, 2, 1050, 2).num, 5)
+        self.assertEqual(self.ledger.Add(1, 3, 1050).num, 1)  # 不同成员分开统计
+        self.assertEqual(self.ledger.Add(2, 2, 1050).num, 1)  # 不同群聊分开统计
+        self.assertEqual(len(self.ledger), 3)
+
+    def test_slide_out(self):
+        self.ledger.Add(1, 2, 1000, 3)
+        self.ledger.Add(1, 2, 1100)
+        self.assertEqual(self.ledger.Add(1, 2, 1165).num, 2)  # 1000秒的3次已滑出统计周期
+        record = self.ledger.Add(1, 2, 1165)
+        record.gag_num = 2
+        self.assertEqual(self.ledger.Add(1, 2, 2000).num, 1)  # 整个周期没有犯错，全部重新计算
+        self.assertEqual(record.gag_num, 0)
+
+    def test_expire(self):
+        self.ledger.Add(1, 2, 1000)
+        self.ledger.Add(1, 3, 1040)
+        self.ledger.Add(1, 2, 1050)  # 按最后犯错时间清理
+        self.assertEqual(self.ledger.Expire(1200), [])
+        self.assertEqual(self.ledger.Expire(1210), [(1, 3)])
+        self.assertEqual(self.ledger.Expire(1220), [(1, 2)])
+        self.assertEqual(len(self.ledger), 0)
+
+    def test_export_import(self):
+        self.ledger.Add(1, 2, 1000, 2)
+        self.ledger.Add(1, 2, 1100).gag_num = 1
+        row = self.ledger.Export(1, 2)
+        ledger = Offense_Ledger(160, 16)
+        ledger.Import(row)
+        self.assertEqual(ledger.Export(1, 2), row)
+        self.assertEqual(ledger.Add(1, 2, 1170).num, 2)  # 导入后继续滑动
+        ledger = Offense_Ledger(160, 8)  # 分桶数不同时保留犯错次数
+        ledger.Import(row)
+        self.assertEqual(ledger.Add(1, 2, 1110).num, 4)
+        self.assertEqual(ledger.records[(1, 2)].gag_num, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA接口限速及出站操作合并测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.rate_limit import Rate_Limit, Coalescer
+
+
+# 与chat_mgt中的操作同名（合并器按函数名区分操作），不调用API
+def send_tips(group_id, user_ids, tips): pass
+def group_ban(group_id, user_id, duration=1): pass
+def group_kick(group_id, user_id, reject_add_request='false'): pass
+def del_msg(msg_id, self_id=None): pass
+
+
+class Test_Rate_Limit(unittest.TestCase):
+
+    def test_no_wait(self):
+        rate_limit = Rate_Limit({'set_group_ban': (0, 1), 'group': (1, 2)})
+        self.assertEqual(rate_limit.Acquire('set_group_ban', 1, block=False), 0)
+        self.assertEqual(rate_limit.Acquire('set_group_ban', 1, block=False), 0)
+        TEMP0 = rate_limit.Acquire('set_group_ban', 1, block=False)  # 令牌不足，返回需要等待的时间
+        self.assertGreater(TEMP0, 0.9)
+        self.assertGreater(rate_limit.Acquire('set_group_ban', 1, block=False), 0.9)  # 不等待时不取令牌，不会越等越久
+        self.assertEqual(rate_limit.Acquire('set_group_ban', 2, block=False), 0)  # 其他群聊不受影响
+
+    def test_api_bucket(self):
+        rate_limit = Rate_Limit({'send_private_msg': (1, 1)})
+        self.assertEqual(rate_limit.Acquire('send_private_msg', block=False), 0)
+        self.assertGreater(rate_limit.Acquire('send_private_msg', block=False), 0.9)
+        self.assertEqual(rate_limit.Acquire('unknown_api', block=False), 0)  # 未设置的API不限速
+
+
+class Test_Coalescer(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = Coalescer(tips_window=2, max_tips=2)
+
+    def test_tips(self):
+        first = [1, [10], ['请勿发广告']]
+        self.assertFalse(self.coalescer.Merge(send_tips, first))
+        self.assertTrue(self.coalescer.Merge(send_tips, [1, [11, 10], ['请勿发广告', '请勿刷屏']]))
+        self.assertTrue(self.coalescer.Merge(send_tips, [1, [12], ['请文明发言']]))
+        self.assertEqual(first, [1, [10, 11, 12], ['请勿发广告', '请勿刷屏']])  # 提醒内容最多保留max_tips条
+        self.assertFalse(self.coalescer.Merge(send_tips, [2, [10], ['请勿发广告']]))  # 不同群聊不合并
+
+    def test_ban_and_kick(self):
+        first = [1, 10, 5]
+        self.assertFalse(self.coalescer.Merge(group_ban, first))
+        self.assertTrue(self.coalescer.Merge(group_ban, [1, 10, 30]))
+        self.assertTrue(self.coalescer.Merge(group_ban, [1, 10, 10]))
+        self.assertEqual(first, [1, 10, 30])  # 重复禁言取最长的时间
+        self.assertFalse(self.coalescer.Merge(group_ban, [1, 11, 5]))
+        self.assertFalse(self.coalescer.Merge(group_kick, [1, 10]))
+        self.assertTrue(self.coalescer.Merge(group_kick, [1, 10]))
+        self.assertFalse(self.coalescer.Merge(del_msg, [100]))
+        self.assertFalse(self.coalescer.Merge(del_msg, [100]))  # 撤回不合并
+
+    def test_done(self):
+        first = [1, 10, 5]
+        self.coalescer.Merge(group_ban, first)
+        self.coalescer.Done(group_ban, [1, 10, 5])  # 不是队列中的那个操作，不影响
+        self.assertTrue(self.coalescer.Merge(group_ban, [1, 10, 5]))
+        self.coalescer.Done(group_ban, first)
+        self.assertFalse(self.coalescer.Merge(group_ban, [1, 10, 5]))  # 已开始执行，之后的不再合并
+
+    def test_delay(self):
+        self.assertEqual(self.coalescer.Delay(send_tips), 2)
+        self.assertEqual(self.coalescer.Delay(group_ban), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA异常聊天报告测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.report_mgt
+from core.report_mgt import Report_Mgt, send_report
+
+
+class Test_Build_Digest(unittest.TestCase):
+
+    def test_order(self):
+        report_list = [{'group_id': 1, 'user_id': 10, 'num': 1, 'time': 1700000000, 'message': '广告'},
+                       {'group_id': 2, 'user_id': 20, 'num': 3, 'time': 1700000000, 'message': '脏话\n第二行'},
+                       {'group_id': 2, 'user_id': 21, 'num': 5, 'time': 1700000000, 'message': 'x' * 80}]
+        pages = Report_Mgt.Build_Digest(report_list)
+        self.assertEqual(len(pages), 1)
+        self.assertIn('共 2 个群聊，3 位用户，9 次异常', pages[0])
+        self.assertLess(pages[0].index('群聊：2'), pages[0].index('群聊：1'))  # 犯错次数多的群聊在前
+        self.assertLess(pages[0].index('· 21'), pages[0].index('· 20'))
+        self.assertIn('脏话 第二行', pages[0])
+        self.assertIn('x' * 50 + '…', pages[0])
+
+    def test_pages(self):
+        report_list = [{'group_id': 1, 'user_id': TEMP0, 'num': 1, 'time': 1700000000, 'message': 'x' * 50} for TEMP0 in range(100)]
+        pages = Report_Mgt.Build_Digest(report_list, page_size=500)
+        self.assertGreater(len(pages), 1)
+        self.assertTrue(pages[-1].endswith('（' + str(len(pages)) + '/' + str(len(pages)) + '）'))
+        self.assertEqual(sum(TEMP0.count('· ') for TEMP0 in pages), 100)  # 单行不会被拆开
+
+
+class Test_Send_Report(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.result = {'status': 'ok', 'retcode': 0, 'data': None}
+        self.send_msg_private = core.report_mgt.send_msg_private
+        core.report_mgt.send_msg_private = lambda user_id, msg: self.sent.append((user_id, msg)) or self.result
+
+    def tearDown(self):
+        core.report_mgt.send_msg_private = self.send_msg_private
+
+    def test_one_page_per_call(self):
+        result = send_report(1, ['p1', 'p2', 'p3'], 2)
+        self.assertEqual(self.sent, [(1, 'p1')])
+        self.assertEqual((result['wait'], result['next']), (2, [1, ['p2', 'p3'], 2]))  # 剩下的页由出站操作队列延后发送
+        result = send_report(*result['next'])
+        result = send_report(*result['next'])
+        self.assertEqual(self.sent, [(1, 'p1'), (1, 'p2'), (1, 'p3')])
+        self.assertIsNone(result.get('next'))
+
+    def test_failed(self):
+        self.result = {'status': 'failed', 'retcode': -1}
+        self.assertIsNone(send_report(1, ['p1', 'p2']).get('next'))  # 失败时由队列按原参数重试
+        self.assertEqual(send_report(1, []), {'status': 'ok', 'retcode': 0, 'data': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# QGMA文本归一化及关键词匹配测试
+# 用法（在项目根目录运行）：python -m pytest test 或 python -m unittest discover test
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.text_normalize import Text_Normalize
+from core.word_match import Word_Match
+
+
+class Test_Normalize(unittest.TestCase):
+
+    def test_obfuscated(self):
+        for TEMP0 in ['Ｓ Ｂ', 's.b', 's b', 'ѕb', 's​b', 'ⓢⓑ', 'S-B']:
+            self.assertEqual(Text_Normalize.Normalize(TEMP0), 'sb', TEMP0)
+        self.assertEqual(Text_Normalize.Normalize('加 Ｑ 群'), '加q群')
+        self.assertEqual(Text_Normalize.Normalize('傻，逼'), '傻逼')
+
+    def test_english_words_kept_apart(self):
+        self.assertEqual(Text_Normalize.Normalize('this book is nice'), 'this book is nice')
+        self.assertEqual(Text_Normalize.Normalize('yes, but'), 'yes but')
+        self.assertEqual(Text_Normalize.Normalize('What is b?'), 'what is b')
+        self.assertEqual(Text_Normalize.Normalize('you are s b'), 'you are sb')
+
+    def test_original(self):
+        for TEMP0, TEMP1 in [('你好Ｓ.Ｂ啊', 'Ｓ.Ｂ'), ('yes, but', 'yes, but'), ('加 Ｑ 群吧', '加 Ｑ 群')]:
+            TEMP2 = Text_Normalize.Normalize(TEMP1)
+            self.assertEqual(Text_Normalize.Original(TEMP0, TEMP2), TEMP1)
+            self.assertEqual(len(Text_Normalize.Offsets(TEMP0)), len(Text_Normalize.Normalize(TEMP0)))
+
+
+class Test_Word_Match(unittest.TestCase):
+
+    def setUp(self):
+        self.word_match = Word_Match({'bad': ['sb', '傻逼', 'nmsl'], 'ads': ['q群', '加qq群', '群']}, Text_Normalize.Normalize, ['usb', 'jobs'])
+
+    def Match(self, text: str) -> dict:
+        return self.word_match.Match(Text_Normalize.Normalize(text))
+
+    def test_hits(self):
+        self.assertEqual(self.Match('快来加qq群，sb才不来，傻逼'), {'bad': ['sb', '傻逼'], 'ads': ['加qq群', 'q群', '群']})
+        for TEMP0 in ['你是sb', 's b', 's.b', 'Ｓ Ｂ', 'ѕb', 'sb!', 'sb666', 'you are s b']:
+            self.assertEqual(self.Match(TEMP0)['bad'], ['sb'], TEMP0)
+
+    def test_repeated(self):
+        for TEMP0 in ['sbsb', 'sb123abc', 'absb', 'usbsb', 'sbusb']:
+            self.assertEqual(self.Match(TEMP0)['bad'], ['sb'], TEMP0)
+        self.assertEqual(self.Match('nmslnmsl')['bad'], ['nmsl'])
+
+    def test_allow_word(self):
+        for TEMP0 in ['USB', 'usb2.0', 'jobs board', 'usb usb']:
+            self.assertEqual(self.Match(TEMP0)['bad'], [], TEMP0)
+
+    def test_empty(self):
+        self.assertEqual(Word_Match({'bad': [], 'ads': []}).Match('sb'), {'bad': [], 'ads': []})
+
+
+if __name__ == '__main__':
+    unittest.main()